@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+
+"""Compare database throughput without and with the sqlite performance profile.
+
+Call:
+
+    ./benchmark_database.py 5
+
+to run each read/write mix for 5 seconds. Concurrent workers read tokens and save notification configurations in
+a temporary database, once with a default async engine and once with the engine of the backend which sets the
+pragmas of the performance profile and pools connections.
+
+Make sure your PYTHONPATH environment variable is set to the awattprice package directory.
+"""
+
+import asyncio
+import random
+import sys
+import tempfile
+import time
+
+from pathlib import Path
+
+from sqlalchemy import create_engine
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from awattprice import database
+from awattprice import notifications
+from awattprice import orm
+from awattprice.defaults import Region
+from awattprice.orm import Token
+
+__author__ = "Léon Becker (sp4c38) <lb@space8.me>"
+
+WORKERS = 16
+TOKENS = 10000
+WRITE_RATIOS = [0.1, 0.5, 0.9]
+
+
+async def run_worker(engine, write_ratio: float, stop_time: float) -> tuple[int, int]:
+    """Read and write in a loop until the stop time.
+
+    :returns: Number of finished and failed operations.
+    """
+    token_upsert, price_below_upsert = notifications.get_configuration_upserts(engine.dialect.name)
+    operations = 0
+    failures = 0
+    while time.monotonic() < stop_time:
+        token_hex = f"token-{random.randrange(TOKENS)}"
+        try:
+            if random.random() < write_ratio:
+                parameters = notifications.get_configuration_parameters(
+                    token_hex, Region.DE, False, True, random.randrange(-10, 30)
+                )
+                async with engine.begin() as connection:
+                    await connection.execute(token_upsert, parameters)
+                    await connection.execute(price_below_upsert, parameters)
+            else:
+                async with engine.connect() as connection:
+                    await connection.execute(select(Token).where(Token.token == token_hex))
+        except Exception:
+            failures += 1
+        operations += 1
+
+    return operations, failures
+
+
+async def measure(engine, write_ratio: float, duration: float) -> str:
+    """Measure the throughput of concurrent workers with a read/write mix."""
+    stop_time = time.monotonic() + duration
+    results = await asyncio.gather(*[run_worker(engine, write_ratio, stop_time) for _ in range(WORKERS)])
+    operations = sum(result[0] for result in results)
+    failures = sum(result[1] for result in results)
+    return f"{operations / duration:8.0f} operations/s, {failures} failed"
+
+
+async def main():
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+    for write_ratio in WRITE_RATIOS:
+        for profile in ["default", "profile"]:
+            with tempfile.TemporaryDirectory() as temp_dir:
+                database_file = Path(temp_dir) / "benchmark.sqlite3"
+                orm.metadata.create_all(create_engine(f"sqlite+pysqlite:///{database_file}", future=True))
+
+                if profile == "default":
+                    engine = create_async_engine(f"sqlite+aiosqlite:///{database_file}", future=True)
+                else:
+                    engine = database.get_engine(database_file, async_=True)
+
+                result = await measure(engine, write_ratio, duration)
+                await engine.dispose()
+            print(f"{write_ratio:.0%} writes, {profile:>7}: {result}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+
+"""Compare the time needed to encode price data responses.
+
+Call:
+
+    ./benchmark_price_response.py 8760
+
+to encode a year of hourly price points. The paths compared are:
+
+- box: Parse to a box and encode it like fastapi does for returned content.
+- json: Parse to a box and encode it with the json module.
+- fast: Encode the price series directly, with orjson if it is installed.
+
+Make sure your PYTHONPATH environment variable is set to the awattprice package directory.
+"""
+
+import sys
+import timeit
+
+import numpy as np
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from awattprice import prices
+from awattprice import responses
+from awattprice.defaults import Region
+from awattprice.price_series import PriceSeries
+
+__author__ = "Léon Becker (sp4c38) <lb@space8.me>"
+
+
+def get_price_data(price_points: int) -> PriceSeries:
+    """Get price data with hourly price points of random marketprices."""
+    random = np.random.default_rng(0)
+    start_timestamps = 1609455600 + np.arange(price_points, dtype=np.int64) * 3600
+    marketprices = random.integers(-50 * 10**6, 300 * 10**6, price_points, dtype=np.int64)
+    marketprices = marketprices // 10**4 * 10**4
+    price_data = PriceSeries(start_timestamps, start_timestamps + 3600, marketprices, 6, Region.DE)
+    return price_data
+
+
+def main():
+    price_points = int(sys.argv[1]) if len(sys.argv) > 1 else 48
+    price_data = get_price_data(price_points)
+
+    paths = {
+        "box": lambda: JSONResponse(jsonable_encoder(prices.parse_to_response_data(price_data))).body,
+        "json": lambda: responses.encode_json(prices.parse_to_response_data(price_data)),
+        "fast": lambda: prices.encode_response_data(price_data),
+    }
+
+    bodies = {name: encode() for name, encode in paths.items()}
+    if len(set(bodies.values())) != 1:
+        print("Encoded bodies differ between the paths.")
+        return
+
+    orjson_state = "installed" if responses.orjson is not None else "not installed"
+    print(f"Encoding {price_points} price points ({len(bodies['fast'])} bytes), orjson is {orjson_state}.")
+    for name, encode in paths.items():
+        number, total_time = timeit.Timer(encode).autorange()
+        print(f"{name:>5}: {total_time / number * 1000:.3f} ms per response")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+"""Convert price data pickled by previous backend versions to the current price data file format.
+
+Make sure your PYTHONPATH environment variable is set to the awattprice package directory.
+"""
+import asyncio
+
+from loguru import logger
+
+from awattprice import configurator
+from awattprice import prices
+from awattprice.defaults import Region
+
+
+async def main():
+    config = configurator.get_config()
+
+    for region in Region:
+        converted = await prices.convert_pickled_data(region, config)
+        if converted:
+            logger.info(f"Converted pickled {region.name} price data.")
+        else:
+            logger.info(f"No pickled {region.name} price data to convert.")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,36 +1,27 @@
-"""Create a base database which is ready for beeing used by the backend.
+"""Create a database which is ready for beeing used by the backend or migrate an existing one to the newest schema.
+
+Migrating is safe while the backend is running.
 
 Make sure your PYTHONPATH environment variable is set to the awattprice package directory.
 """
-import sys
-
 from loguru import logger
 
 from awattprice import configurator
 from awattprice import database
 from awattprice import defaults
-from awattprice import orm
+from awattprice import migrations
 
 config = configurator.get_config()
 
-cli_params = sys.argv
-force_create = False
-if len(cli_params) == 2:
-    if cli_params[1] == "--force":
-        force_create = True
-
 db_path = config.paths.data_dir / defaults.DATABASE_FILE_NAME
-if not force_create:
-    if db_path.exists():
-        logger.info(f"There is already an existing database at {db_path}.")
-        sys.exit(0)
-
-logger.info("Creating database file.")
-db_engine = database.get_engine(config)
-orm.metadata.bind = db_engine
+if db_path.exists():
+    logger.info(f"Migrating existing database at {db_path}.")
+else:
+    logger.info("Creating database file.")
+    db_path.touch()
 
-table_names = orm.metadata.tables.keys()
-logger.info(f"Tables going to be created for new database: {', '.join(table_names)}.")
-orm.metadata.create_all(bind=db_engine, checkfirst=True)
+db_engine = database.get_awattprice_engine(config)
+with db_engine.connect() as connection:
+    schema_version = migrations.migrate_database(connection)
 
-logger.info(f"Done. You can find the database at {db_path}.")
+logger.info(f"Done. The database at {db_path} has schema version {schema_version}.")
@@ -1,8 +1,21 @@
+from . import cheapest
 from . import configurator
 from . import database
 from . import defaults
 from . import exceptions
+from . import migrations
 from . import notifications
 from . import orm
+from . import price_archive
+from . import price_export
+from . import price_runs
+from . import price_series
+from . import price_store
 from . import prices
+from . import responses
+from . import scheduler
+from . import shared_price_data
+from . import snapshots
+from . import stats
 from . import utils
+from . import validation
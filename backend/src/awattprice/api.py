@@ -1,7 +1,10 @@
 """Define the urls and their tasks handled by the API."""
+import asyncio
 import sys
 
+from decimal import Decimal
 from json import JSONDecodeError
+from typing import Optional
 
 import arrow
 
@@ -10,15 +13,27 @@ from fastapi import FastAPI
 from fastapi import HTTPException
 from fastapi import Request
 from loguru import logger
+from starlette.concurrency import run_in_threadpool
 from starlette.responses import RedirectResponse
+from starlette.responses import StreamingResponse
 
+from awattprice import cheapest
 from awattprice import configurator
 from awattprice import database
 from awattprice import defaults
+from awattprice import migrations
 from awattprice import notifications
 from awattprice import orm
+from awattprice import price_archive
+from awattprice import price_export
+from awattprice import price_runs
 from awattprice import prices
+from awattprice import responses
+from awattprice import scheduler
+from awattprice import stats
+from awattprice import utils
 from awattprice.defaults import Region
+from awattprice.snapshots import Snapshot
 
 config = configurator.get_config()
 configurator.configure_loguru(defaults.AWATTPRICE_SERVICE_NAME, config)
@@ -31,21 +46,280 @@ except FileNotFoundError as exc:
 orm.metadata.bind = database_engine
 
 app = FastAPI()
+price_refresh_scheduler = scheduler.PriceRefreshScheduler(config)
+# Combined price data responses of multiple regions by the snapshot versions they were combined from.
+regions_responses = utils.LimitedCache(defaults.REGIONS_RESPONSE_CACHE_SIZE)
+# Notification configurations of single requests which are saved together in batches.
+notification_configuration_saves = utils.WriteBehindQueue(
+    lambda configurations: notifications.save_notification_configurations(database_engine, configurations),
+    defaults.NOTIFICATION_SAVE_MAX_DELAY,
+    defaults.NOTIFICATION_SAVE_MAX_BATCH_SIZE,
+)
+
+
+@app.on_event("startup")
+async def prepare_database():
+    """Migrate the database schema and log which of the configured database pragmas are actually in effect."""
+    async with database_engine.connect() as connection:
+        await connection.run_sync(migrations.migrate_database)
+    async with database_engine.connect() as connection:
+        await connection.run_sync(database.log_pragmas, config.database_pragmas)
+
+
+@app.on_event("startup")
+async def start_price_refresh_scheduler():
+    """Keep the price data up to date in the background so that requests only serve local data."""
+    price_refresh_scheduler.start()
+
+
+@app.on_event("shutdown")
+async def stop_price_refresh_scheduler():
+    await price_refresh_scheduler.stop()
+
+
+@app.on_event("shutdown")
+async def flush_notification_configuration_saves():
+    """Save the queued notification configurations before exiting."""
+    await notification_configuration_saves.close()
 
 
 @logger.catch
-@app.get("/data/{region}")
-async def get_region_data(region: Region):
-    """Get current price data for specified region."""
-    price_data = await prices.get_current_prices(region, config, fall_back=True)
+@app.get("/data/{region}", response_class=responses.PreparedJSONResponse)
+async def get_region_data(
+    region: Region, request: Request, start: Optional[int] = None, end: Optional[int] = None
+):
+    """Get current price data for specified region.
+
+    The response is encoded only once per price data snapshot. Clients which send the entity tag of the
+    current response in If-None-Match get a bodyless 304 response.
+
+    If start and end are given as epoch seconds, the archived price points starting within this time range are
+    returned instead of the current price data.
+    """
+    if start is not None or end is not None:
+        return await get_region_archived_data(region, request, start, end)
 
-    if price_data is None:
+    snapshot = await prices.get_current_snapshot(region, config, fall_back=True)
+
+    if snapshot is None:
         logger.warning(f"Couldn't get current price data for region {region.name}.")
         raise HTTPException(503)
 
-    response_price_data = prices.parse_to_response_data(price_data)
+    prepared_response = get_prepared_price_data(snapshot)
+    cache_control = get_price_data_cache_control(request, [snapshot])
+
+    return responses.send_prepared_response(request, prepared_response, cache_control)
+
+
+def get_prepared_price_data(snapshot: Snapshot) -> responses.PreparedResponse:
+    """Get the price data response of a snapshot which is encoded only once per snapshot."""
+    return prices.get_snapshot_response(snapshot)
+
+
+def get_price_data_cache_control(
+    request: Request, snapshots: list[Snapshot], not_after: Optional[arrow.Arrow] = None
+) -> str:
+    """Get the Cache-Control header value of a response derived from price data snapshots.
+
+    The response may be reused until the first of the snapshots is due for an update, but at least until the
+    next poll for new price data. A jitter which is different for each client is added, so that not all clients
+    revalidate at the same time.
+
+    :param not_after: Time after which the response must not be reused even if the snapshots are still fresh.
+    """
+    now = arrow.utcnow()
+    expiry_times = [prices.get_next_update_time(snapshot.data) for snapshot in snapshots]
+    expiry_times.append(not_after)
+    max_age = min(
+        [int((expiry_time - now).total_seconds()) for expiry_time in expiry_times if expiry_time is not None],
+        default=0,
+    )
+    max_age = max(max_age, defaults.PRICE_DATA_POLL_INTERVAL_DUE)
+
+    max_jitter = min(
+        defaults.PRICE_DATA_CACHE_MAX_JITTER, int(max_age * defaults.PRICE_DATA_CACHE_MAX_JITTER_FRACTION)
+    )
+    max_age += responses.get_client_jitter(request, max_jitter)
+
+    cache_control = responses.get_cache_control(max_age, defaults.PRICE_DATA_CACHE_STALE_WHILE_REVALIDATE)
+    return cache_control
+
+
+def get_time_range(start: int, end: int) -> tuple[arrow.Arrow, arrow.Arrow]:
+    """Get the times of a time range given as epoch seconds.
+
+    :raises HTTPException: With status 400 if a timestamp is out of the supported range.
+    """
+    try:
+        start_time, end_time = arrow.get(start), arrow.get(end)
+    except (ValueError, OverflowError, OSError) as exc:
+        raise HTTPException(400, f"Invalid time range: {exc}.")
+    # Arrow takes very large timestamps as milliseconds or microseconds instead of failing.
+    if start_time.int_timestamp != start or end_time.int_timestamp != end:
+        raise HTTPException(400, "Time range is out of the supported range.")
+    return start_time, end_time
 
-    return response_price_data
+
+async def get_region_archived_data(region: Region, request: Request, start: Optional[int], end: Optional[int]):
+    """Get the archived price data of a region which starts within a time range."""
+    if start is None or end is None:
+        raise HTTPException(400, "Both start and end must be given.")
+    if not start < end:
+        raise HTTPException(400, "Start must be before end.")
+    if end - start > defaults.PRICE_ARCHIVE_MAX_QUERY_RANGE:
+        raise HTTPException(400, f"Time range must not exceed {defaults.PRICE_ARCHIVE_MAX_QUERY_RANGE} seconds.")
+
+    start_time, end_time = get_time_range(start, end)
+
+    query_archive = utils.async_wrap(price_archive.query_prices)
+    try:
+        archived_data = await query_archive(region, config, start_time, end_time)
+    except Exception as exc:
+        logger.exception(f"Couldn't query archived {region.name} price data: {exc}.")
+        raise HTTPException(500)
+
+    # The body is compressed for this request only, so a fast compression level is used.
+    prepared_response = prices.prepare_response_data(archived_data, defaults.RESPONSE_REQUEST_COMPRESSION_LEVELS)
+    return await responses.send_request_response(request, prepared_response)
+
+
+@logger.catch
+@app.get("/data/{region}/stats", response_class=responses.PreparedJSONResponse)
+async def get_region_statistics(region: Region, request: Request):
+    """Get statistics of the price data of today and tomorrow for specified region.
+
+    The statistics are computed only once per price data snapshot and day.
+    """
+    snapshot = await prices.get_current_snapshot(region, config, fall_back=True)
+
+    if snapshot is None:
+        logger.warning(f"Couldn't get current price data for region {region.name}.")
+        raise HTTPException(503)
+
+    today = arrow.now(defaults.EUROPE_BERLIN_TIMEZONE).floor("day")
+    prepared_response = snapshot.memoize(
+        ("statistics", today.int_timestamp),
+        lambda: responses.prepare_json_response(stats.get_daily_statistics(snapshot.data, today)),
+    )
+    await responses.compress_prepared_response(prepared_response)
+    # Today's statistics change at midnight.
+    cache_control = get_price_data_cache_control(request, [snapshot], not_after=today.shift(days=+1))
+
+    return responses.send_prepared_response(request, prepared_response, cache_control)
+
+
+@logger.catch
+@app.get("/data/{region}/below", response_class=responses.PreparedJSONResponse)
+async def get_region_runs_below(
+    region: Region, request: Request, value: float, taxed: bool = False, longest: bool = False
+):
+    """Get the runs of consecutive price points which are on or below a value for specified region.
+
+    :param value: Value in cent per kWh.
+    :param taxed: If set prices are taxed before comparing them to the value.
+    :param longest: If set only the longest run is returned.
+    """
+    snapshot = await prices.get_current_snapshot(region, config, fall_back=True)
+
+    if snapshot is None:
+        logger.warning(f"Couldn't get current price data for region {region.name}.")
+        raise HTTPException(503)
+
+    below_value = Decimal(str(value))
+
+    def find_runs_below() -> responses.PreparedResponse:
+        if longest:
+            longest_run = price_runs.find_longest_run_below(snapshot.data, below_value, taxed)
+            runs = [longest_run] if longest_run is not None else []
+        else:
+            runs = price_runs.find_runs_below(snapshot.data, below_value, taxed)
+        return responses.prepare_json_response({"runs": runs})
+
+    runs_below = snapshot.memoize("runs_below", lambda: utils.LimitedCache(defaults.PRICE_RUNS_CACHE_SIZE))
+    prepared_response = runs_below.get_or_compute((below_value, taxed, longest), find_runs_below)
+    await responses.compress_prepared_response(prepared_response)
+    cache_control = get_price_data_cache_control(request, [snapshot])
+
+    return responses.send_prepared_response(request, prepared_response, cache_control)
+
+
+@logger.catch
+@app.get("/data", response_class=responses.PreparedJSONResponse)
+async def get_regions_data(request: Request, regions: Optional[str] = None):
+    """Get current price data for multiple regions in one response.
+
+    The response is an object with the price data of each region by its name. Price data of regions which
+    currently have none is null. The response is combined from the prepared responses of each region and
+    reused for as long as none of their snapshots changes.
+
+    :param regions: Comma separated region names, for example "DE,AT". If not set this will redirect to the
+        price data of the default region.
+    """
+    if not regions:
+        return await get_default_region_data()
+
+    try:
+        requested_regions = [Region(name.strip().upper()) for name in regions.split(",")]
+    except ValueError as exc:
+        raise HTTPException(400, f"Unknown region: {exc}.")
+    requested_regions = list(dict.fromkeys(requested_regions))
+
+    snapshots = await asyncio.gather(
+        *[prices.get_current_snapshot(region, config, fall_back=True) for region in requested_regions]
+    )
+    regions_snapshots = dict(zip(requested_regions, snapshots))
+    if all(snapshot is None for snapshot in snapshots):
+        logger.warning(f"Couldn't get current price data for any of the regions {regions}.")
+        raise HTTPException(503)
+
+    versions = tuple(
+        (region, snapshot.version if snapshot is not None else None)
+        for region, snapshot in regions_snapshots.items()
+    )
+    prepared_response = regions_responses.get_or_compute(
+        versions,
+        lambda: responses.combine_json_responses(
+            {
+                region.value: get_prepared_price_data(snapshot) if snapshot is not None else None
+                for region, snapshot in regions_snapshots.items()
+            }
+        ),
+    )
+    await responses.compress_prepared_response(prepared_response)
+    existing_snapshots = [snapshot for snapshot in snapshots if snapshot is not None]
+    cache_control = get_price_data_cache_control(request, existing_snapshots)
+
+    return responses.send_prepared_response(request, prepared_response, cache_control)
+
+
+@logger.catch
+@app.get("/data/{region}/export")
+async def export_region_data(
+    region: Region, start: int, end: int, format: price_export.ExportFormat = price_export.ExportFormat.NDJSON
+):
+    """Export the archived price data of a region which starts within a time range.
+
+    The price points are streamed in chunks as newline delimited json or csv, so the response can be consumed
+    before all of it was read and memory usage doesn't grow with the size of the time range.
+
+    :param start, end: Time range as epoch seconds. The end is exclusive.
+    """
+    if not start < end:
+        raise HTTPException(400, "Start must be before end.")
+    start_time, end_time = get_time_range(start, end)
+
+    # Errors can only be sent with a proper status before the response started, so check the partitions first.
+    try:
+        records = await run_in_threadpool(price_archive.read_records, region, config, start_time, end_time)
+    except Exception as exc:
+        logger.exception(f"Couldn't read archived {region.name} price data: {exc}.")
+        raise HTTPException(500)
+    if not records:
+        raise HTTPException(404, "No archived price data within the time range.")
+
+    price_chunks = price_archive.iterate_price_chunks(records, region, defaults.PRICE_EXPORT_CHUNK_SIZE)
+    stream = price_export.stream_export(price_chunks, format)
+    return StreamingResponse(stream, media_type=format.media_type)
 
 
 @logger.catch
@@ -59,6 +333,73 @@ async def get_default_region_data():
     return RedirectResponse(url=f"/data/{region.value}")
 
 
+@logger.catch
+@app.get("/cheapest/{region}")
+async def get_cheapest_window(
+    region: Region,
+    request: Request,
+    duration: int,
+    energy: float,
+    not_before: Optional[int] = None,
+    deadline: Optional[int] = None,
+):
+    """Get the cheapest window to consume energy evenly over a duration for specified region.
+
+    :param duration: Length of the window in minutes.
+    :param energy: Energy to consume in kWh.
+    :param not_before: Epoch seconds before which the window must not start. Defaults to now.
+    :param deadline: Epoch seconds after which the window must not end. Defaults to the end of the price data.
+    """
+    if duration <= 0:
+        raise HTTPException(400, "Duration must be positive.")
+    if not cheapest.check_energy(energy):
+        raise HTTPException(400, f"Energy must be positive and at most {defaults.CHEAPEST_WINDOW_MAX_ENERGY} kWh.")
+
+    snapshot = await prices.get_current_snapshot(region, config, fall_back=True)
+
+    if snapshot is None:
+        logger.warning(f"Couldn't get current price data for region {region.name}.")
+        raise HTTPException(503)
+
+    if not_before is None:
+        not_before = arrow.utcnow().int_timestamp
+    # Windows start at full minutes, so all times within the same minute share one cached response.
+    not_before = -(-not_before // cheapest.MINUTE) * cheapest.MINUTE
+    energy = Decimal(str(energy))
+
+    def find_cheapest_window() -> responses.PreparedResponse:
+        window = None
+        minute_prices = snapshot.memoize("minute_prices", lambda: cheapest.get_minute_prices(snapshot.data))
+        if minute_prices is not None:
+            window_deadline = deadline
+            if window_deadline is None:
+                window_deadline = minute_prices.start_timestamp + len(minute_prices) * cheapest.MINUTE
+            window = cheapest.find_cheapest_window(minute_prices, duration, energy, not_before, window_deadline)
+        return responses.prepare_json_response({"window": window})
+
+    cheapest_windows = snapshot.memoize(
+        "cheapest_windows", lambda: utils.LimitedCache(defaults.CHEAPEST_WINDOW_CACHE_SIZE)
+    )
+    prepared_response = cheapest_windows.get_or_compute(
+        (duration, energy, not_before, deadline), find_cheapest_window
+    )
+
+    return responses.send_prepared_response(request, prepared_response)
+
+
+@logger.catch
+@app.get("/monitoring/")
+async def get_monitoring_statistics():
+    """Get counters of the in-process caches, coalescing and write batching of this worker process."""
+    statistics = {
+        "price_data_cache": prices.get_cache_statistics(),
+        "price_refreshes": prices.get_refresh_statistics(),
+        "price_refresh_lock": prices.get_refresh_lock_statistics(),
+        "notification_configuration_saves": notification_configuration_saves.statistics(),
+    }
+    return statistics
+
+
 @logger.catch
 @app.post("/notifications/save_configuration/")
 async def handle_notification_configuration(request: Request):
@@ -76,4 +417,30 @@ async def handle_notification_configuration(request: Request):
     if configuration is None:
         raise HTTPException(400)
 
-    await notifications.save_notification_configuration(database_engine, configuration)
+    await notification_configuration_saves.put(configuration.token, configuration)
+
+
+@logger.catch
+@app.post("/notifications/save_configurations/")
+async def handle_notification_configurations(request: Request):
+    """Save the notification configurations of many tokens at once.
+
+    :returns: One result per sent configuration in the same order.
+    """
+    try:
+        body_json = await request.json()
+    except JSONDecodeError as exc:
+        body_raw = await request.body()
+        logger.warning(f"Couldn't decode notification configurations {repr(body_raw)} as json: {exc}.")
+        raise HTTPException(400)
+
+    configurations = notifications.parse_notification_configurations_body(body_json)
+    if configurations is None:
+        raise HTTPException(400)
+
+    valid_configurations = [configuration for configuration in configurations if configuration is not None]
+    if valid_configurations:
+        await notifications.save_notification_configurations(database_engine, valid_configurations)
+
+    results = [{"saved": configuration is not None} for configuration in configurations]
+    return {"results": results}
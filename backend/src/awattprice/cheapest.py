@@ -0,0 +1,136 @@
+"""Find the cheapest time window to consume a certain amount of energy.
+
+The price data is expanded to a price per minute once per snapshot. Prefix sums over these minute prices give
+the price sum of any window with one subtraction, so all candidate windows are compared in linear time.
+"""
+import math
+
+from decimal import Decimal
+from typing import Optional
+
+import numpy as np
+
+from awattprice import defaults
+from awattprice.price_series import PriceSeries
+
+MINUTE = 60
+
+
+class MinutePrices:
+    """Prefix sums of the price of each minute covered by price data."""
+
+    start_timestamp: int
+    prefix_marketprices: np.ndarray
+    prefix_gaps: np.ndarray
+    price_decimal_places: int
+    tax: Optional[Decimal]
+
+    def __init__(
+        self,
+        start_timestamp: int,
+        prefix_marketprices: np.ndarray,
+        prefix_gaps: np.ndarray,
+        price_decimal_places: int,
+        tax: Optional[Decimal],
+    ):
+        """Constructor for new minute prices.
+
+        :param start_timestamp: Epoch seconds at which the first minute starts.
+        :param prefix_marketprices: Sums of the fixed point marketprices of all minutes before each minute.
+        :param prefix_gaps: Numbers of minutes without a price before each minute.
+        """
+        self.start_timestamp = start_timestamp
+        self.prefix_marketprices = prefix_marketprices
+        self.prefix_gaps = prefix_gaps
+        self.price_decimal_places = price_decimal_places
+        self.tax = tax
+
+    def __len__(self) -> int:
+        return len(self.prefix_marketprices) - 1
+
+
+def check_energy(energy: float) -> bool:
+    """Check if the cheapest window can be found for an energy in kWh."""
+    return math.isfinite(energy) and 0 < energy <= defaults.CHEAPEST_WINDOW_MAX_ENERGY
+
+
+def get_minute_prices(price_data: PriceSeries) -> Optional[MinutePrices]:
+    """Expand price data to prices per minute and sum them up.
+
+    :returns None: If the price data is empty.
+    """
+    if len(price_data) == 0:
+        return None
+
+    start_timestamp = int(price_data.start_timestamps.min()) // MINUTE * MINUTE
+    end_timestamp = -(-int(price_data.end_timestamps.max()) // MINUTE) * MINUTE
+    minutes_count = (end_timestamp - start_timestamp) // MINUTE
+
+    minute_marketprices = np.zeros(minutes_count, dtype=np.int64)
+    minute_gaps = np.ones(minutes_count, dtype=np.int64)
+    first_minutes = (price_data.start_timestamps - start_timestamp) // MINUTE
+    end_minutes = (price_data.end_timestamps - start_timestamp) // MINUTE
+    for first_minute, end_minute, marketprice in zip(
+        first_minutes.tolist(), end_minutes.tolist(), price_data.marketprices.tolist()
+    ):
+        minute_marketprices[first_minute:end_minute] = marketprice
+        minute_gaps[first_minute:end_minute] = 0
+
+    prefix_marketprices = np.zeros(minutes_count + 1, dtype=np.int64)
+    np.cumsum(minute_marketprices, out=prefix_marketprices[1:])
+    prefix_gaps = np.zeros(minutes_count + 1, dtype=np.int64)
+    np.cumsum(minute_gaps, out=prefix_gaps[1:])
+
+    minute_prices = MinutePrices(
+        start_timestamp, prefix_marketprices, prefix_gaps, price_data.price_decimal_places, price_data.region.tax
+    )
+    return minute_prices
+
+
+def find_cheapest_window(
+    minute_prices: MinutePrices, duration: int, energy: Decimal, not_before: int, deadline: int
+) -> Optional[dict]:
+    """Find the window in which consuming energy evenly over a duration costs the least.
+
+    Windows start at full minutes. If multiple windows cost the same the earliest one is returned.
+
+    :param duration: Length of the window in minutes.
+    :param energy: Energy in kWh which is consumed evenly within the window.
+    :param not_before: Epoch seconds before which the window must not start.
+    :param deadline: Epoch seconds after which the window must not end.
+    :returns: The cheapest window with its mean marketprice in euro per MWh and its untaxed and taxed cost in
+        euro. None if no window fully covered by price data fits between not before and the deadline.
+    """
+    first_start = max(-(-(not_before - minute_prices.start_timestamp) // MINUTE), 0)
+    last_end = min((deadline - minute_prices.start_timestamp) // MINUTE, len(minute_prices))
+    if last_end - first_start < duration:
+        return None
+
+    starts = np.arange(first_start, last_end - duration + 1)
+    ends = starts + duration
+    window_gaps = minute_prices.prefix_gaps[ends] - minute_prices.prefix_gaps[starts]
+    window_marketprices = minute_prices.prefix_marketprices[ends] - minute_prices.prefix_marketprices[starts]
+    window_marketprices = np.where(window_gaps == 0, window_marketprices, np.iinfo(np.int64).max)
+
+    cheapest_index = int(np.argmin(window_marketprices))
+    if window_gaps[cheapest_index] != 0:
+        return None
+
+    start_timestamp = minute_prices.start_timestamp + int(starts[cheapest_index]) * MINUTE
+    marketprices_sum = Decimal(int(window_marketprices[cheapest_index]))
+    mean_marketprice = marketprices_sum.scaleb(-minute_prices.price_decimal_places) / duration
+    # Euro per MWh times kWh.
+    cost = mean_marketprice * energy / 1000
+    taxed_cost = cost * minute_prices.tax if minute_prices.tax else cost
+
+    places = Decimal(1).scaleb(-minute_prices.price_decimal_places)
+    window = {
+        "start_timestamp": start_timestamp,
+        "end_timestamp": start_timestamp + duration * MINUTE,
+        "mean_marketprice": float(mean_marketprice.quantize(places)),
+        "cost": {
+            "untaxed": float(cost.quantize(places)),
+            "taxed": float(taxed_cost.quantize(places)),
+        },
+    }
+    return window
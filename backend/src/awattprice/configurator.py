@@ -34,13 +34,28 @@ def _transform_config(config: Config):
     config.paths.log_dir = Path(config.paths.log_dir).expanduser()
     config.paths.data_dir = Path(config.paths.data_dir).expanduser()
     config.paths.price_data_dir = config.paths.data_dir / defaults.PRICE_DATA_SUBDIR_NAME
+    config.paths.price_archive_dir = config.paths.price_data_dir / defaults.PRICE_ARCHIVE_SUBDIR_NAME
     config.paths.apns_dir = Path(config.paths.apns_dir).expanduser()
 
+    config.database_pragmas = _get_database_pragmas(config)
+
     config.paths.old_database = _check_config_none(config.paths.old_database)
     if config.paths.old_database is not None:
         config.paths.old_database = Path(config.paths.old_database)
 
 
+def _get_database_pragmas(config: Config) -> dict:
+    """Get the database pragmas with the defaults overwritten by those set in the config.
+
+    Configs created by older versions may have no database section, so all its values are optional.
+    """
+    database_pragmas = {}
+    for name, default_value in defaults.DATABASE_PRAGMAS.items():
+        value = _check_config_none(getattr(config.database, name)) if config.database else None
+        database_pragmas[name] = default_value if value is None else value
+    return database_pragmas
+
+
 def _ensure_dir(path: Path):
     """Ensure that the dir at the parsed path is a directory and exists.
 
@@ -62,6 +77,7 @@ def _ensure_config_dirs(config: Config):
     _ensure_dir(config.paths.log_dir)
     _ensure_dir(config.paths.data_dir)
     _ensure_dir(config.paths.price_data_dir)
+    _ensure_dir(config.paths.price_archive_dir)
     _ensure_dir(config.paths.apns_dir)
 
 
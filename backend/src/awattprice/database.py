@@ -1,4 +1,5 @@
 """Functions to perform database managing tasks."""
+from functools import partial
 from pathlib import Path
 from typing import Optional
 from typing import Union
@@ -7,28 +8,56 @@ from awattprice import defaults
 from liteconfig import Config
 from loguru import logger
 from sqlalchemy import create_engine
+from sqlalchemy import event
+from sqlalchemy.engine import Connection
 from sqlalchemy.engine import Engine
 from sqlalchemy.ext.asyncio import AsyncEngine
 from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
 
 CREATE_ENGINE_KWARGS = {"future": True, "echo": False}
+# The async engine keeps connections open so that their page cache and memory map are reused. Sync engines keep
+# the default of opening a connection for each use, as pooled sqlite connections can't move between threads.
+CREATE_ASYNC_ENGINE_KWARGS = {
+    "poolclass": AsyncAdaptedQueuePool,
+    "pool_size": defaults.DATABASE_POOL_SIZE,
+    "max_overflow": defaults.DATABASE_POOL_MAX_OVERFLOW,
+}
 
 
-def get_engine(database_file: Path, async_=False) -> Optional[Union[Engine, AsyncEngine]]:
+def set_pragmas(pragmas: dict, dbapi_connection, _connection_record):
+    """Set pragmas on a new sqlite connection. Used as listener for the connect event of engines."""
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+    finally:
+        cursor.close()
+
+
+def get_engine(
+    database_file: Path, async_=False, pragmas: Optional[dict] = None
+) -> Optional[Union[Engine, AsyncEngine]]:
     """Get either a sync or an async sqlalchemy engine for the app's database.
 
+    :param pragmas: Pragmas set on each new connection. Defaults to the performance profile in the defaults.
     :raises FileNotFoundError: If the backends database couldn't be found.
     """
     if not database_file.exists():
         raise FileNotFoundError(database_file)
 
+    if pragmas is None:
+        pragmas = defaults.DATABASE_PRAGMAS
+
     if async_:
         database_url = f"sqlite+aiosqlite:///{database_file}"
-        engine = create_async_engine(database_url, **CREATE_ENGINE_KWARGS)
+        engine = create_async_engine(database_url, **CREATE_ENGINE_KWARGS, **CREATE_ASYNC_ENGINE_KWARGS)
+        event.listen(engine.sync_engine, "connect", partial(set_pragmas, pragmas))
     else:
         database_url = f"sqlite+pysqlite:///{database_file}"
         engine = create_engine(database_url, **CREATE_ENGINE_KWARGS)
+        event.listen(engine, "connect", partial(set_pragmas, pragmas))
 
     return engine
 
@@ -36,4 +65,21 @@ def get_engine(database_file: Path, async_=False) -> Optional[Union[Engine, Asyn
 def get_awattprice_engine(config: Config, async_=False) -> Optional[Union[Engine, AsyncEngine]]:
     database_dir = config.paths.data_dir
     database_file = database_dir / defaults.DATABASE_FILE_NAME
-    return get_engine(database_file, async_)
\ No newline at end of file
+    return get_engine(database_file, async_, config.database_pragmas)
+
+
+def log_pragmas(connection: Connection, pragmas: dict):
+    """Log the values of pragmas which are actually in effect.
+
+    Some pragmas can silently fail, for example the journal mode can't be wal on network file systems.
+
+    :param pragmas: Pragmas which were set on the connection.
+    """
+    effective_pragmas = {name: connection.exec_driver_sql(f"PRAGMA {name}").scalar() for name in pragmas}
+    effective_pragmas_string = ", ".join(f"{name}={value}" for name, value in effective_pragmas.items())
+    logger.info(f"Database pragmas in effect: {effective_pragmas_string}.")
+
+    if "journal_mode" in pragmas:
+        journal_mode = str(effective_pragmas["journal_mode"])
+        if journal_mode.lower() != str(pragmas["journal_mode"]).lower():
+            logger.warning(f"Database journal mode is {journal_mode} instead of {pragmas['journal_mode']}.")
@@ -48,12 +48,23 @@ old_database =
 [apns]
 team_id = 
 key_id = 
+
+[database]
+# Sqlite pragmas set on each connection. Empty values use the backend defaults.
+journal_mode =
+synchronous =
+mmap_size =
+cache_size =
+busy_timeout =
+temp_store =
 """
 
 ORM_TABLE_NAMES = Box(
     {
         "token_table": "token",
         "price_below_table": "price_below_notification",
+        "change_sequence_table": "change_sequence",
+        "price_below_deletion_table": "price_below_notification_deletion",
     }
 )
 
@@ -77,6 +88,21 @@ AWATTAR_UPDATE_HOUR = 13
 EUROPE_BERLIN_TIMEZONE = "Europe/Berlin"
 
 DATABASE_FILE_NAME = "database.sqlite3"  # End with '.sqlite3'
+# Pragmas set on each new connection to the database. Each can be overwritten in the database section of the
+# config. Wal lets readers continue while another process writes, with which a normal synchronous level is safe.
+DATABASE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "mmap_size": 256 * 1024 * 1024,
+    # Negative sizes are in KiB instead of pages.
+    "cache_size": -64 * 1024,
+    "busy_timeout": 5000,
+    "temp_store": "MEMORY",
+}
+# Number of connections the async database engine keeps open.
+DATABASE_POOL_SIZE = 5
+# Number of connections the async database engine opens in addition under load.
+DATABASE_POOL_MAX_OVERFLOW = 10
 
 
 AWATTAR_API_PRICE_DATA_SCHEMA = {
@@ -101,14 +127,77 @@ AWATTAR_API_PRICE_DATA_SCHEMA = {
     },
     "required": ["data", "url"],
 }
-PRICE_DATA_FILE_NAME = "awattar-data-{}.pickle"  # formatted with lowercase region name
+PRICE_DATA_FILE_NAME = "awattar-data-{}.prices"  # formatted with lowercase region name
+# Number of published versions of a price data file to keep. Older versions are removed.
+PRICE_DATA_KEPT_VERSIONS = 3
+# Name of the files in which price data was pickled before. Only used to convert them to the current format.
+PRICE_DATA_PICKLE_FILE_NAME = "awattar-data-{}.pickle"  # formatted with lowercase region name
+# Number of decimal places of the fixed point marketprices (euro per MWh) in stored price data.
+PRICE_DATA_PRICE_DECIMAL_PLACES = 6
 # Name of the subdir in which to store cached price data.
 # This subdir is relative to the data dir specified in the config file.
 PRICE_DATA_SUBDIR_NAME = "price_data"
 # Timeout in seconds to wait when needing the refresh price data lock to be unlocked.
 PRICE_DATA_REFRESH_LOCK_TIMEOUT = 10
+# Minimal and maximal delay in seconds between two attempts to acquire a file lock which is held by someone else.
+LOCK_RETRY_DELAY_MIN = 0.01
+LOCK_RETRY_DELAY_MAX = 0.25
+# Name of the subdir of the price data dir in which the price archive is stored.
+PRICE_ARCHIVE_SUBDIR_NAME = "archive"
+# Name of the price archive partition files. Formatted with the year and month of the partition.
+PRICE_ARCHIVE_PARTITION_FILE_NAME = "{}.archive"
+# Maximal time range in seconds of a single price archive query.
+PRICE_ARCHIVE_MAX_QUERY_RANGE = 366 * 24 * 60 * 60
+# Number of price points encoded at once when exporting archived price data.
+PRICE_EXPORT_CHUNK_SIZE = 1024
+# Percentiles included in the price statistics of a day.
+PRICE_STATISTICS_PERCENTILES = [10, 25, 75, 90]
+# Seconds for which clients may use price data responses after they expired while revalidating them.
+PRICE_DATA_CACHE_STALE_WHILE_REVALIDATE = 300
+# Maximal jitter in seconds added to the max age of price data responses so that not all clients expire at once.
+# The jitter is further limited to a fraction of the max age.
+PRICE_DATA_CACHE_MAX_JITTER = 600
+PRICE_DATA_CACHE_MAX_JITTER_FRACTION = 0.1
+# Minimal size in bytes of response bodies which are sent compressed.
+RESPONSE_COMPRESSION_MIN_SIZE = 512
+# Compression levels by content coding of bodies which are compressed once and sent many times.
+RESPONSE_COMPRESSION_LEVELS = {"br": 11, "gzip": 9}
+# Compression levels by content coding of bodies which are compressed for a single request only.
+RESPONSE_REQUEST_COMPRESSION_LEVELS = {"br": 4, "gzip": 6}
+# Number of combined price data responses of multiple regions which are cached.
+REGIONS_RESPONSE_CACHE_SIZE = 32
+# Number of cheapest window responses cached per price data snapshot.
+CHEAPEST_WINDOW_CACHE_SIZE = 256
+# Maximal energy in kWh for which the cheapest window can be found. Larger costs can't be rounded exactly.
+CHEAPEST_WINDOW_MAX_ENERGY = 1000000
+# Number of price below runs responses cached per price data snapshot.
+PRICE_RUNS_CACHE_SIZE = 256
 # Name of file which stores the timestamp when prices were updated last.
 PRICE_DATA_UPDATE_TS_FILE_NAME = "update-ts-{}.info"  # formatted with lowercase region name
+# Seconds between two polls of the background price data refresh.
+PRICE_DATA_POLL_INTERVAL = 300
+# Seconds between two polls of the background price data refresh while the stored data is due for an update.
+# For example this is the case after the aWATTar update hour as long as tomorrows prices are missing.
+PRICE_DATA_POLL_INTERVAL_DUE = AWATTAR_COOLDOWN_INTERVAL
+# Name of the shared memory segments to which price data is published. Formatted with a namespace specific to
+# the price data directory and the lowercase region name.
+SHARED_PRICE_DATA_NAME = "awattprice-{}-{}"
+# Name of the shared memory segments holding published price data. Formatted with the name of the segment of the
+# region and the sequence under which the price data was published.
+SHARED_PRICE_DATA_CONTENT_NAME = "{}-{}"
+# Name of the lock file held by the single web app process which polls price data in the background.
+PRICE_DATA_POLL_LEADER_LOCK_FILE_NAME = "poll-leader.lock"
+
+# Maximal number of notification configurations which can be saved with one bulk request.
+NOTIFICATION_CONFIGURATIONS_MAX_COUNT = 10000
+
+# Seconds to wait for further notification configuration saves before writing them in one transaction.
+NOTIFICATION_SAVE_MAX_DELAY = 0.005
+# Number of queued notification configuration saves after which they are written without further waiting.
+NOTIFICATION_SAVE_MAX_BATCH_SIZE = 200
+# Range of price below values in ct/kWh which are accepted. Values outside of it can't be stored in the database.
+NOTIFICATION_BELOW_VALUE_MIN = -1000000
+NOTIFICATION_BELOW_VALUE_MAX = 1000000
 
 region_enum_names = [element.name for element in Region]
 
@@ -134,7 +223,11 @@ NOTIFICATION_CONFIGURATION_SCHEMA = {
                     "type": "object",
                     "properties": {
                         "active": {"type": "boolean"},
-                        "below_value": {"type": "number"}
+                        "below_value": {
+                            "type": "number",
+                            "minimum": NOTIFICATION_BELOW_VALUE_MIN,
+                            "maximum": NOTIFICATION_BELOW_VALUE_MAX
+                        }
                     },
                     "required": ["active", "below_value"],
                     "additionalProperties": False
@@ -3,3 +3,11 @@
 
 class RefreshLockAcquireError(Exception):
     pass
+
+
+class PriceFileFormatError(Exception):
+    """A price data file doesn't have the expected format."""
+
+
+class LockTimeout(Exception):
+    """A lock couldn't be acquired within the timeout."""
@@ -0,0 +1,193 @@
+"""Migrate the schema of the database to the newest version.
+
+The schema version of a database is stored in its user_version pragma. Databases created before migrations
+existed have version zero. Each migration upgrades the schema by one version in its own immediate transaction, so
+migrations can run while other processes read from or write to the database in wal mode. Writers wait for a
+migration like for any other write and readers keep reading the previous schema until it is committed.
+"""
+from loguru import logger
+from sqlalchemy.engine import Connection
+
+from awattprice import defaults
+
+TABLE_NAMES = defaults.ORM_TABLE_NAMES
+
+
+class Migration:
+    """Upgrade of the schema to a version."""
+
+    version: int
+    description: str
+    statements: list[str]
+
+    def __init__(self, version: int, description: str, statements: list[str]):
+        """Constructor for a new migration.
+
+        :param statements: Sql statements which upgrade the schema from the previous version.
+        """
+        self.version = version
+        self.description = description
+        self.statements = statements
+
+    def upgrade(self, connection: Connection):
+        """Run the statements of this migration in the current transaction."""
+        for statement in self.statements:
+            connection.exec_driver_sql(statement)
+
+
+# Never change migrations which were released, add a new one instead.
+MIGRATIONS = [
+    Migration(
+        1,
+        "Create the token and price below notification tables.",
+        [
+            f"""CREATE TABLE IF NOT EXISTS {TABLE_NAMES.token_table} (
+                token_id INTEGER NOT NULL,
+                token VARCHAR NOT NULL,
+                region VARCHAR(2) NOT NULL,
+                tax BOOLEAN NOT NULL,
+                PRIMARY KEY (token_id),
+                UNIQUE (token)
+            )""",
+            f"""CREATE TABLE IF NOT EXISTS {TABLE_NAMES.price_below_table} (
+                token_id INTEGER NOT NULL,
+                active BOOLEAN NOT NULL,
+                below_value INTEGER,
+                PRIMARY KEY (token_id),
+                FOREIGN KEY(token_id) REFERENCES {TABLE_NAMES.token_table} (token_id)
+            )""",
+        ],
+    ),
+    Migration(
+        2,
+        "Index active price below notifications by their below value.",
+        [
+            # Covers the price below side of the targeting query, the token id is the rowid.
+            f"""CREATE INDEX IF NOT EXISTS ix_price_below_notification_active_below_value
+                ON {TABLE_NAMES.price_below_table} (active, below_value)""",
+        ],
+    ),
+    Migration(
+        3,
+        "Number changes to price below notifications so that they can be read incrementally.",
+        [
+            f"""ALTER TABLE {TABLE_NAMES.price_below_table} ADD COLUMN change_seq INTEGER NOT NULL DEFAULT 0""",
+            f"""CREATE INDEX IF NOT EXISTS ix_price_below_notification_change_seq
+                ON {TABLE_NAMES.price_below_table} (change_seq)""",
+            # The targeting query selects the change sequence number too, keep its index covering.
+            "DROP INDEX IF EXISTS ix_price_below_notification_active_below_value",
+            f"""CREATE INDEX ix_price_below_notification_active_below_value
+                ON {TABLE_NAMES.price_below_table} (active, below_value, change_seq)""",
+            f"""CREATE TABLE IF NOT EXISTS {TABLE_NAMES.change_sequence_table} (
+                id INTEGER NOT NULL,
+                seq INTEGER NOT NULL,
+                PRIMARY KEY (id)
+            )""",
+            f"""INSERT OR IGNORE INTO {TABLE_NAMES.change_sequence_table} (id, seq) VALUES (0, 0)""",
+            f"""CREATE TABLE IF NOT EXISTS {TABLE_NAMES.price_below_deletion_table} (
+                change_seq INTEGER NOT NULL,
+                token_id INTEGER NOT NULL,
+                PRIMARY KEY (change_seq)
+            )""",
+            # Writers are serialized, so changes are committed in the order of their sequence numbers.
+            f"""CREATE TRIGGER IF NOT EXISTS price_below_notification_inserted
+                AFTER INSERT ON {TABLE_NAMES.price_below_table}
+                BEGIN
+                    UPDATE {TABLE_NAMES.change_sequence_table} SET seq = seq + 1;
+                    UPDATE {TABLE_NAMES.price_below_table}
+                        SET change_seq = (SELECT seq FROM {TABLE_NAMES.change_sequence_table})
+                        WHERE token_id = NEW.token_id;
+                END""",
+            f"""CREATE TRIGGER IF NOT EXISTS price_below_notification_updated
+                AFTER UPDATE OF active, below_value ON {TABLE_NAMES.price_below_table}
+                WHEN OLD.active IS NOT NEW.active OR OLD.below_value IS NOT NEW.below_value
+                BEGIN
+                    UPDATE {TABLE_NAMES.change_sequence_table} SET seq = seq + 1;
+                    UPDATE {TABLE_NAMES.price_below_table}
+                        SET change_seq = (SELECT seq FROM {TABLE_NAMES.change_sequence_table})
+                        WHERE token_id = NEW.token_id;
+                END""",
+            f"""CREATE TRIGGER IF NOT EXISTS price_below_notification_deleted
+                AFTER DELETE ON {TABLE_NAMES.price_below_table}
+                BEGIN
+                    UPDATE {TABLE_NAMES.change_sequence_table} SET seq = seq + 1;
+                    INSERT INTO {TABLE_NAMES.price_below_deletion_table} (change_seq, token_id)
+                        SELECT seq, OLD.token_id FROM {TABLE_NAMES.change_sequence_table};
+                END""",
+            f"""CREATE TRIGGER IF NOT EXISTS token_updated
+                AFTER UPDATE OF region, tax ON {TABLE_NAMES.token_table}
+                WHEN OLD.region IS NOT NEW.region OR OLD.tax IS NOT NEW.tax
+                BEGIN
+                    UPDATE {TABLE_NAMES.change_sequence_table} SET seq = seq + 1;
+                    UPDATE {TABLE_NAMES.price_below_table}
+                        SET change_seq = (SELECT seq FROM {TABLE_NAMES.change_sequence_table})
+                        WHERE token_id = NEW.token_id;
+                END""",
+            f"""CREATE TRIGGER IF NOT EXISTS token_deleted
+                AFTER DELETE ON {TABLE_NAMES.token_table}
+                BEGIN
+                    UPDATE {TABLE_NAMES.change_sequence_table} SET seq = seq + 1;
+                    INSERT INTO {TABLE_NAMES.price_below_deletion_table} (change_seq, token_id)
+                        SELECT seq, OLD.token_id FROM {TABLE_NAMES.change_sequence_table};
+                END""",
+        ],
+    ),
+]
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+def get_schema_version(connection: Connection) -> int:
+    """Get the schema version of the database."""
+    return connection.exec_driver_sql("PRAGMA user_version").scalar()
+
+
+def _apply_migration(connection: Connection, migration: Migration) -> bool:
+    """Apply a single migration in its own immediate transaction.
+
+    :returns: False if another process already applied the migration.
+    """
+    connection.exec_driver_sql("BEGIN IMMEDIATE")
+    try:
+        # Another process may have migrated while waiting for the write lock.
+        if get_schema_version(connection) >= migration.version:
+            connection.exec_driver_sql("ROLLBACK")
+            return False
+
+        migration.upgrade(connection)
+        connection.exec_driver_sql(f"PRAGMA user_version = {migration.version}")
+    except BaseException:
+        connection.exec_driver_sql("ROLLBACK")
+        raise
+
+    connection.exec_driver_sql("COMMIT")
+    return True
+
+
+def migrate_database(connection: Connection, target_version: int = LATEST_VERSION) -> int:
+    """Apply all migrations up to the target version which the database doesn't have yet.
+
+    :param connection: Connection without an open transaction. Transactions are controlled explicitly while
+        migrating, afterwards the connection uses its default isolation level again.
+    :returns: Schema version of the database after migrating.
+    """
+    connection.execution_options(isolation_level="AUTOCOMMIT")
+    try:
+        version = get_schema_version(connection)
+        if version > LATEST_VERSION:
+            logger.warning(
+                f"Database schema version {version} is newer than the latest known version {LATEST_VERSION}."
+            )
+            return version
+
+        for migration in MIGRATIONS:
+            if migration.version <= version or migration.version > target_version:
+                continue
+            if _apply_migration(connection, migration):
+                logger.info(f"Migrated database to schema version {migration.version}: {migration.description}")
+            version = migration.version
+    finally:
+        # Ends the transaction sqlalchemy began on its own. With autocommit no database transaction is open.
+        connection.commit()
+        connection.execution_options(isolation_level=connection.default_isolation_level)
+
+    return version
@@ -2,82 +2,121 @@
 
 Sending the actual notifications is handled by an extra service outside of this web app.
 """
-from collections import namedtuple
 from typing import Any
+from typing import Callable
 from typing import Optional
 
 import jsonschema
-import sqlalchemy
 
 from box import Box
 from box import BoxList
-from fastapi import HTTPException
 from loguru import logger
-from sqlalchemy import inspect
+from sqlalchemy import bindparam
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects import sqlite
 from sqlalchemy.ext.asyncio import AsyncEngine
-from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy.orm import selectinload
+from sqlalchemy.sql.dml import Insert
 
 from awattprice import defaults
-from awattprice import utils
+from awattprice import validation
 from awattprice.defaults import Region
 from awattprice.orm import PriceBelowNotification
 from awattprice.orm import Token
 
 
-async def get_complete_token(session: AsyncSession, token_hex: str) -> Optional[Token]:
-	"""Get the token orm object with all loaded relationships."""
-	stmt = select(Token).where(Token.token == token_hex).options(selectinload(Token.price_below))
+def get_upsert_insert(dialect_name: str) -> Callable[[Any], Insert]:
+	"""Get the insert construct of a database dialect which supports ON CONFLICT clauses.
 
-	try:
-		token_raw = await session.execute(stmt)
-		token = token_raw.scalar_one()
-	except sqlalchemy.exc.NoResultFound as exc:
-		logger.debug(f"No token record for token '{token_hex}' yet.")
-		return None
+	:raises ValueError: If the dialect has no ON CONFLICT clauses.
+	"""
+	if dialect_name == "sqlite":
+		return sqlite.insert
+	if dialect_name == "postgresql":
+		return postgresql.insert
+	raise ValueError(f"Database dialect {dialect_name} doesn't support upserts.")
+
+
+def get_configuration_upserts(dialect_name: str) -> tuple[Insert, Insert]:
+	"""Get the statements which insert or update the token and the price below notification of configurations.
 
-	return token
+	Both statements take the parameters of `get_configuration_parameters` and can be executed with many of them
+	at once. The second statement selects the token id by the token, so no orm objects need to be loaded and no
+	ids need to be returned by the first statement.
+
+	:returns: The token upsert and the price below notification upsert which must run after it.
+	"""
+	insert = get_upsert_insert(dialect_name)
+
+	token_insert = insert(Token).values(
+		token=bindparam("token_hex"),
+		region=bindparam("token_region", type_=Token.region.type),
+		tax=bindparam("token_tax", type_=Token.tax.type),
+	)
+	token_upsert = token_insert.on_conflict_do_update(
+		index_elements=[Token.token],
+		set_={"region": token_insert.excluded.region, "tax": token_insert.excluded.tax},
+	)
+
+	token_id_select = select(
+		Token.token_id,
+		bindparam("price_below_active", type_=PriceBelowNotification.active.type),
+		bindparam("price_below_value", type_=PriceBelowNotification.below_value.type),
+	).where(Token.token == bindparam("token_hex"))
+	price_below_insert = insert(PriceBelowNotification).from_select(
+		["token_id", "active", "below_value"], token_id_select
+	)
+	price_below_upsert = price_below_insert.on_conflict_do_update(
+		index_elements=[PriceBelowNotification.token_id],
+		set_={"active": price_below_insert.excluded.active, "below_value": price_below_insert.excluded.below_value},
+	)
+
+	return token_upsert, price_below_upsert
+
+
+def get_configuration_parameters(
+	token_hex: str, region: Region, tax: bool, price_below_active: bool, price_below_value: float
+) -> dict:
+	"""Get the parameters to save a notification configuration with the statements of `get_configuration_upserts`."""
+	parameters = {
+		"token_hex": token_hex,
+		"token_region": region,
+		"token_tax": tax,
+		"price_below_active": price_below_active,
+		"price_below_value": price_below_value,
+	}
+	return parameters
 
 
 async def save_notification_configuration(db_engine: AsyncEngine, configuration: Box):
 	"""Save the notification configuration for a certain token."""
-	async with AsyncSession(db_engine, future=True) as session:
-		token = await get_complete_token(session, configuration.token)
-
-		if token:
-			logger.debug("Updating existing token.")
-			token.region = configuration.general.region
-			token.tax = configuration.general.tax
-
-			if token.price_below:
-				logger.debug("Updating existing price below notification configuration.")
-				token.price_below.active = configuration.notifications.price_below.active
-				token.price_below.below_value = configuration.notifications.price_below.below_value
-		else:
-			logger.debug("Creating new token.")
-			new_token = Token(
-				token=configuration.token, region=configuration.general.region, tax=configuration.general.tax
-			)
-			session.add(new_token)
-
-		if not token or not token.price_below:
-			logger.debug("Creating new price below notification configuration.")
-			if not token:
-				await session.flush()
-				token_id = new_token.token_id
-			else:
-				token_id = token.token_id
-
-			new_price_below_notification = PriceBelowNotification(
-				token_id=token_id,
-				active=configuration.notifications.price_below.active,
-				below_value=configuration.notifications.price_below.below_value,
-			)
-			session.add(new_price_below_notification)
-
-		logger.debug("Saved notification configuration.")
-		await session.commit()
+	await save_notification_configurations(db_engine, [configuration])
+
+
+async def save_notification_configurations(db_engine: AsyncEngine, configurations: list[Box]):
+	"""Save the notification configurations of many tokens in a single transaction.
+
+	All tokens and all price below notification configurations are inserted or updated with one statement each.
+	If a token is included multiple times its last configuration is saved.
+	"""
+	latest_configurations = {configuration.token: configuration for configuration in configurations}
+	parameters = [
+		get_configuration_parameters(
+			configuration.token,
+			configuration.general.region,
+			configuration.general.tax,
+			configuration.notifications.price_below.active,
+			configuration.notifications.price_below.below_value,
+		)
+		for configuration in latest_configurations.values()
+	]
+
+	token_upsert, price_below_upsert = get_configuration_upserts(db_engine.dialect.name)
+	async with db_engine.begin() as connection:
+		await connection.execute(token_upsert, parameters)
+		await connection.execute(price_below_upsert, parameters)
+
+	logger.debug(f"Saved {len(latest_configurations)} notification configurations.")
 
 
 def parse_notification_configuration_body(configuration: Box) -> Optional[Box]:
@@ -87,7 +126,7 @@ def parse_notification_configuration_body(configuration: Box) -> Optional[Box]:
 	"""
 	schema = defaults.NOTIFICATION_CONFIGURATION_SCHEMA
 	try:
-		jsonschema.validate(configuration, schema)
+		validation.validate(configuration, schema)
 	except jsonschema.ValidationError as exc:
 		logger.warning(f"Clients tasks json is not valid: {exc}.")
 		return None
@@ -95,3 +134,24 @@ def parse_notification_configuration_body(configuration: Box) -> Optional[Box]:
 	configuration.general.region = Region[configuration.general.region]
 
 	return configuration
+
+
+def parse_notification_configurations_body(configurations: Any) -> Optional[list[Optional[Box]]]:
+	"""Validate and parse multiple notification configurations into the internal format.
+
+	Each configuration is validated on its own so that invalid configurations don't affect the valid ones.
+
+	:returns: None if the body isn't a list of acceptable length. Otherwise the parsed configurations in the same
+		order, with None for each configuration which couldn't be parsed.
+	"""
+	if not isinstance(configurations, list):
+		logger.warning(f"Clients notification configurations aren't a list: {type(configurations).__name__}.")
+		return None
+	if len(configurations) > defaults.NOTIFICATION_CONFIGURATIONS_MAX_COUNT:
+		logger.warning(f"Client sent too many notification configurations: {len(configurations)}.")
+		return None
+
+	parsed_configurations = [
+		parse_notification_configuration_body(configuration) for configuration in BoxList(configurations)
+	]
+	return parsed_configurations
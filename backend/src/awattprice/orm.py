@@ -3,9 +3,11 @@ from sqlalchemy import Boolean
 from sqlalchemy import Column
 from sqlalchemy import Enum
 from sqlalchemy import ForeignKey
+from sqlalchemy import Index
 from sqlalchemy import Integer
 from sqlalchemy import MetaData
 from sqlalchemy import String
+from sqlalchemy import text
 from sqlalchemy.orm import relationship
 from sqlalchemy.orm import registry as Registry
 
@@ -26,10 +28,17 @@ class PriceBelowNotification(Base):
     """Hold info about the subscription of the price below notification of a token."""
 
     __tablename__ = TABLE_NAMES.price_below_table
+    # Created by the migrations, declared here to keep the metadata equal to the schema.
+    __table_args__ = (
+        Index("ix_price_below_notification_active_below_value", "active", "below_value", "change_seq"),
+        Index("ix_price_below_notification_change_seq", "change_seq"),
+    )
 
     token_id = Column(ForeignKey(f"{TABLE_NAMES.token_table}.token_id"), primary_key=True)
     active = Column(Boolean, nullable=False)
     below_value = Column(Integer, nullable=True)
+    # Set by triggers to the change sequence number of the last change of this row or of its token.
+    change_seq = Column(Integer, nullable=False, server_default=text("0"))
 
     token = relationship("Token", back_populates="price_below", uselist=False)
 
@@ -59,3 +68,32 @@ class Token(Base):
 
 
 # pylint: enable=too-few-public-methods
+
+
+# pylint: disable=too-few-public-methods
+class ChangeSequence(Base):
+    """Single row holding the number of the latest change to price below notifications.
+
+    Triggers increase the number on each change, so that readers can find all changes since they last read.
+    """
+
+    __tablename__ = TABLE_NAMES.change_sequence_table
+
+    id = Column(Integer, primary_key=True)
+    seq = Column(Integer, nullable=False)
+
+
+# pylint: enable=too-few-public-methods
+
+
+# pylint: disable=too-few-public-methods
+class PriceBelowNotificationDeletion(Base):
+    """Log of deleted price below notifications and tokens, filled by triggers."""
+
+    __tablename__ = TABLE_NAMES.price_below_deletion_table
+
+    change_seq = Column(Integer, primary_key=True)
+    token_id = Column(Integer, nullable=False)
+
+
+# pylint: enable=too-few-public-methods
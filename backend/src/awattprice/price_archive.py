@@ -0,0 +1,272 @@
+"""Keep the history of all price points in an append-only archive.
+
+The archive of a region is partitioned by the Berlin month in which price points start. Each partition is a
+file with a fixed size header followed by fixed size records. All values are stored little endian.
+
+    header:   magic (4 bytes), format version (uint16), price decimal places (uint16), 8 reserved bytes
+    records:  start timestamp (int64), end timestamp (int64), marketprice (int64 fixed point)
+
+Records are only ever appended and are ordered by their start timestamps. Each price point is archived once,
+when it is seen for the first time. Range queries binary search the start timestamps of the memory-mapped
+partitions and so never scan a partition.
+"""
+import mmap
+import os
+import struct
+
+from pathlib import Path
+from typing import Iterable
+from typing import Iterator
+from typing import Optional
+
+import arrow
+import numpy as np
+
+from arrow import Arrow
+from liteconfig import Config
+from loguru import logger
+
+from awattprice import defaults
+from awattprice.defaults import Region
+from awattprice.exceptions import PriceFileFormatError
+from awattprice.price_series import PriceSeries
+from awattprice.utils import sync_directory
+
+MAGIC = b"AWPA"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<4sHH8x")
+RECORD = np.dtype([("start_timestamp", "<i8"), ("end_timestamp", "<i8"), ("marketprice", "<i8")])
+
+
+def get_region_archive_dir(region: Region, config: Config) -> Path:
+    """Get the directory holding the archive partitions of a region."""
+    region_archive_dir = config.paths.price_archive_dir / region.value.lower()
+    return region_archive_dir
+
+
+def get_partition_start(time: Arrow) -> Arrow:
+    """Get the start of the partition in which a time lies."""
+    partition_start = time.to(defaults.EUROPE_BERLIN_TIMEZONE).floor("month")
+    return partition_start
+
+
+def get_partition_path(partition_start: Arrow, region: Region, config: Config) -> Path:
+    """Get the path of the partition file starting at a certain time."""
+    file_name = defaults.PRICE_ARCHIVE_PARTITION_FILE_NAME.format(partition_start.format("YYYY-MM"))
+    partition_path = get_region_archive_dir(region, config) / file_name
+    return partition_path
+
+
+def list_partition_starts(region: Region, config: Config) -> list[Arrow]:
+    """Get the starts of all existing partitions of a region in ascending order.
+
+    Files in the archive directory which aren't named like a partition are ignored.
+    """
+    file_name_suffix = defaults.PRICE_ARCHIVE_PARTITION_FILE_NAME.format("")
+    try:
+        file_names = os.listdir(get_region_archive_dir(region, config))
+    except FileNotFoundError:
+        return []
+
+    partition_starts = []
+    for file_name in file_names:
+        if not file_name.endswith(file_name_suffix):
+            continue
+        try:
+            partition_start = arrow.get(
+                file_name[: -len(file_name_suffix)], "YYYY-MM", tzinfo=defaults.EUROPE_BERLIN_TIMEZONE
+            )
+        except ValueError:
+            continue
+        partition_starts.append(partition_start)
+
+    partition_starts.sort()
+    return partition_starts
+
+
+def iterate_partition_starts(region: Region, config: Config, start: Arrow, end: Arrow) -> Iterator[Arrow]:
+    """Iterate over the starts of the existing partitions holding price points which start in a time range.
+
+    Only existing partitions are listed, so the number of iterations is bounded by the size of the archive and
+    not by the size of the time range.
+
+    :param end: Exclusive end of the time range.
+    """
+    first_partition_start = get_partition_start(start)
+    for partition_start in list_partition_starts(region, config):
+        if first_partition_start <= partition_start < end:
+            yield partition_start
+
+
+def read_partition(partition_path: Path) -> Optional[tuple[np.ndarray, int]]:
+    """Memory-map a partition read-only.
+
+    A record which was only partially appended, for example because the writer crashed, is ignored.
+
+    :returns: Tuple of the records and the price decimal places. None if the partition doesn't exist.
+    :raises PriceFileFormatError: If the file isn't a valid partition.
+    """
+    try:
+        file = open(partition_path, "rb")
+    except FileNotFoundError:
+        return None
+
+    with file:
+        file_size = os.fstat(file.fileno()).st_size
+        if file_size < HEADER.size:
+            raise PriceFileFormatError(f"Price archive partition {partition_path} is shorter than its header.")
+        mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, format_version, price_decimal_places = HEADER.unpack_from(mapping)
+    if magic != MAGIC:
+        raise PriceFileFormatError(f"Price archive partition has an unknown magic number: {magic!r}.")
+    if format_version != FORMAT_VERSION:
+        raise PriceFileFormatError(
+            f"Price archive partition has an unsupported format version: {format_version}."
+        )
+
+    records_count = (file_size - HEADER.size) // RECORD.itemsize
+    records = np.frombuffer(mapping, dtype=RECORD, count=records_count, offset=HEADER.size)
+    return records, price_decimal_places
+
+
+def _append_records(partition_path: Path, series: PriceSeries):
+    """Append the price points of a series to a partition, creating the partition if it doesn't exist."""
+    if not partition_path.exists():
+        partition_path.parent.mkdir(parents=True, exist_ok=True)
+        header = HEADER.pack(MAGIC, FORMAT_VERSION, series.price_decimal_places)
+        with open(partition_path, "xb") as file:
+            file.write(header)
+            file.flush()
+            os.fsync(file.fileno())
+        sync_directory(partition_path.parent)
+
+    records = np.empty(len(series), dtype=RECORD)
+    records["start_timestamp"] = series.start_timestamps
+    records["end_timestamp"] = series.end_timestamps
+    records["marketprice"] = series.marketprices
+
+    with open(partition_path, "r+b") as file:
+        file_size = os.fstat(file.fileno()).st_size
+        # Drop a record which was only partially appended before.
+        complete_size = file_size - (file_size - HEADER.size) % RECORD.itemsize
+        file.truncate(complete_size)
+        file.seek(complete_size)
+        file.write(records.tobytes())
+        file.flush()
+        os.fsync(file.fileno())
+
+
+def archive_prices(series: PriceSeries, region: Region, config: Config) -> int:
+    """Append all price points of a series which weren't archived yet.
+
+    A price point is new if it starts after the latest archived price point of its partition. Must only be
+    called while holding the refresh lock of the region, as there must be one writer at a time.
+
+    :returns: Number of archived price points.
+    """
+    if series.price_decimal_places != defaults.PRICE_DATA_PRICE_DECIMAL_PLACES:
+        raise ValueError(f"Can't archive prices with {series.price_decimal_places} decimal places.")
+
+    order = np.argsort(series.start_timestamps, kind="stable")
+    series = series.select(order)
+
+    archived_count = 0
+    partition_starts = [get_partition_start(arrow.get(int(timestamp))) for timestamp in series.start_timestamps]
+    for partition_start in sorted(set(partition_starts)):
+        partition_end = partition_start.shift(months=+1)
+        partition_mask = (series.start_timestamps >= partition_start.int_timestamp) & (
+            series.start_timestamps < partition_end.int_timestamp
+        )
+
+        partition_path = get_partition_path(partition_start, region, config)
+        partition = read_partition(partition_path)
+        if partition is not None:
+            records, _ = partition
+            if len(records) > 0:
+                partition_mask &= series.start_timestamps > records["start_timestamp"][-1]
+
+        new_points = series.select(partition_mask)
+        if len(new_points) == 0:
+            continue
+        _append_records(partition_path, new_points)
+        archived_count += len(new_points)
+
+    if archived_count > 0:
+        logger.debug(f"Archived {archived_count} new {region.name} price points.")
+    return archived_count
+
+
+def iterate_records(region: Region, config: Config, start: Arrow, end: Arrow) -> Iterator[np.ndarray]:
+    """Iterate over the archived records which start within a time range, one partition after another.
+
+    The records are read-only views into the memory-mapped partitions and are ordered by their start.
+
+    :param end: Exclusive end of the time range.
+    :raises PriceFileFormatError: If a partition isn't valid.
+    """
+    for partition_start in iterate_partition_starts(region, config, start, end):
+        partition_path = get_partition_path(partition_start, region, config)
+        partition = read_partition(partition_path)
+        if partition is None:
+            # Removed after it was listed.
+            continue
+        records, price_decimal_places = partition
+        if price_decimal_places != defaults.PRICE_DATA_PRICE_DECIMAL_PLACES:
+            raise PriceFileFormatError(f"Price archive partition has {price_decimal_places} decimal places.")
+
+        partition_start_timestamps = records["start_timestamp"]
+        first_index = np.searchsorted(partition_start_timestamps, start.int_timestamp, side="left")
+        last_index = np.searchsorted(partition_start_timestamps, end.int_timestamp, side="left")
+        if first_index < last_index:
+            yield records[first_index:last_index]
+
+
+def records_to_series(records: np.ndarray, region: Region) -> PriceSeries:
+    """Get a price series with the price points of archived records."""
+    series = PriceSeries(
+        records["start_timestamp"],
+        records["end_timestamp"],
+        records["marketprice"],
+        defaults.PRICE_DATA_PRICE_DECIMAL_PLACES,
+        region,
+    )
+    return series
+
+
+def read_records(region: Region, config: Config, start: Arrow, end: Arrow) -> list[np.ndarray]:
+    """Get the archived records which start within a time range of all partitions at once.
+
+    The partitions are only memory-mapped, so this doesn't read the records and memory usage doesn't grow with
+    the size of the time range. All partitions are checked to be valid before any record is used.
+
+    :param end: Exclusive end of the time range.
+    :raises PriceFileFormatError: If a partition isn't valid.
+    """
+    return list(iterate_records(region, config, start, end))
+
+
+def iterate_price_chunks(records: Iterable[np.ndarray], region: Region, chunk_size: int) -> Iterator[PriceSeries]:
+    """Iterate over archived records in chunks of price points of limited size.
+
+    Only one chunk is held in memory at a time no matter how many records there are.
+
+    :param records: Records of one partition after another, like `read_records` returns them.
+    """
+    for partition_records in records:
+        for chunk_start in range(0, len(partition_records), chunk_size):
+            yield records_to_series(partition_records[chunk_start : chunk_start + chunk_size], region)
+
+
+def query_prices(region: Region, config: Config, start: Arrow, end: Arrow) -> PriceSeries:
+    """Get all archived price points which start within a time range.
+
+    :param end: Exclusive end of the time range.
+    :raises PriceFileFormatError: If a partition isn't valid.
+    """
+    records = list(iterate_records(region, config, start, end))
+    if not records:
+        records = [np.empty(0, dtype=RECORD)]
+
+    series = records_to_series(np.concatenate(records), region)
+    return series
@@ -0,0 +1,84 @@
+"""Export archived price data as a stream of rows.
+
+Rows are encoded chunk by chunk so that exporting large time ranges needs constant memory. Values are encoded
+the same way as in the json price data responses.
+"""
+from enum import Enum
+from typing import AsyncIterator
+from typing import Iterator
+
+from loguru import logger
+from starlette.concurrency import iterate_in_threadpool
+
+from awattprice.price_series import PriceSeries
+
+
+class ExportFormat(str, Enum):
+    """Format of exported price data."""
+
+    NDJSON = "ndjson"
+    CSV = "csv"
+
+    @property
+    def media_type(self) -> str:
+        return EXPORT_MEDIA_TYPES[self]
+
+
+EXPORT_MEDIA_TYPES = {ExportFormat.NDJSON: "application/x-ndjson", ExportFormat.CSV: "text/csv"}
+CSV_HEADER = b"start_timestamp,end_timestamp,marketprice\n"
+
+
+def _iterate_rows(price_data: PriceSeries) -> Iterator[tuple[int, int, float]]:
+    """Iterate over the price points of price data as they appear in json price data responses."""
+    marketprices = price_data.marketprices / 10 ** price_data.price_decimal_places
+    return zip(price_data.start_timestamps.tolist(), price_data.end_timestamps.tolist(), marketprices.tolist())
+
+
+def encode_ndjson_rows(price_data: PriceSeries) -> bytes:
+    """Encode price data as newline delimited json objects, one per price point."""
+    # Json encodes ints and floats with their repr, so this equals encoding each row with the json module.
+    rows = [
+        f'{{"start_timestamp":{start_timestamp},"end_timestamp":{end_timestamp},"marketprice":{marketprice!r}}}\n'
+        for start_timestamp, end_timestamp, marketprice in _iterate_rows(price_data)
+    ]
+    return "".join(rows).encode()
+
+
+def encode_csv_rows(price_data: PriceSeries) -> bytes:
+    """Encode price data as csv rows without a header, one per price point."""
+    rows = [
+        f"{start_timestamp},{end_timestamp},{marketprice!r}\n"
+        for start_timestamp, end_timestamp, marketprice in _iterate_rows(price_data)
+    ]
+    return "".join(rows).encode()
+
+
+def iterate_export(price_chunks: Iterator[PriceSeries], export_format: ExportFormat) -> Iterator[bytes]:
+    """Encode chunks of price data one after another.
+
+    :param price_chunks: Chunks of price data which are only read when the previous chunk was encoded.
+    """
+    if export_format == ExportFormat.CSV:
+        yield CSV_HEADER
+        encode_rows = encode_csv_rows
+    else:
+        encode_rows = encode_ndjson_rows
+
+    for price_chunk in price_chunks:
+        yield encode_rows(price_chunk)
+
+
+async def stream_export(price_chunks: Iterator[PriceSeries], export_format: ExportFormat) -> AsyncIterator[bytes]:
+    """Encode chunks of price data one after another in a threadpool.
+
+    Reading the chunks, which may need to read memory-mapped files, and encoding them doesn't block the event loop.
+
+    :param price_chunks: Chunks of price data which are only read when the previous chunk was sent.
+    """
+    try:
+        async for content in iterate_in_threadpool(iterate_export(price_chunks, export_format)):
+            yield content
+    except Exception as exc:
+        # The response already started, so the client only notices the error by the aborted response.
+        logger.exception(f"Couldn't export price data: {exc}.")
+        raise
@@ -0,0 +1,63 @@
+"""Find runs of consecutive price points which are on or below a value.
+
+Runs are found with a single vectorized pass over the run boundaries instead of grouping price points one by one.
+"""
+from decimal import Decimal
+from typing import Optional
+
+import numpy as np
+
+from awattprice.price_series import PriceSeries
+
+
+def find_runs_below(price_data: PriceSeries, below_value: Decimal, taxed: bool) -> list[dict]:
+    """Find all runs of consecutive price points which are on or below a value.
+
+    Price points are consecutive if one ends when the next starts. Prices are rounded naturally before comparing
+    them like the price below notifications do.
+
+    :param below_value: Value in cent per kWh.
+    :param taxed: If true prices are taxed before comparing to the below value. This doesn't affect the below
+        value.
+    :returns: Runs with their start and end timestamps and number of price points ordered by their start.
+    """
+    if len(price_data) == 0:
+        return []
+
+    order = np.argsort(price_data.start_timestamps, kind="stable")
+    price_data = price_data.select(order)
+    below_mask = price_data.below_mask(below_value, taxed)
+
+    # Each edge lies between two neighbouring price points. Padding with false lets runs touch the outer edges.
+    padded_mask = np.concatenate([[False], below_mask, [False]])
+    below_before_edge = padded_mask[:-1]
+    below_after_edge = padded_mask[1:]
+    connected = price_data.start_timestamps[1:] == price_data.end_timestamps[:-1]
+    edge_breaks = np.concatenate([[True], ~connected, [True]])
+    run_starts = np.flatnonzero(below_after_edge & (~below_before_edge | edge_breaks))
+    run_ends = np.flatnonzero(below_before_edge & (~below_after_edge | edge_breaks))
+
+    runs = [
+        {
+            "start_timestamp": int(price_data.start_timestamps[run_start]),
+            "end_timestamp": int(price_data.end_timestamps[run_end - 1]),
+            "price_points": int(run_end - run_start),
+        }
+        for run_start, run_end in zip(run_starts.tolist(), run_ends.tolist())
+    ]
+    return runs
+
+
+def find_longest_run_below(price_data: PriceSeries, below_value: Decimal, taxed: bool) -> Optional[dict]:
+    """Find the longest run of consecutive price points which are on or below a value.
+
+    If multiple runs are equally long the earliest one is returned. See `find_runs_below` for the parameters.
+
+    :returns None: If no price point is on or below the value.
+    """
+    runs = find_runs_below(price_data, below_value, taxed)
+    if not runs:
+        return None
+
+    longest_run = max(runs, key=lambda run: run["end_timestamp"] - run["start_timestamp"])
+    return longest_run
@@ -0,0 +1,263 @@
+"""Hold price data as arrays instead of one object per price point.
+
+Timestamps are stored as epoch seconds and marketprices as fixed point integers (euro per MWh scaled by
+10 ** price decimal places). All conversions to taxed prices and to cent per kWh are done vectorized and with
+integer arithmetic, so that they round exactly like the conversions of `MarketPrice` do.
+"""
+from decimal import Decimal
+from typing import Optional
+from typing import Sequence
+
+import arrow
+import numpy as np
+
+from arrow import Arrow
+from box import Box
+
+from awattprice import defaults
+from awattprice import utils
+from awattprice.defaults import Region
+
+# Factor by which rounded cent per kWh prices returned by `PriceSeries.ct_kwh` are scaled.
+CT_KWH_SCALE = 10 ** defaults.CENT_KWH_ROUNDING_PLACES
+
+
+class MarketPrice:
+    """Provide extra helper functions next to storing the marketprice."""
+
+    value: Decimal
+    region: Region
+
+    def __init__(self, price: Decimal, region: Region):
+        """Constructor for a new marketprice instance.
+
+        :param value: Price as euro per MWh.
+        :param tax: Multiplier to get the taxed price.
+        """
+        self.value = price
+        self.region = region
+
+    @property
+    def taxed(self) -> Decimal:
+        """Get the taxed price."""
+        if self.region.tax:
+            return self.value * self.region.tax
+        else:
+            return self.value
+
+    def ct_kwh(self, taxed: bool = False, round_: bool = False) -> Decimal:
+        """Convert the price to cent per kWh.
+
+        :param taxed: If set convert the taxed price.
+        :param round: If set round the price naturally before returning.
+        """
+        if taxed:
+            price = self.taxed
+        else:
+            price = self.value
+        ct_kwh_price = utils.euromwh_to_ctkwh(price)
+
+        if round_ is True:
+            ct_kwh_price = utils.round_ctkwh(ct_kwh_price)
+
+        return ct_kwh_price
+
+
+def _as_fraction(value: Decimal) -> tuple[int, int]:
+    """Get the numerator and denominator of a decimal."""
+    sign, digits, exponent = value.as_tuple()
+    numerator = int("".join(map(str, digits)))
+    if sign:
+        numerator = -numerator
+    if exponent >= 0:
+        return numerator * 10 ** exponent, 1
+    return numerator, 10 ** -exponent
+
+
+def _divide_round_half_even(numerators: np.ndarray, denominator: int) -> np.ndarray:
+    """Divide integers and round the quotients half to even like the default decimal context does."""
+    quotients, remainders = np.divmod(numerators, denominator)
+    # Remainders are never negative as the quotients are floored.
+    doubled_remainders = 2 * remainders
+    round_up = (doubled_remainders > denominator) | ((doubled_remainders == denominator) & (quotients % 2 == 1))
+    return quotients + round_up
+
+
+class PriceSeries:
+    """Price points of a region.
+
+    The arrays of a series must not be modified. Series handed out by the price data cache are shared between
+    all callers and may be backed by read-only memory.
+    """
+
+    start_timestamps: np.ndarray
+    end_timestamps: np.ndarray
+    marketprices: np.ndarray
+    price_decimal_places: int
+    region: Region
+
+    def __init__(
+        self,
+        start_timestamps: np.ndarray,
+        end_timestamps: np.ndarray,
+        marketprices: np.ndarray,
+        price_decimal_places: int,
+        region: Region,
+    ):
+        """Constructor for a new price series.
+
+        :param start_timestamps, end_timestamps: Epoch seconds as int64 arrays.
+        :param marketprices: Euro per MWh as int64 fixed point array scaled by 10 ** price_decimal_places.
+        """
+        self.start_timestamps = start_timestamps
+        self.end_timestamps = end_timestamps
+        self.marketprices = marketprices
+        self.price_decimal_places = price_decimal_places
+        self.region = region
+
+    @classmethod
+    def from_points(cls, points: Sequence[Box], region: Region) -> "PriceSeries":
+        """Create a series from price points with arrow timestamps and marketprice instances."""
+        price_decimal_places = defaults.PRICE_DATA_PRICE_DECIMAL_PLACES
+        start_timestamps = np.array([point.start_timestamp.int_timestamp for point in points], dtype=np.int64)
+        end_timestamps = np.array([point.end_timestamp.int_timestamp for point in points], dtype=np.int64)
+        marketprices = np.array(
+            [int(point.marketprice.value.scaleb(price_decimal_places).to_integral_value()) for point in points],
+            dtype=np.int64,
+        )
+        series = cls(start_timestamps, end_timestamps, marketprices, price_decimal_places, region)
+        return series
+
+    def __len__(self) -> int:
+        return len(self.start_timestamps)
+
+    def select(self, selection: np.ndarray) -> "PriceSeries":
+        """Get a new series with the price points selected by a boolean mask or an index array."""
+        series = PriceSeries(
+            self.start_timestamps[selection],
+            self.end_timestamps[selection],
+            self.marketprices[selection],
+            self.price_decimal_places,
+            self.region,
+        )
+        return series
+
+    def window_mask(self, start: Arrow, end: Arrow) -> np.ndarray:
+        """Get a mask of the price points which start on or after start and end on or before end."""
+        mask = (self.start_timestamps >= start.int_timestamp) & (self.end_timestamps <= end.int_timestamp)
+        return mask
+
+    def window(self, start: Arrow, end: Arrow) -> "PriceSeries":
+        """Get the price points which start on or after start and end on or before end."""
+        return self.select(self.window_mask(start, end))
+
+    def berlin_day(self, day: Arrow) -> "PriceSeries":
+        """Get the price points within the Berlin day in which the given time lies."""
+        day_start = day.to(defaults.EUROPE_BERLIN_TIMEZONE).floor("day")
+        day_end = day_start.shift(days=+1)
+        return self.window(day_start, day_end)
+
+    def taxed(self) -> np.ndarray:
+        """Get the taxed marketprices as fixed point array.
+
+        Taxed prices are rounded half to even to the price decimal places of this series.
+        """
+        if not self.region.tax:
+            return self.marketprices
+        tax_numerator, tax_denominator = _as_fraction(self.region.tax)
+        return _divide_round_half_even(self.marketprices * tax_numerator, tax_denominator)
+
+    def ct_kwh(self, taxed: bool = False) -> np.ndarray:
+        """Get the marketprices as cent per kWh rounded naturally.
+
+        The values equal `MarketPrice.ct_kwh(taxed, round_=True)` of each price point.
+
+        :param taxed: If set convert the taxed prices.
+        :returns: Int64 array of the rounded prices scaled by `CT_KWH_SCALE`.
+        """
+        numerators = self.marketprices * CT_KWH_SCALE
+        conversion_numerator, conversion_denominator = _as_fraction(defaults.EURMWH_TO_CENTWKWH)
+        numerators *= conversion_numerator
+        denominator = conversion_denominator * 10 ** self.price_decimal_places
+        if taxed and self.region.tax:
+            tax_numerator, tax_denominator = _as_fraction(self.region.tax)
+            numerators *= tax_numerator
+            denominator *= tax_denominator
+        return _divide_round_half_even(numerators, denominator)
+
+    def below_mask(self, below_value: Decimal, taxed: bool) -> np.ndarray:
+        """Get a mask of the price points which are on or below a value after rounding them naturally.
+
+        :param below_value: Value in cent per kWh.
+        :param taxed: If true prices are taxed before comparing to the below value. This doesn't affect the
+            below value.
+        """
+        # The rounded prices are whole multiples of 1 / CT_KWH_SCALE, so flooring the scaled value is exact.
+        scaled_below_value = int((Decimal(below_value) * CT_KWH_SCALE).to_integral_value(rounding="ROUND_FLOOR"))
+        mask = self.ct_kwh(taxed) <= scaled_below_value
+        return mask
+
+    def argmin(self) -> Optional[int]:
+        """Get the index of the lowest marketprice. None if the series is empty."""
+        if len(self) == 0:
+            return None
+        return int(np.argmin(self.marketprices))
+
+    def argmax(self) -> Optional[int]:
+        """Get the index of the highest marketprice. None if the series is empty."""
+        if len(self) == 0:
+            return None
+        return int(np.argmax(self.marketprices))
+
+    def min(self) -> Optional[MarketPrice]:
+        """Get the lowest marketprice. None if the series is empty."""
+        index = self.argmin()
+        if index is None:
+            return None
+        return self.marketprice(index)
+
+    def max(self) -> Optional[MarketPrice]:
+        """Get the highest marketprice. None if the series is empty."""
+        index = self.argmax()
+        if index is None:
+            return None
+        return self.marketprice(index)
+
+    def latest_end_timestamp(self) -> Optional[int]:
+        """Get the latest end timestamp as epoch seconds. None if the series is empty."""
+        if len(self) == 0:
+            return None
+        return int(self.end_timestamps.max())
+
+    def latest_end_time(self) -> Optional[Arrow]:
+        """Get the latest end time in the Berlin timezone. None if the series is empty."""
+        latest_end_timestamp = self.latest_end_timestamp()
+        if latest_end_timestamp is None:
+            return None
+        return arrow.get(latest_end_timestamp).to(defaults.EUROPE_BERLIN_TIMEZONE)
+
+    def marketprice(self, index: int) -> MarketPrice:
+        """Get the marketprice of a single price point."""
+        value = Decimal(int(self.marketprices[index])).scaleb(-self.price_decimal_places)
+        return MarketPrice(value, self.region)
+
+    def point(self, index: int) -> Box:
+        """Get a single price point with arrow timestamps in the Berlin timezone and a marketprice instance.
+
+        Use this only for code which handles a few single price points.
+        """
+        point = Box()
+        point.start_timestamp = arrow.get(int(self.start_timestamps[index])).to(defaults.EUROPE_BERLIN_TIMEZONE)
+        point.end_timestamp = arrow.get(int(self.end_timestamps[index])).to(defaults.EUROPE_BERLIN_TIMEZONE)
+        point.marketprice = self.marketprice(index)
+        return point
+
+    def points(self, selection: Optional[np.ndarray] = None) -> list[Box]:
+        """Get price points as returned by `point`.
+
+        :param selection: Boolean mask or index array of the points to get. All points if none.
+        """
+        indices = np.arange(len(self))
+        if selection is not None:
+            indices = indices[selection]
+        return [self.point(index) for index in indices]
@@ -0,0 +1,214 @@
+"""Read and write price data files in a compact columnar format.
+
+A price data file consists of a fixed size header followed by three int64 columns of equal length. All values
+are stored little endian.
+
+    header:   magic (4 bytes), format version (uint16), price decimal places (uint16),
+              number of price points (uint64), generation (uint64), 8 reserved bytes
+    columns:  start timestamps as epoch seconds, end timestamps as epoch seconds,
+              marketprices as fixed point integers scaled by 10 ** price decimal places
+
+Files are memory-mapped read-only when read. The columns are handed out as views into the mapping so that
+reading a file doesn't copy its content.
+
+Price data files are published as immutable versioned files. The price data file itself is a symlink to the
+current version which is swapped atomically. A published version is never modified so that readers don't need
+any locking.
+"""
+import mmap
+import os
+import struct
+import sys
+
+from array import array
+from pathlib import Path
+from typing import Optional
+from typing import Sequence
+
+from awattprice.exceptions import PriceFileFormatError
+from awattprice.utils import sync_directory
+from awattprice.utils import write_file_atomically
+
+MAGIC = b"AWPD"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<4sHHQQ8x")
+COLUMNS_COUNT = 3
+INT64_SIZE = 8
+
+
+class PriceColumns:
+    """Columns of a price data file."""
+
+    start_timestamps: memoryview
+    end_timestamps: memoryview
+    marketprices: memoryview
+    price_decimal_places: int
+    generation: int
+
+    def __init__(
+        self,
+        start_timestamps: memoryview,
+        end_timestamps: memoryview,
+        marketprices: memoryview,
+        price_decimal_places: int,
+        generation: int,
+    ):
+        self.start_timestamps = start_timestamps
+        self.end_timestamps = end_timestamps
+        self.marketprices = marketprices
+        self.price_decimal_places = price_decimal_places
+        self.generation = generation
+
+    def __len__(self) -> int:
+        return len(self.start_timestamps)
+
+
+def _int64_column(values: Sequence[int]) -> bytes:
+    """Pack integers as a little endian int64 column."""
+    column = array("q", values)
+    if sys.byteorder != "little":
+        column.byteswap()
+    return column.tobytes()
+
+
+def encode_price_columns(
+    start_timestamps: Sequence[int],
+    end_timestamps: Sequence[int],
+    marketprices: Sequence[int],
+    price_decimal_places: int,
+    generation: int,
+) -> bytes:
+    """Encode price columns to the content of a price data file.
+
+    :param marketprices: Fixed point prices scaled by 10 ** price_decimal_places.
+    :param generation: Number identifying this version of the price data. Should increase with each version.
+    """
+    points_count = len(start_timestamps)
+    if not len(end_timestamps) == len(marketprices) == points_count:
+        raise ValueError("All price columns must have the same length.")
+
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, price_decimal_places, points_count, generation)
+    columns = [_int64_column(column) for column in (start_timestamps, end_timestamps, marketprices)]
+    content = b"".join([header, *columns])
+    return content
+
+
+def decode_price_columns(buffer) -> PriceColumns:
+    """Decode the content of a price data file.
+
+    On little endian machines the columns are views into the buffer and don't copy it.
+
+    :raises PriceFileFormatError: If the buffer doesn't hold a valid price data file.
+    """
+    buffer = memoryview(buffer)
+    if len(buffer) < HEADER.size:
+        raise PriceFileFormatError(f"Price data is shorter than its header: {len(buffer)} bytes.")
+
+    magic, format_version, price_decimal_places, points_count, generation = HEADER.unpack_from(buffer)
+    if magic != MAGIC:
+        raise PriceFileFormatError(f"Price data has an unknown magic number: {magic!r}.")
+    if format_version != FORMAT_VERSION:
+        raise PriceFileFormatError(f"Price data has an unsupported format version: {format_version}.")
+
+    column_size = points_count * INT64_SIZE
+    expected_size = HEADER.size + COLUMNS_COUNT * column_size
+    if len(buffer) < expected_size:
+        raise PriceFileFormatError(f"Price data is truncated: {len(buffer)} of {expected_size} bytes.")
+
+    columns = []
+    for column_index in range(COLUMNS_COUNT):
+        column_start = HEADER.size + column_index * column_size
+        column = buffer[column_start : column_start + column_size]
+        if sys.byteorder != "little":
+            swapped_column = array("q", column.tobytes())
+            swapped_column.byteswap()
+            column = memoryview(swapped_column)
+        columns.append(column.cast("q"))
+
+    price_columns = PriceColumns(*columns, price_decimal_places, generation)
+    return price_columns
+
+
+def read_price_file(file_path: Path) -> Optional[PriceColumns]:
+    """Memory-map a price data file read-only and decode it.
+
+    The mapping stays open as long as any of the returned columns is referenced.
+
+    :returns None: If the file doesn't exist or is empty.
+    :raises PriceFileFormatError: If the file isn't a valid price data file.
+    """
+    try:
+        file = open(file_path, "rb")
+    except FileNotFoundError:
+        return None
+
+    with file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return None
+        mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    price_columns = decode_price_columns(mapping)
+    return price_columns
+
+
+def get_version_path(file_path: Path, generation: int) -> Path:
+    """Get the path of the versioned file which holds the price data of a generation."""
+    version_path = file_path.with_name(f"{file_path.name}.{generation}")
+    return version_path
+
+
+def list_version_paths(file_path: Path) -> list[tuple[int, Path]]:
+    """List all versioned files of a price data file.
+
+    :returns: Tuples of the generation and the path of each versioned file, oldest generation first.
+    """
+    prefix = f"{file_path.name}."
+    version_paths = []
+    for path in file_path.parent.glob(f"{file_path.name}.*"):
+        generation = path.name[len(prefix) :]
+        # Skip lock files and temporary files.
+        if generation.isdigit():
+            version_paths.append((int(generation), path))
+    version_paths.sort()
+    return version_paths
+
+
+def remove_old_versions(file_path: Path, kept_versions: int):
+    """Remove all but the newest versioned files of a price data file.
+
+    Processes which still have a removed version mapped keep on reading it until they drop their mapping.
+
+    :param kept_versions: Number of newest versioned files to keep.
+    """
+    version_paths = list_version_paths(file_path)
+    for _, version_path in version_paths[: max(len(version_paths) - kept_versions, 0)]:
+        version_path.unlink(missing_ok=True)
+
+
+def publish_price_file(file_path: Path, content: bytes, generation: int, kept_versions: int):
+    """Publish the content of a price data file as a new version.
+
+    The content is written and synced to a new versioned file next to the price data file. Afterwards the price
+    data file, which is a symlink, is atomically replaced by a symlink to the new version. Readers opening the
+    price data file thus always see either the complete old or the complete new version and never need to wait
+    for the writer. Old versions are removed afterwards.
+
+    Must only be called by one writer at a time.
+
+    :param kept_versions: Number of newest versions to keep. Should be at least two so that readers which
+        resolved the symlink just before it was replaced can still open the version it pointed to.
+    """
+    version_path = get_version_path(file_path, generation)
+    write_file_atomically(version_path, content)
+
+    temporary_link_path = file_path.with_name(f"{file_path.name}.{os.getpid()}.tmp")
+    temporary_link_path.unlink(missing_ok=True)
+    try:
+        os.symlink(version_path.name, temporary_link_path)
+        os.replace(temporary_link_path, file_path)
+    except BaseException:
+        temporary_link_path.unlink(missing_ok=True)
+        raise
+    sync_directory(file_path.parent)
+
+    remove_old_versions(file_path, kept_versions)
@@ -2,21 +2,21 @@
 import asyncio
 import json
 import pickle
+import time
 
 from copy import deepcopy
 from decimal import Decimal
+from pathlib import Path
 from typing import Optional
 from typing import Union
 
 import arrow
-import filelock
 import httpx
-import jsonschema
+import numpy as np
 
 from aiofile import async_open
 from arrow import Arrow
 from box import Box
-from box import BoxList
 from fastapi import HTTPException
 from liteconfig import Config
 from loguru import logger
@@ -31,76 +31,172 @@ from tenacity import (
 
 from awattprice import defaults
 from awattprice import exceptions
+from awattprice import price_archive
+from awattprice import price_store
+from awattprice import responses
+from awattprice import shared_price_data
 from awattprice import utils
+from awattprice import validation
 from awattprice.defaults import Region
-from awattprice.utils import ExtendedFileLock
+# Price data pickled by previous versions references the marketprice class through this module.
+from awattprice.price_series import MarketPrice
+from awattprice.price_series import PriceSeries
+from awattprice.price_store import PriceColumns
+from awattprice.snapshots import get_file_version
+from awattprice.snapshots import Snapshot
+from awattprice.snapshots import SnapshotCache
+from awattprice.utils import AsyncFileLock
+from awattprice.utils import LockWaitStatistics
 from awattprice.utils import log_attempts
+from awattprice.utils import SingleFlight
 
 
-class MarketPrice:
-    """Provide extra helper functions next to storing the marketprice."""
+# Decoded stored data and last update times of this process. Data handed out from these caches is shared
+# and must not be modified.
+stored_data_snapshots = SnapshotCache()
+last_update_time_snapshots = SnapshotCache()
+# Refreshes of the price data running in this process. Concurrent refreshes of a region share one download.
+price_refreshes = SingleFlight()
+# Wait durations when acquiring the refresh locks in this process.
+refresh_lock_statistics = LockWaitStatistics()
 
-    value: Decimal
-    region: Region
 
-    def __init__(self, price: Decimal, region: Region):
-        """Constructor for a new marketprice instance.
+def get_stored_data_path(region: Region, config: Config) -> Path:
+    """Get the path of the file storing the price data of a region."""
+    file_dir = config.paths.price_data_dir
+    file_name = defaults.PRICE_DATA_FILE_NAME.format(region.value.lower())
+    file_path = file_dir / file_name
+    return file_path
 
-        :param value: Price as euro per MWh.
-        :param tax: Multiplier to get the taxed price.
-        """
-        self.value = price
-        self.region = region
 
-    @property
-    def taxed(self) -> Decimal:
-        """Get the taxed price."""
-        if self.region.tax:
-            return self.value * self.region.tax
-        else:
-            return self.value
+def get_last_update_time_path(region: Region, config: Config) -> Path:
+    """Get the path of the file storing the last update time of the price data of a region."""
+    file_dir = config.paths.price_data_dir
+    file_name = defaults.PRICE_DATA_UPDATE_TS_FILE_NAME.format(region.name.lower())
+    file_path = file_dir / file_name
+    return file_path
+
 
-    def ct_kwh(self, taxed: bool = False, round_: bool = False) -> Decimal:
-        """Convert the price to cent per kWh.
+def get_cache_statistics() -> dict:
+    """Get the hit and miss counters of the in-process price data caches."""
+    statistics = {
+        "stored_data": stored_data_snapshots.statistics(),
+        "last_update_time": last_update_time_snapshots.statistics(),
+    }
+    return statistics
 
-        :param taxed: If set convert the taxed price.
-        :param round: If set round the price naturally before returning.
-        """
-        if taxed:
-            price = self.taxed
-        else:
-            price = self.value
-        ct_kwh_price = utils.euromwh_to_ctkwh(price)
 
-        if round_ is True:
-            ct_kwh_price = utils.round_ctkwh(ct_kwh_price)
+def get_refresh_statistics() -> dict:
+    """Get counters describing how many price data refreshes of this process were coalesced."""
+    return price_refreshes.statistics()
 
-        return ct_kwh_price
 
+def get_refresh_lock_statistics() -> dict:
+    """Get counters and wait durations of acquiring the refresh locks in this process."""
+    return refresh_lock_statistics.statistics()
 
-async def get_stored_data(region: Region, config: Config) -> Optional[Box]:
-    """Get locally cached price data.
 
-    :returns: Price data wrapped as a Box. If file not found returns None.
+def encode_price_data(data: PriceSeries, generation: int) -> bytes:
+    """Encode price data in the app internal format to the content of a price data file."""
+    encoded_data = price_store.encode_price_columns(
+        data.start_timestamps.tolist(),
+        data.end_timestamps.tolist(),
+        data.marketprices.tolist(),
+        data.price_decimal_places,
+        generation,
+    )
+    return encoded_data
+
+
+def decode_price_data(price_columns: PriceColumns, region: Region) -> PriceSeries:
+    """Decode the columns of a price data file to the app internal format.
+
+    The arrays of the returned series are read-only views into the columns and don't copy them.
     """
-    file_dir = config.paths.price_data_dir
-    file_name = defaults.PRICE_DATA_FILE_NAME.format(region.value.lower())
-    file_path = file_dir / file_name
+    data = PriceSeries(
+        np.frombuffer(price_columns.start_timestamps, dtype=np.int64),
+        np.frombuffer(price_columns.end_timestamps, dtype=np.int64),
+        np.frombuffer(price_columns.marketprices, dtype=np.int64),
+        price_columns.price_decimal_places,
+        region,
+    )
+    return data
 
-    try:
-        async with async_open(file_path, "rb") as file:
-            unpickled_data = await file.read()
-    except FileNotFoundError as exc:
-        logger.debug(f"No stored price data found: {exc}.")
+
+def get_shared_snapshot(region: Region, config: Config) -> Optional[Snapshot]:
+    """Get a snapshot of the price data published to shared memory by the process which stored it.
+
+    The price data is decoded from the read-only mapped published content without copying it, so all processes
+    share one copy of it. As long as the published sequence didn't change the snapshot is reused.
+
+    :returns: Snapshot with the price data as price series. None if there is no usable published price data.
+    """
+    sequence = shared_price_data.read_sequence(region, config)
+    if sequence is None:
         return None
+    snapshot = stored_data_snapshots.get(region, f"shared-{sequence}")
+    if snapshot is not None:
+        return snapshot
 
-    if len(unpickled_data) == 0:
-        logger.debug("Stored price data found, but is empty.")
+    published = shared_price_data.read(region, config)
+    if published is None:
         return None
+    sequence, content = published
 
-    data = pickle.loads(unpickled_data)
+    price_columns = price_store.decode_price_columns(content)
+    data = decode_price_data(price_columns, region)
+    snapshot = Snapshot(data, f"shared-{sequence}")
+    stored_data_snapshots.put(region, snapshot)
 
-    return data
+    return snapshot
+
+
+async def get_stored_snapshot(region: Region, config: Config) -> Optional[Snapshot]:
+    """Get a snapshot of the locally cached price data.
+
+    The price data is taken from shared memory if it was published there. Otherwise it is read from the file.
+    In both cases it is only decoded again if it changed.
+
+    :returns: Snapshot with the price data as price series. If file not found returns None.
+    """
+    snapshot = get_shared_snapshot(region, config)
+    if snapshot is not None:
+        await prepare_snapshot_response(snapshot)
+        return snapshot
+
+    file_path = get_stored_data_path(region, config)
+
+    version = get_file_version(file_path)
+    if version is None:
+        logger.debug(f"No stored price data found at {file_path}.")
+        return None
+    snapshot = stored_data_snapshots.get(region, version)
+    if snapshot is not None:
+        return snapshot
+
+    price_columns = price_store.read_price_file(file_path)
+    if price_columns is None:
+        logger.debug("Stored price data not found or empty.")
+        return None
+
+    data = decode_price_data(price_columns, region)
+    snapshot = Snapshot(data, version)
+    await prepare_snapshot_response(snapshot)
+    stored_data_snapshots.put(region, snapshot)
+
+    return snapshot
+
+
+async def get_stored_data(region: Region, config: Config) -> Optional[PriceSeries]:
+    """Get locally cached price data.
+
+    :returns: Price data as price series. If file not found returns None.
+    """
+    snapshot = await get_stored_snapshot(region, config)
+    if snapshot is None:
+        return None
+
+    return snapshot.data
 
 
 async def get_last_update_time(region: Region, config: Config) -> Optional[Arrow]:
@@ -109,9 +205,14 @@ async def get_last_update_time(region: Region, config: Config) -> Optional[Arrow
     :returns None: If file not found.
     :returns arrow.Arrow: Last update time.
     """
-    file_dir = config.paths.price_data_dir
-    file_name = defaults.PRICE_DATA_UPDATE_TS_FILE_NAME.format(region.name.lower())
-    file_path = file_dir / file_name
+    file_path = get_last_update_time_path(region, config)
+
+    version = get_file_version(file_path)
+    if version is None:
+        return None
+    snapshot = last_update_time_snapshots.get(region, version)
+    if snapshot is not None:
+        return snapshot.data
 
     try:
         async with async_open(file_path, "r") as file:
@@ -121,11 +222,12 @@ async def get_last_update_time(region: Region, config: Config) -> Optional[Arrow
 
     timestamp = int(file_content)
     time = arrow.get(timestamp)
+    last_update_time_snapshots.put(region, Snapshot(time, version))
 
     return time
 
 
-def check_update_data(data: Optional[Box], last_update_time: Optional[Arrow]) -> bool:
+def check_update_data(data: Optional[PriceSeries], last_update_time: Optional[Arrow]) -> bool:
     """Check if price data is due for update.
 
     :param last_update_time: Time data was last polled from the awattar api.
@@ -143,14 +245,16 @@ def check_update_data(data: Optional[Box], last_update_time: Optional[Arrow]) ->
             logger.debug(f"AWATTar cooldown has {seconds_remaining}s remaining.")
             return False
 
+    latest_price_end_berlin = data.latest_end_time()
+    if latest_price_end_berlin is None:
+        return True
+
     midnight_tomorrow_berlin = now_berlin.floor("day").shift(days=+2)
-    latest_price = max(data.prices, key=lambda point: point.end_timestamp)
-    if latest_price.end_timestamp >= midnight_tomorrow_berlin:
+    if latest_price_end_berlin >= midnight_tomorrow_berlin:
         logger.debug("Price points still available until tomorrow midnight.")
         return False
 
     midnight_today_berlin = now_berlin.floor("day").shift(days=+1)
-    latest_price_end_berlin = latest_price.end_timestamp.to(defaults.EUROPE_BERLIN_TIMEZONE)
     midnight_today_latest_price_end_diff = midnight_today_berlin - latest_price_end_berlin
     if midnight_today_latest_price_end_diff.total_seconds() >= 3600:
         return True
@@ -162,42 +266,58 @@ def check_update_data(data: Optional[Box], last_update_time: Optional[Arrow]) ->
     return True
 
 
-def get_data_refresh_lock(region: Region, config: Config) -> ExtendedFileLock:
+def get_next_update_time(data: PriceSeries) -> Optional[Arrow]:
+    """Get the time from which on the price data is due for an update by the rules of `check_update_data`.
+
+    The aWATTar cooldown isn't considered as it only delays updates of data which is already due.
+
+    :returns None: If the price data is empty.
+    """
+    latest_price_end_berlin = data.latest_end_time()
+    if latest_price_end_berlin is None:
+        return None
+
+    # First midnight at which the price points don't reach until the midnight after tomorrow anymore.
+    due_day_start = latest_price_end_berlin.shift(days=-2).floor("day").shift(days=+1)
+    midnight_due_day = due_day_start.shift(days=+1)
+    if (midnight_due_day - latest_price_end_berlin).total_seconds() >= 3600:
+        return due_day_start
+
+    return due_day_start.replace(hour=defaults.AWATTAR_UPDATE_HOUR)
+
+
+def get_data_refresh_lock(region: Region, config: Config) -> AsyncFileLock:
     """Get file lock used when refreshing price data."""
     lock_dir = config.paths.price_data_dir
     lock_file_name = defaults.PRICE_DATA_FILE_NAME.format(region.value.lower()) + ".lock"
     lock_file_path = lock_dir / lock_file_name
-    lock = ExtendedFileLock(lock_file_path)
+    lock = AsyncFileLock(lock_file_path, statistics=refresh_lock_statistics)
     return lock
 
 
 async def acquire_refresh_lock_immediate(
-    lock: ExtendedFileLock, timeout: float = defaults.PRICE_DATA_REFRESH_LOCK_TIMEOUT
+    lock: AsyncFileLock, timeout: float = defaults.PRICE_DATA_REFRESH_LOCK_TIMEOUT
 ) -> bool:
     """Acquire the refresh lock either immediately or with waiting.
 
+    Waiting doesn't block the event loop or any executor thread.
+
     :returns: As soon as lock was acquired.
     :returns True: Acquired lock immediately.
     :returns False: Acquired lock after waiting.
-    :raises filelock.Timeout: Lock couldn't be acquired - even after waiting.
+    :raises LockTimeout: Lock couldn't be acquired - even after waiting.
     """
-    async_acquire = utils.async_wrap(lock.acquire)
     try:
-        await async_acquire(timeout=0)
-    except filelock.Timeout:
-        # Lock couldn't be acquired immediately.
-        pass
-    else:
-        logger.debug("Lock acquired immediately.")
-        return True
-
-    try:
-        await async_acquire(timeout=timeout)
-    except filelock.Timeout as exc:
+        waited = await lock.acquire(timeout=timeout)
+    except exceptions.LockTimeout as exc:
         logger.exception(f"Lock couldn't be acquired at all: {exc}.")
         raise
+
+    if waited == 0:
+        logger.debug("Lock acquired immediately.")
+        return True
     else:
-        logger.debug("Lock acquired after waiting.")
+        logger.debug(f"Lock acquired after waiting {waited:.3f}s.")
         return False
 
 
@@ -250,65 +370,128 @@ async def download_data(region: Region, config: Config) -> Optional[Box]:
 
 async def update_last_update_time(region: Region, config: Config):
     """Set the time the price data was updated last to the current time."""
-    file_dir = config.paths.price_data_dir
-    file_name = defaults.PRICE_DATA_UPDATE_TS_FILE_NAME.format(region.name.lower())
-    file_path = file_dir / file_name
+    file_path = get_last_update_time_path(region, config)
 
     now = arrow.now()
     now_string = str(now.int_timestamp)
-    async with async_open(file_path, "w") as file:
-        await file.write(now_string)
+    last_update_time_snapshots.invalidate(region)
+    async_write_file_atomically = utils.async_wrap(utils.write_file_atomically)
+    await async_write_file_atomically(file_path, now_string.encode())
 
 
-def parse_downloaded_data(region: Region, data: Box) -> Box:
+def parse_downloaded_data(region: Region, data: Box) -> PriceSeries:
     """Parse the downloaded price data into the app internal format."""
-    new_data = Box()
-    new_data.prices = BoxList()
-    for point in data.data:
-        new_point = Box()
-        start_timestamp = point.start_timestamp / defaults.SEC_TO_MILLISEC
-        new_point.start_timestamp = arrow.get(start_timestamp).to(defaults.EUROPE_BERLIN_TIMEZONE)
-        end_timestamp = point.end_timestamp / defaults.SEC_TO_MILLISEC
-        new_point.end_timestamp = arrow.get(end_timestamp).to(defaults.EUROPE_BERLIN_TIMEZONE)
-        marketprice = Decimal(str(point.marketprice))
-        new_point.marketprice = MarketPrice(marketprice, region)
-        new_data.prices.append(new_point)
-
+    price_decimal_places = defaults.PRICE_DATA_PRICE_DECIMAL_PLACES
+    start_timestamps = [int(point.start_timestamp) // defaults.SEC_TO_MILLISEC for point in data.data]
+    end_timestamps = [int(point.end_timestamp) // defaults.SEC_TO_MILLISEC for point in data.data]
+    marketprices = [
+        int(Decimal(str(point.marketprice)).scaleb(price_decimal_places).to_integral_value())
+        for point in data.data
+    ]
+
+    new_data = PriceSeries(
+        np.array(start_timestamps, dtype=np.int64),
+        np.array(end_timestamps, dtype=np.int64),
+        np.array(marketprices, dtype=np.int64),
+        price_decimal_places,
+        region,
+    )
     return new_data
 
 
-def check_data_new(old_data: Optional[Box], new_data: Box) -> bool:
+def check_data_new(old_data: Optional[PriceSeries], new_data: PriceSeries) -> bool:
     """Check if new price points were added relative to the max price point of the old price data."""
+    max_end_new = new_data.latest_end_timestamp()
+    if max_end_new is None:
+        return False
     if old_data is None:
         return True
 
-    max_end_compare_key = lambda point: point.end_timestamp
-    max_end_old = max(old_data.prices, key=max_end_compare_key)
-    max_end_new = max(new_data.prices, key=max_end_compare_key)
-
-    if max_end_new.end_timestamp > max_end_old.end_timestamp:
+    max_end_old = old_data.latest_end_timestamp()
+    if max_end_old is None or max_end_new > max_end_old:
         return True
     else:
         return False
 
 
-async def store_data(data: Box, region: Region, config: Config):
-    """Store new price data to the filesystem."""
-    store_dir = config.paths.price_data_dir
-    file_name = defaults.PRICE_DATA_FILE_NAME.format(region.value.lower())
-    file_path = store_dir / file_name
+async def store_data(data: PriceSeries, region: Region, config: Config) -> Snapshot:
+    """Store new price data to the filesystem and publish it to all processes through shared memory.
 
-    pickled_data = pickle.dumps(data)
+    The stored data replaces the in-process snapshot of the region. It must not be modified afterwards.
+
+    :returns: Snapshot of the stored data.
+    """
+    file_path = get_stored_data_path(region, config)
+
+    generation = time.time_ns()
+    encoded_data = encode_price_data(data, generation)
 
     logger.info(f"Storing aWATTar {region.value} price data to {file_path}.")
-    async with async_open(file_path, "wb") as file:
-        await file.write(pickled_data)
+    stored_data_snapshots.invalidate(region)
+    # Until the new price data is published, readers must not prefer the old published data over the new file.
+    shared_price_data.invalidate(region, config)
+    async_publish_price_file = utils.async_wrap(price_store.publish_price_file)
+    await async_publish_price_file(file_path, encoded_data, generation, defaults.PRICE_DATA_KEPT_VERSIONS)
+
+    try:
+        async_archive_prices = utils.async_wrap(price_archive.archive_prices)
+        await async_archive_prices(data, region, config)
+    except Exception as exc:
+        logger.exception(f"Couldn't archive {region.name} price data: {exc}.")
+        # The archive only keeps the history. Storing the current price data must not fail because of it.
+
+    try:
+        sequence = shared_price_data.publish(region, config, encoded_data)
+    except Exception as exc:
+        # The content was invalidated before, so readers use the new price data file.
+        logger.exception(f"Couldn't publish {region.name} price data to shared memory: {exc}.")
+        sequence = None
+    if sequence is not None:
+        version = f"shared-{sequence}"
+    else:
+        version = get_file_version(file_path)
+    snapshot = Snapshot(data, version)
+    await prepare_snapshot_response(snapshot)
+    if version is not None:
+        stored_data_snapshots.put(region, snapshot)
+
+    return snapshot
+
 
+async def convert_pickled_data(region: Region, config: Config) -> bool:
+    """Convert the price data of a region pickled by previous versions to the current file format.
+
+    The pickled file is kept. Existing price data in the current format is replaced.
+
+    :returns: True if pickled data was converted, false if there was no pickled data.
+    """
+    file_name = defaults.PRICE_DATA_PICKLE_FILE_NAME.format(region.value.lower())
+    pickle_file_path = config.paths.price_data_dir / file_name
+
+    try:
+        async with async_open(pickle_file_path, "rb") as file:
+            pickled_data = await file.read()
+    except FileNotFoundError:
+        logger.debug(f"No pickled {region.name} price data found at {pickle_file_path}.")
+        return False
+
+    if len(pickled_data) == 0:
+        logger.debug(f"Pickled {region.name} price data at {pickle_file_path} is empty.")
+        return False
 
-async def get_latest_new_prices(stored_data: None, region: Region, config: Config) -> Optional[Box]:
+    pickled_data = pickle.loads(pickled_data)
+    data = PriceSeries.from_points(pickled_data.prices, region)
+    await store_data(data, region, config)
+
+    return True
+
+
+async def get_latest_new_prices(
+    stored_data: Optional[PriceSeries], region: Region, config: Config
+) -> Optional[Snapshot]:
     """Download the latest new prices.
 
-    :returns downloaded price data: If all went well.
+    :returns snapshot of the downloaded price data: If all went well.
     :returns None: There are no latest new prices.
     """
     refresh_lock = get_data_refresh_lock(region, config)
@@ -316,7 +499,7 @@ async def get_latest_new_prices(stored_data: None, region: Region, config: Confi
 
     # See 'energy_prices.get' doc for an explanation of these update steps.
     if could_acquire_immediately:
-        with refresh_lock.context(acquire=False):
+        try:
             new_data = await download_data(region, config)
             if new_data is None:
                 return None
@@ -325,7 +508,7 @@ async def get_latest_new_prices(stored_data: None, region: Region, config: Confi
             except Exception as exc:
                 logger.exception(f"Couldn't write last update time: {exc}.")
                 # Not ideal, but also not essential to provide the latest new prices.
-            jsonschema.validate(new_data, defaults.AWATTAR_API_PRICE_DATA_SCHEMA)
+            validation.validate(new_data, defaults.AWATTAR_API_PRICE_DATA_SCHEMA)
             new_data = parse_downloaded_data(region, new_data)
             data_is_new = check_data_new(stored_data, new_data)
             if not data_is_new:
@@ -333,68 +516,161 @@ async def get_latest_new_prices(stored_data: None, region: Region, config: Confi
                 return None
             else:
                 logger.debug(f"Got fresh new data for region {region.name}.")
-            await store_data(new_data, region, config)
-            latest_prices = new_data
+            latest_prices = await store_data(new_data, region, config)
+        finally:
+            refresh_lock.release()
     else:
         refresh_lock.release()
-        latest_prices = await get_stored_data(region, config)
+        latest_prices = await get_stored_snapshot(region, config)
 
     return latest_prices
 
 
-async def get_current_prices(region: Region, config: Config, fall_back=False) -> Optional[dict]:
-    """Get the currently up to date price data.
+async def get_stored_state(region: Region, config: Config) -> tuple[Optional[Snapshot], Optional[Arrow]]:
+    """Concurrently get the stored price data snapshot and the last update time of a region.
 
-    :param fall_back: If true function will fall back to the stored data in certain situations when an
-        error retrieving the actual current prices occurrs. If false none will be returned in such cases.
+    :returns: Tuple of the stored snapshot and the last update time. Each of them might be none.
+    :raises Exception: If the stored price data couldn't be read.
     """
-    stored_data, last_update_time = await asyncio.gather(
-        get_stored_data(region, config),
+    stored_snapshot, last_update_time = await asyncio.gather(
+        get_stored_snapshot(region, config),
         get_last_update_time(region, config),
         return_exceptions=True,
     )
-    if isinstance(stored_data, Exception):
-        logger.exception(f"Couldn't get stored {region.name} data: {stored_data}.")
-        return None
+    if isinstance(stored_snapshot, Exception):
+        raise stored_snapshot
     if isinstance(last_update_time, Exception):
         logger.exception(
             f"Couldn't get the {region.name} last update time and thus will assume it is none: {last_update_time}."
         )
         last_update_time = None
 
+    return stored_snapshot, last_update_time
+
+
+async def refresh_prices(region: Region, config: Config) -> Optional[Snapshot]:
+    """Download and store the latest prices if the stored price data is due for an update.
+
+    :returns snapshot of the new price data: If new prices were stored or another process stored them while
+        waiting for the refresh lock.
+    :returns None: If the stored price data isn't due for an update or there are no latest new prices.
+    :raises Exception: If reading the stored data or getting the latest new prices failed.
+    """
+    stored_snapshot, last_update_time = await get_stored_state(region, config)
+    stored_data = stored_snapshot.data if stored_snapshot is not None else None
+
     do_update_data = check_update_data(stored_data, last_update_time)
-    price_data = None
-    if do_update_data:
-        try:
-            price_data = await get_latest_new_prices(stored_data, region, config)
-        except Exception as exc:
-            logger.exception(f"Couldn't get latest new {region.name} prices: {exc}.")
-            if not fall_back:
-                return None
-            price_data = stored_data
-        else:
-            if price_data is None:
-                logger.debug(f"No latest new price data for region {region.name} prices.")
-                if not fall_back:
-                    return None
-                price_data = stored_data
-    else:
+    if not do_update_data:
         logger.debug(f"Local {region.name} prices still up to date.")
-        price_data = stored_data
+        return None
+
+    # Only one coroutine per process and region downloads new prices and touches the refresh lock.
+    snapshot = await price_refreshes.run(region, lambda: get_latest_new_prices(stored_data, region, config))
+    if snapshot is None:
+        logger.debug(f"No latest new price data for region {region.name} prices.")
 
-    return price_data
+    return snapshot
 
 
-def parse_to_response_data(price_data: Box) -> Box:
+async def get_current_snapshot(region: Region, config: Config, fall_back=False) -> Optional[Snapshot]:
+    """Get a snapshot of the locally stored price data.
+
+    This never downloads prices. The stored price data is kept up to date by `refresh_prices`, which the web
+    app runs in the background (see the `scheduler` module).
+
+    :param fall_back: If true the stored data is returned even if it is due for an update. If false none will
+        be returned in such cases.
+    """
+    try:
+        stored_snapshot, last_update_time = await get_stored_state(region, config)
+    except Exception as exc:
+        logger.exception(f"Couldn't get stored {region.name} data: {exc}.")
+        return None
+
+    if stored_snapshot is None:
+        return None
+
+    if not fall_back and check_update_data(stored_snapshot.data, last_update_time):
+        logger.debug(f"Local {region.name} prices are due for an update.")
+        return None
+
+    return stored_snapshot
+
+
+async def get_current_prices(region: Region, config: Config, fall_back=False) -> Optional[PriceSeries]:
+    """Get the currently up to date price data.
+
+    The returned price data is shared with the in-process price data cache and must not be modified.
+
+    :param fall_back: See `get_current_snapshot`.
+    """
+    snapshot = await get_current_snapshot(region, config, fall_back)
+    if snapshot is None:
+        return None
+
+    return snapshot.data
+
+
+def encode_response_data(price_data: PriceSeries) -> bytes:
+    """Encode price data to the json response format.
+
+    This goes straight from the price series to the encoded body. If possible orjson is used, which encodes
+    equal to the json module for all prices except very small and very large ones.
+    """
+    marketprices = price_data.marketprices / 10 ** price_data.price_decimal_places
+    absolute_marketprices = np.abs(marketprices)
+    min_fast_float, max_fast_float = responses.FAST_JSON_FLOAT_RANGE
+    exact_fast_floats = not np.any(
+        ((absolute_marketprices < min_fast_float) & (absolute_marketprices != 0))
+        | (absolute_marketprices >= max_fast_float)
+    )
+    if not exact_fast_floats:
+        return responses.encode_json(parse_to_response_data(price_data))
+
+    columns = zip(price_data.start_timestamps.tolist(), price_data.end_timestamps.tolist(), marketprices.tolist())
+    response_data = {
+        "prices": [
+            {"start_timestamp": start_timestamp, "end_timestamp": end_timestamp, "marketprice": marketprice}
+            for start_timestamp, end_timestamp, marketprice in columns
+        ]
+    }
+    return responses.encode_json_fast(response_data)
+
+
+def prepare_response_data(
+    price_data: PriceSeries, compression_levels: Optional[dict[str, int]] = None
+) -> responses.PreparedResponse:
+    """Encode price data to a json response which can be sent many times.
+
+    :param compression_levels: Levels by content coding, defaults to those of the prepared response.
+    """
+    return responses.PreparedResponse(encode_response_data(price_data), compression_levels)
+
+
+def get_snapshot_response(snapshot: Snapshot) -> responses.PreparedResponse:
+    """Get the price data response of a snapshot which is encoded only once per snapshot."""
+    return snapshot.memoize("response", lambda: prepare_response_data(snapshot.data))
+
+
+async def prepare_snapshot_response(snapshot: Snapshot):
+    """Compress the price data response of a snapshot ahead of the first request which needs it.
+
+    Compressing runs in an executor, so that requests aren't blocked while it runs.
+    """
+    await responses.compress_prepared_response(get_snapshot_response(snapshot))
+
+
+def parse_to_response_data(price_data: PriceSeries) -> Box:
     """Parse app interal format to the response format."""
+    # Dividing the exact fixed point integers is correctly rounded, so this equals converting each price to float.
+    marketprices = price_data.marketprices / 10 ** price_data.price_decimal_places
+    columns = zip(price_data.start_timestamps.tolist(), price_data.end_timestamps.tolist(), marketprices.tolist())
+
     # Don't create copy to need to explicitly make data included in response opt-in.
     response_data = Box()
-    response_data.prices = []
-    for price_point in price_data.prices:
-        response_point = Box()
-        response_point.start_timestamp = price_point.start_timestamp.int_timestamp
-        response_point.end_timestamp = price_point.end_timestamp.int_timestamp
-        response_point.marketprice = float(price_point.marketprice.value)
-        response_data.prices.append(response_point)
+    response_data.prices = [
+        {"start_timestamp": start_timestamp, "end_timestamp": end_timestamp, "marketprice": marketprice}
+        for start_timestamp, end_timestamp, marketprice in columns
+    ]
 
     return response_data
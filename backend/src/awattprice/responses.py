@@ -0,0 +1,328 @@
+"""Encode responses once and send them many times."""
+import asyncio
+import gzip
+import hashlib
+import json
+
+from typing import Any
+from typing import Optional
+
+from fastapi import Request
+from starlette.responses import Response
+
+from awattprice import defaults
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Absolute values of floats within which `encode_json_fast` and `encode_json` encode floats the same.
+FAST_JSON_FLOAT_RANGE = (1e-4, 1e16)
+# Supported content codings by their name in Accept-Encoding headers. Ordered by preference.
+CONTENT_ENCODINGS = ["br", "gzip"] if brotli is not None else ["gzip"]
+# Suffixes of the entity tags of compressed bodies. Each content coding is a different representation.
+CONTENT_ENCODING_ETAG_SUFFIXES = {"br": "-br", "gzip": "-gz"}
+
+
+def compress(body: bytes, content_encoding: str, level: int) -> bytes:
+    """Compress a body with a content coding.
+
+    :param level: Brotli quality or gzip compression level.
+    """
+    if content_encoding == "br":
+        return brotli.compress(body, quality=level)
+    if content_encoding == "gzip":
+        # Without a modification time the compressed body is equal across all worker processes.
+        return gzip.compress(body, compresslevel=level, mtime=0)
+    raise ValueError(f"Unsupported content encoding: {content_encoding}.")
+
+
+class PreparedJSONResponse(Response):
+    """Json response which sends already encoded bodies as they are.
+
+    Other content is encoded like `encode_json` does.
+    """
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        return encode_json(content)
+
+
+class PreparedResponse:
+    """Json response body which was encoded ahead of time together with its entity tag.
+
+    Compressed variants of the body are made with `compress_all` ahead of time or on first use and then reused.
+    """
+
+    body: bytes
+    etag: str
+    compression_levels: dict[str, int]
+
+    def __init__(self, body: bytes, compression_levels: Optional[dict[str, int]] = None):
+        """Constructor for a new prepared response.
+
+        :param compression_levels: Levels by content coding. Defaults to the best levels as bodies are usually
+            compressed once and sent many times.
+        """
+        self.body = body
+        # Strong entity tag which only depends on the body. This keeps it equal across all worker processes.
+        body_hash = hashlib.sha256(body).hexdigest()[:32]
+        self.etag = f'"{body_hash}"'
+        if compression_levels is None:
+            compression_levels = defaults.RESPONSE_COMPRESSION_LEVELS
+        self.compression_levels = compression_levels
+        self._compressed_bodies = {}
+
+    @property
+    def compressed(self) -> bool:
+        """Check if all variants which are ever sent compressed were made already."""
+        if len(self.body) < defaults.RESPONSE_COMPRESSION_MIN_SIZE:
+            return True
+        return all(content_encoding in self._compressed_bodies for content_encoding in CONTENT_ENCODINGS)
+
+    def compress_all(self):
+        """Make all compressed variants of the body. Safe to run in an executor."""
+        if len(self.body) < defaults.RESPONSE_COMPRESSION_MIN_SIZE:
+            return
+        for content_encoding in CONTENT_ENCODINGS:
+            self.get_body(content_encoding)
+
+    def get_body(self, content_encoding: Optional[str]) -> bytes:
+        """Get the body of the variant with a content coding.
+
+        :param content_encoding: Name of the content coding. None for the uncompressed body.
+        """
+        if content_encoding is None:
+            return self.body
+
+        body = self._compressed_bodies.get(content_encoding)
+        if body is None:
+            body = compress(self.body, content_encoding, self.compression_levels[content_encoding])
+            self._compressed_bodies[content_encoding] = body
+        return body
+
+    def get_etag(self, content_encoding: Optional[str]) -> str:
+        """Get the entity tag of the variant with a content coding.
+
+        :param content_encoding: Name of the content coding. None for the uncompressed body.
+        """
+        if content_encoding is None:
+            return self.etag
+        return f'{self.etag[:-1]}{CONTENT_ENCODING_ETAG_SUFFIXES[content_encoding]}"'
+
+    def get_variant_etags(self) -> list[str]:
+        """Get the entity tags of all variants of this response."""
+        etags = [self.etag] + [self.get_etag(content_encoding) for content_encoding in CONTENT_ENCODINGS]
+        return etags
+
+
+def encode_json(content: Any) -> bytes:
+    """Encode content as json the same way as the default fastapi json response does."""
+    encoded_content = json.dumps(
+        content,
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":"),
+    ).encode("utf-8")
+    return encoded_content
+
+
+def encode_json_fast(content: Any) -> bytes:
+    """Encode content as json with orjson if it is installed.
+
+    The result only equals that of `encode_json` if all floats of the content lie within `FAST_JSON_FLOAT_RANGE`
+    or are zero, as the encoders print other floats in different exponent notations.
+    """
+    if orjson is None:
+        return encode_json(content)
+    return orjson.dumps(content)
+
+
+def prepare_json_response(content: Any) -> PreparedResponse:
+    """Encode content to a json response which can be sent many times."""
+    body = encode_json(content)
+    prepared_response = PreparedResponse(body)
+    return prepared_response
+
+
+def combine_json_responses(prepared_responses: dict[str, Optional[PreparedResponse]]) -> PreparedResponse:
+    """Combine prepared json responses to one json object response without encoding their bodies again.
+
+    :param prepared_responses: Responses by the key under which they are included. None is included as null.
+    """
+    members = []
+    for key, prepared_response in prepared_responses.items():
+        value = prepared_response.body if prepared_response is not None else b"null"
+        members.append(encode_json(key) + b":" + value)
+    body = b"{" + b",".join(members) + b"}"
+    combined_response = PreparedResponse(body)
+    return combined_response
+
+
+def check_etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Check if an If-None-Match header value matches the entity tag.
+
+    Uses the weak comparison as required for If-None-Match.
+    """
+    if if_none_match is None:
+        return False
+
+    if_none_match = if_none_match.strip()
+    if if_none_match == "*":
+        return True
+
+    opaque_etag = etag.removeprefix("W/")
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip().removeprefix("W/")
+        if candidate == opaque_etag:
+            return True
+
+    return False
+
+
+def select_content_encoding(accept_encoding: Optional[str], body_size: int) -> Optional[str]:
+    """Select the preferred supported content coding which the client accepts.
+
+    :param body_size: Size of the uncompressed body. Small bodies are never compressed.
+    :returns None: If the body should be sent uncompressed.
+    """
+    if accept_encoding is None or body_size < defaults.RESPONSE_COMPRESSION_MIN_SIZE:
+        return None
+
+    qualities = {}
+    for coding in accept_encoding.split(","):
+        name, _, parameters = coding.partition(";")
+        quality = 1.0
+        parameter_name, _, parameter_value = parameters.strip().partition("=")
+        if parameter_name.strip().lower() == "q":
+            try:
+                quality = float(parameter_value)
+            except ValueError:
+                quality = 0.0
+        qualities[name.strip().lower()] = quality
+
+    wildcard_quality = qualities.get("*", 0.0)
+    selected_content_encoding = None
+    selected_quality = 0.0
+    # The client's preference wins, ties are broken by the order of preference of the server.
+    for content_encoding in CONTENT_ENCODINGS:
+        quality = qualities.get(content_encoding, wildcard_quality)
+        if quality > selected_quality:
+            selected_content_encoding = content_encoding
+            selected_quality = quality
+
+    return selected_content_encoding
+
+
+def get_client_jitter(request: Request, max_jitter: int) -> int:
+    """Get a jitter in seconds which is always the same for the same client but differs between clients.
+
+    :param max_jitter: Exclusive maximum of the jitter.
+    """
+    if max_jitter <= 0:
+        return 0
+
+    forwarded_for = request.headers.get("x-forwarded-for")
+    if forwarded_for is not None:
+        client_address = forwarded_for.split(",")[0].strip()
+    elif request.client is not None:
+        client_address = request.client.host
+    else:
+        client_address = ""
+    user_agent = request.headers.get("user-agent", "")
+
+    client_hash = hashlib.sha256(f"{client_address} {user_agent}".encode()).digest()
+    jitter = int.from_bytes(client_hash[:8], "little") % max_jitter
+    return jitter
+
+
+def get_cache_control(max_age: int, stale_while_revalidate: int) -> str:
+    """Get a Cache-Control header value which lets clients and shared caches reuse a response."""
+    cache_control = f"public, max-age={max_age}, stale-while-revalidate={stale_while_revalidate}"
+    return cache_control
+
+
+def negotiate_prepared_response(
+    request: Request, prepared_response: PreparedResponse, cache_control: Optional[str] = None
+) -> tuple[Optional[Response], Optional[str], dict]:
+    """Select the variant of a prepared response to send and get its headers.
+
+    :param cache_control: Value of the Cache-Control header. If none no such header is sent.
+    :returns: A bodyless 304 response if the client already has the same body, otherwise None. Further the
+        selected content coding and the headers to send.
+    """
+    content_encoding = select_content_encoding(
+        request.headers.get("accept-encoding"), len(prepared_response.body)
+    )
+    headers = {"ETag": prepared_response.get_etag(content_encoding), "Vary": "Accept-Encoding"}
+    if cache_control is not None:
+        headers["Cache-Control"] = cache_control
+
+    if_none_match = request.headers.get("if-none-match")
+    # All variants have the same content, so a client with any of them doesn't need the body again.
+    variant_etags = prepared_response.get_variant_etags()
+    if any(check_etag_matches(if_none_match, variant_etag) for variant_etag in variant_etags):
+        return Response(status_code=304, headers=headers), content_encoding, headers
+
+    if content_encoding is not None:
+        headers["Content-Encoding"] = content_encoding
+    return None, content_encoding, headers
+
+
+def send_prepared_response(
+    request: Request, prepared_response: PreparedResponse, cache_control: Optional[str] = None
+) -> Response:
+    """Send a prepared response or a bodyless 304 response if the client already has the same body.
+
+    The body is compressed according to the Accept-Encoding header of the request.
+
+    :param cache_control: Value of the Cache-Control header. If none no such header is sent.
+    """
+    not_modified_response, content_encoding, headers = negotiate_prepared_response(
+        request, prepared_response, cache_control
+    )
+    if not_modified_response is not None:
+        return not_modified_response
+
+    body = prepared_response.get_body(content_encoding)
+    return PreparedJSONResponse(body, headers=headers)
+
+
+async def send_request_response(
+    request: Request, prepared_response: PreparedResponse, cache_control: Optional[str] = None
+) -> Response:
+    """Send a response which was prepared for this request only, like `send_prepared_response` does.
+
+    The body is compressed in an executor, so that compressing large bodies doesn't block the event loop.
+    """
+    not_modified_response, content_encoding, headers = negotiate_prepared_response(
+        request, prepared_response, cache_control
+    )
+    if not_modified_response is not None:
+        return not_modified_response
+
+    loop = asyncio.get_running_loop()
+    body = await loop.run_in_executor(None, prepared_response.get_body, content_encoding)
+    return PreparedJSONResponse(body, headers=headers)
+
+
+async def compress_prepared_response(prepared_response: PreparedResponse):
+    """Make all compressed variants of a prepared response in an executor unless they were made already.
+
+    Responses which are sent many times are compressed at the best levels, which is too slow to run on the event
+    loop.
+    """
+    if prepared_response.compressed:
+        return
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, prepared_response.compress_all)
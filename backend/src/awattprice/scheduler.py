@@ -0,0 +1,102 @@
+"""Keep the stored price data up to date in the background.
+
+Every web app process runs a scheduler, but only the process holding the poll leader lock polls prices. If the
+leader process exits the lock is released and another process takes over on its next attempt.
+"""
+import asyncio
+
+from typing import Optional
+
+from liteconfig import Config
+from loguru import logger
+
+from awattprice import defaults
+from awattprice import prices
+from awattprice.defaults import Region
+from awattprice.utils import AsyncFileLock
+
+
+def get_poll_leader_lock(config: Config) -> AsyncFileLock:
+    """Get file lock held by the process which polls price data in the background."""
+    lock_file_path = config.paths.price_data_dir / defaults.PRICE_DATA_POLL_LEADER_LOCK_FILE_NAME
+    lock = AsyncFileLock(lock_file_path)
+    return lock
+
+
+class PriceRefreshScheduler:
+    """Periodically refresh the price data of all regions if this process is the poll leader."""
+
+    config: Config
+    regions: list[Region]
+    is_leader: bool
+
+    def __init__(self, config: Config, regions: Optional[list[Region]] = None):
+        self.config = config
+        self.regions = list(Region) if regions is None else regions
+        self.is_leader = False
+        self._leader_lock = get_poll_leader_lock(config)
+        self._task = None
+
+    def start(self):
+        """Start the scheduler as a task on the running event loop."""
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the scheduler and give up the leadership."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        if self.is_leader:
+            self._leader_lock.release()
+            self.is_leader = False
+
+    def _try_become_leader(self) -> bool:
+        """Try to acquire the poll leader lock without waiting."""
+        if not self._leader_lock.try_acquire():
+            return False
+
+        logger.info("This process is now the price data poll leader.")
+        return True
+
+    async def _refresh_region(self, region: Region) -> bool:
+        """Refresh the prices of a region.
+
+        :returns: True if the stored data of the region is still due for an update afterwards.
+        """
+        try:
+            await prices.refresh_prices(region, self.config)
+        except Exception as exc:
+            logger.exception(f"Couldn't refresh {region.name} prices in the background: {exc}.")
+
+        try:
+            stored_data = await prices.get_stored_data(region, self.config)
+        except Exception as exc:
+            logger.exception(f"Couldn't get stored {region.name} data: {exc}.")
+            return True
+
+        return prices.check_update_data(stored_data, None)
+
+    async def _run(self):
+        """Poll the prices of all regions for as long as the scheduler runs."""
+        while True:
+            poll_interval = defaults.PRICE_DATA_POLL_INTERVAL
+            try:
+                if not self.is_leader:
+                    self.is_leader = self._try_become_leader()
+
+                if self.is_leader:
+                    regions_due = await asyncio.gather(*[self._refresh_region(region) for region in self.regions])
+                    if any(regions_due):
+                        poll_interval = defaults.PRICE_DATA_POLL_INTERVAL_DUE
+                else:
+                    # Trying to become the leader is cheap. Retry often to take over soon if the leader exits.
+                    poll_interval = defaults.PRICE_DATA_POLL_INTERVAL_DUE
+            except Exception as exc:
+                logger.exception(f"Background price data refresh failed: {exc}.")
+
+            await asyncio.sleep(poll_interval)
@@ -0,0 +1,271 @@
+"""Share price data between all processes of a host through shared memory.
+
+The process which stored new price data publishes the content of the price data file to a new content segment
+and then switches the segment of the region over to it. Content segments are never changed after they were
+published and are removed once they were replaced. All other processes map the segments read-only and decode
+the price data directly from the mapped content, so all processes of a host share a single copy of it and see
+new price data at the same moment without any file I/O. A mapping stays valid after its segment was removed, so
+price data which was decoded from replaced content can still be used.
+
+The segment of a region holds a sequence word and the length of the published content, which is stored in the
+content segment named after the sequence. The publisher makes the sequence odd before it changes the length and
+even again afterwards. Readers only accept a length if they saw the same even sequence before and after reading
+it. This way readers never see torn data. A published length of zero means that there is no published content
+and readers must use the price data file instead.
+"""
+import hashlib
+import mmap
+import os
+import struct
+
+from typing import Optional
+
+from liteconfig import Config
+from loguru import logger
+
+from awattprice import defaults
+from awattprice.defaults import Region
+
+try:
+    import _posixshmem
+except ImportError:
+    # Without POSIX shared memory price data is only shared through the price data files.
+    _posixshmem = None
+
+SEGMENT_HEADER = struct.Struct("<QQ")
+SEQUENCE = struct.Struct("<Q")
+# Number of times a reader retries reading the published content if the publisher changed it in the meantime.
+READ_ATTEMPTS = 3
+# Permissions of created segments. Only processes of the same user use them.
+SEGMENT_MODE = 0o600
+
+# Mapped region segments of this process by their name. Readers map them read-only, publishers read-write.
+_segments = {}
+_writable_segments = {}
+
+
+def _open_segment(name: str, writable: bool = False, create_size: Optional[int] = None) -> Optional[mmap.mmap]:
+    """Open a shared memory segment which outlives the process opening it and map all of it.
+
+    :param create_size: If set create the segment with this size if it doesn't exist yet or isn't sized yet.
+    :returns None: If the segment is empty, because its creator didn't size it yet.
+    :raises FileNotFoundError: If the segment doesn't exist and wasn't created.
+    """
+    flags = os.O_RDWR if writable else os.O_RDONLY
+    try:
+        fd = _posixshmem.shm_open(f"/{name}", flags, mode=SEGMENT_MODE)
+    except FileNotFoundError:
+        if create_size is None:
+            raise
+        try:
+            fd = _posixshmem.shm_open(f"/{name}", os.O_CREAT | os.O_EXCL | os.O_RDWR, mode=SEGMENT_MODE)
+        except FileExistsError:
+            # Another process created it in the meantime.
+            fd = _posixshmem.shm_open(f"/{name}", flags, mode=SEGMENT_MODE)
+
+    try:
+        size = os.fstat(fd).st_size
+        if create_size is not None and size < create_size:
+            os.ftruncate(fd, create_size)
+            size = create_size
+        if size == 0:
+            return None
+        access = mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ
+        mapping = mmap.mmap(fd, size, access=access)
+    finally:
+        os.close(fd)
+    return mapping
+
+
+def get_segment_name(region: Region, config: Config) -> str:
+    """Get the name of the segment of a region.
+
+    The name depends on the price data directory so that multiple backends on one host don't share segments.
+    """
+    price_data_dir = str(config.paths.price_data_dir.resolve()).encode()
+    namespace = hashlib.sha256(price_data_dir).hexdigest()[:8]
+    name = defaults.SHARED_PRICE_DATA_NAME.format(namespace, region.value.lower())
+    return name
+
+
+def get_content_segment_name(segment_name: str, sequence: int) -> str:
+    """Get the name of the segment holding the content published under a sequence."""
+    name = defaults.SHARED_PRICE_DATA_CONTENT_NAME.format(segment_name, sequence)
+    return name
+
+
+def _get_segment(region: Region, config: Config, writable: bool = False) -> Optional[mmap.mmap]:
+    """Get the mapped segment of a region.
+
+    :param writable: If set map the segment read-write and create it if it doesn't exist yet.
+    :returns None: If the segment doesn't exist or isn't sized yet and wasn't created.
+    """
+    name = get_segment_name(region, config)
+    segments = _writable_segments if writable else _segments
+    segment = segments.get(name)
+    if segment is not None:
+        return segment
+
+    create_size = SEGMENT_HEADER.size if writable else None
+    try:
+        segment = _open_segment(name, writable=writable, create_size=create_size)
+    except FileNotFoundError:
+        return None
+    if segment is None or len(segment) < SEGMENT_HEADER.size:
+        return None
+
+    segments[name] = segment
+    return segment
+
+
+def _create_content_segment(name: str, content: bytes):
+    """Create a content segment holding the content to publish."""
+    try:
+        fd = _posixshmem.shm_open(f"/{name}", os.O_CREAT | os.O_EXCL | os.O_RDWR, mode=SEGMENT_MODE)
+    except FileExistsError:
+        # Left over by a publisher which stopped before it switched to the segment, so no reader uses it.
+        _posixshmem.shm_unlink(f"/{name}")
+        fd = _posixshmem.shm_open(f"/{name}", os.O_CREAT | os.O_EXCL | os.O_RDWR, mode=SEGMENT_MODE)
+
+    try:
+        os.ftruncate(fd, len(content))
+        with mmap.mmap(fd, len(content)) as mapping:
+            mapping[:] = content
+    finally:
+        os.close(fd)
+
+
+def _remove_content_segment(segment_name: str, sequence: int, length: int):
+    """Remove the content segment of a replaced sequence. Readers which mapped it can still use it."""
+    if length == 0:
+        return
+    try:
+        _posixshmem.shm_unlink(f"/{get_content_segment_name(segment_name, sequence)}")
+    except FileNotFoundError:
+        pass
+
+
+def publish(region: Region, config: Config, content: bytes) -> Optional[int]:
+    """Publish the content of a price data file of a region.
+
+    Must only be called while holding the refresh lock of the region, as there must be one publisher at a time.
+
+    :returns: Sequence under which the content was published. None if the content couldn't be published.
+    """
+    if _posixshmem is None or len(content) == 0:
+        return None
+
+    name = get_segment_name(region, config)
+    try:
+        segment = _get_segment(region, config, writable=True)
+        previous_sequence, previous_length = SEGMENT_HEADER.unpack_from(segment)
+        # A publisher which stopped while the sequence was odd leaves it odd.
+        sequence = previous_sequence + previous_sequence % 2
+        _create_content_segment(get_content_segment_name(name, sequence + 2), content)
+    except OSError as exc:
+        logger.exception(f"Couldn't publish {region.name} price data to shared memory: {exc}.")
+        return None
+
+    SEQUENCE.pack_into(segment, 0, sequence + 1)
+    SEGMENT_HEADER.pack_into(segment, 0, sequence + 1, len(content))
+    SEQUENCE.pack_into(segment, 0, sequence + 2)
+    _remove_content_segment(name, previous_sequence, previous_length)
+
+    return sequence + 2
+
+
+def invalidate(region: Region, config: Config):
+    """Withdraw the published content of a region, so that readers use the price data file instead.
+
+    Must only be called while holding the refresh lock of the region, like `publish`.
+    """
+    if _posixshmem is None:
+        return
+
+    name = get_segment_name(region, config)
+    try:
+        segment = _get_segment(region, config, writable=True)
+    except OSError as exc:
+        logger.exception(f"Couldn't attach to shared memory of {region.name} price data: {exc}.")
+        return
+    if segment is None:
+        return
+
+    previous_sequence, previous_length = SEGMENT_HEADER.unpack_from(segment)
+    sequence = previous_sequence + previous_sequence % 2
+    # A new sequence with zero length, so that readers drop their snapshot of the withdrawn content.
+    SEQUENCE.pack_into(segment, 0, sequence + 1)
+    SEGMENT_HEADER.pack_into(segment, 0, sequence + 1, 0)
+    SEQUENCE.pack_into(segment, 0, sequence + 2)
+    _remove_content_segment(name, previous_sequence, previous_length)
+
+
+def read_sequence(region: Region, config: Config) -> Optional[int]:
+    """Get the sequence of the currently published content of a region without mapping the content.
+
+    :returns None: If there is no usable published content. Callers must read the price data file instead.
+    """
+    if _posixshmem is None:
+        return None
+
+    try:
+        segment = _get_segment(region, config)
+    except OSError as exc:
+        logger.exception(f"Couldn't attach to shared memory of {region.name} price data: {exc}.")
+        return None
+    if segment is None:
+        return None
+
+    sequence, length = SEGMENT_HEADER.unpack_from(segment)
+    if sequence == 0 or sequence % 2 == 1 or length == 0:
+        return None
+
+    return sequence
+
+
+def read(region: Region, config: Config) -> Optional[tuple[int, memoryview]]:
+    """Map the currently published content of a price data file of a region read-only.
+
+    The content is never changed, so it can be decoded without copying it. The mapping stays open as long as the
+    returned view or any view into it is referenced.
+
+    :returns: Tuple of the sequence and a read-only view of the published content.
+    :returns None: If there is no usable published content. Callers must read the price data file instead.
+    """
+    if _posixshmem is None:
+        return None
+
+    name = get_segment_name(region, config)
+    try:
+        segment = _get_segment(region, config)
+    except OSError as exc:
+        logger.exception(f"Couldn't attach to shared memory of {region.name} price data: {exc}.")
+        return None
+    if segment is None:
+        return None
+
+    for _ in range(READ_ATTEMPTS):
+        sequence, length = SEGMENT_HEADER.unpack_from(segment)
+        if sequence % 2 == 1:
+            # The publisher is just changing the content.
+            continue
+        if sequence == 0 or length == 0:
+            return None
+        (sequence_after,) = SEQUENCE.unpack_from(segment)
+        if sequence_after != sequence:
+            continue
+
+        try:
+            content = _open_segment(get_content_segment_name(name, sequence))
+        except FileNotFoundError:
+            # The content was replaced in the meantime.
+            continue
+        except OSError as exc:
+            logger.exception(f"Couldn't map shared memory of {region.name} price data: {exc}.")
+            return None
+        if content is None or len(content) < length:
+            logger.warning(f"Shared memory of {region.name} price data is shorter than its published length.")
+            return None
+        return sequence, memoryview(content)[:length]
+
+    return None
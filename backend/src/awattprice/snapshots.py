@@ -0,0 +1,90 @@
+"""Keep data decoded from files in memory for as long as the files don't change."""
+import os
+
+from pathlib import Path
+from typing import Any
+from typing import Callable
+from typing import Hashable
+from typing import Optional
+
+
+class Snapshot:
+    """Decoded data together with the version of the source it was decoded from."""
+
+    data: Any
+    version: str
+
+    def __init__(self, data: Any, version: str):
+        self.data = data
+        self.version = version
+        self._derived = {}
+
+    def memoize(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """Get a value derived from the data of this snapshot.
+
+        The value is computed on first use and afterwards reused for as long as this snapshot is in use.
+
+        :param compute: Called without arguments to compute the value if it isn't memoized yet.
+        """
+        try:
+            return self._derived[key]
+        except KeyError:
+            pass
+
+        value = compute()
+        self._derived[key] = value
+        return value
+
+
+def get_file_version(file_path: Path) -> Optional[str]:
+    """Get a version string which changes each time the file is replaced or modified.
+
+    This only stats the file and doesn't read its content.
+
+    :returns None: If the file doesn't exist.
+    """
+    try:
+        stat = os.stat(file_path)
+    except FileNotFoundError:
+        return None
+
+    version = f"{stat.st_ino:x}-{stat.st_mtime_ns:x}-{stat.st_size:x}"
+    return version
+
+
+class SnapshotCache:
+    """Per-process cache of snapshots.
+
+    A snapshot is only handed out if its version matches the version the caller currently expects. Data of
+    handed out snapshots is shared between all callers and thus must not be modified.
+    """
+
+    hits: int
+    misses: int
+
+    def __init__(self):
+        self._snapshots = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, version: str) -> Optional[Snapshot]:
+        """Get the snapshot stored for the key if it has the given version."""
+        snapshot = self._snapshots.get(key)
+        if snapshot is None or snapshot.version != version:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return snapshot
+
+    def put(self, key: Hashable, snapshot: Snapshot):
+        """Store a snapshot for the key replacing any older snapshot."""
+        self._snapshots[key] = snapshot
+
+    def invalidate(self, key: Hashable):
+        """Drop the snapshot stored for the key."""
+        self._snapshots.pop(key, None)
+
+    def statistics(self) -> dict:
+        """Get the hit and miss counters of this cache."""
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._snapshots)}
@@ -0,0 +1,90 @@
+"""Compute statistics of the price data of single days."""
+from typing import Optional
+
+import numpy as np
+
+from arrow import Arrow
+
+from awattprice import defaults
+from awattprice.price_series import PriceSeries
+
+
+def _get_extreme_point(price_data: PriceSeries, marketprices: np.ndarray, index: int) -> dict:
+    """Get a single price point in the response format with the marketprice from the given prices."""
+    point = {
+        "start_timestamp": int(price_data.start_timestamps[index]),
+        "end_timestamp": int(price_data.end_timestamps[index]),
+        "marketprice": float(marketprices[index]),
+    }
+    return point
+
+
+def get_price_statistics(price_data: PriceSeries) -> Optional[dict]:
+    """Get statistics of the untaxed and taxed marketprices of price data.
+
+    Both variants are computed together, each statistic with one vectorized operation over both of them.
+
+    :returns: Statistics in euro per MWh with the keys "untaxed" and "taxed". None if the price data is empty.
+    """
+    if len(price_data) == 0:
+        return None
+
+    scale = 10 ** price_data.price_decimal_places
+    # First row holds the untaxed, second row the taxed marketprices.
+    marketprices = np.stack([price_data.marketprices, price_data.taxed()]) / scale
+
+    minimums = marketprices.min(axis=1)
+    maximums = marketprices.max(axis=1)
+    means = marketprices.mean(axis=1)
+    medians = np.median(marketprices, axis=1)
+    percentiles = np.percentile(marketprices, defaults.PRICE_STATISTICS_PERCENTILES, axis=1)
+    cheapest_indices = marketprices.argmin(axis=1)
+    most_expensive_indices = marketprices.argmax(axis=1)
+
+    statistics = {}
+    for row, variant in enumerate(["untaxed", "taxed"]):
+        statistics[variant] = {
+            "min": float(minimums[row]),
+            "max": float(maximums[row]),
+            "mean": round(float(means[row]), price_data.price_decimal_places),
+            "median": round(float(medians[row]), price_data.price_decimal_places),
+            "percentiles": {
+                str(percentile): round(float(value), price_data.price_decimal_places)
+                for percentile, value in zip(defaults.PRICE_STATISTICS_PERCENTILES, percentiles[:, row])
+            },
+            "cheapest_hour": _get_extreme_point(price_data, marketprices[row], cheapest_indices[row]),
+            "most_expensive_hour": _get_extreme_point(price_data, marketprices[row], most_expensive_indices[row]),
+        }
+
+    return statistics
+
+
+def get_day_statistics(price_data: PriceSeries, day: Arrow) -> dict:
+    """Get the statistics of the price points within a Berlin day."""
+    day_start = day.to(defaults.EUROPE_BERLIN_TIMEZONE).floor("day")
+    day_prices = price_data.berlin_day(day_start)
+
+    day_statistics = {
+        "start_timestamp": day_start.int_timestamp,
+        "end_timestamp": day_start.shift(days=+1).int_timestamp,
+        "price_points": len(day_prices),
+    }
+    price_statistics = get_price_statistics(day_prices)
+    if price_statistics is not None:
+        day_statistics.update(price_statistics)
+    else:
+        day_statistics.update(untaxed=None, taxed=None)
+
+    return day_statistics
+
+
+def get_daily_statistics(price_data: PriceSeries, today: Arrow) -> dict:
+    """Get the statistics of today and tomorrow.
+
+    :param today: Any time of today.
+    """
+    daily_statistics = {
+        "today": get_day_statistics(price_data, today),
+        "tomorrow": get_day_statistics(price_data, today.shift(days=+1)),
+    }
+    return daily_statistics
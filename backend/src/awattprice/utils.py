@@ -1,36 +1,400 @@
 """Helper functions which don't fit into a bigger category."""
 import asyncio
+import fcntl
+import os
 
-from contextlib import contextmanager
+from collections import OrderedDict
 from decimal import Decimal
 from functools import partial
+from itertools import islice
+from pathlib import Path
+from typing import Any
+from typing import Awaitable
 from typing import Callable
+from typing import Hashable
+from typing import Iterable
+from typing import Optional
 from typing import Union
 
 import jsonschema
 
 from box import Box
 from fastapi import HTTPException
-from filelock import FileLock
 from loguru import logger
 from loguru._logger import Logger
 
 from awattprice import defaults
+from awattprice import validation
+from awattprice.exceptions import LockTimeout
 
 
-class ExtendedFileLock(FileLock):
-    @contextmanager
-    def context(self, acquire=True):
-        """Bettern context manager.
+class LockWaitStatistics:
+    """Collect how long acquiring locks had to wait."""
 
-        :param acquire: If true the lock will be acquired on context enter, else won't be acquired.
+    acquisitions: int
+    waited_acquisitions: int
+    timeouts: int
+    total_wait: float
+    max_wait: float
+
+    def __init__(self):
+        self.acquisitions = 0
+        self.waited_acquisitions = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def record(self, wait: float, acquired: bool):
+        """Record a single attempt to acquire a lock.
+
+        :param wait: Seconds the attempt waited.
+        :param acquired: If false the attempt timed out.
+        """
+        if acquired:
+            self.acquisitions += 1
+            if wait > 0:
+                self.waited_acquisitions += 1
+        else:
+            self.timeouts += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+
+    def statistics(self) -> dict:
+        """Get the collected lock wait counters and durations in seconds."""
+        attempts = self.acquisitions + self.timeouts
+        mean_wait = self.total_wait / attempts if attempts else 0.0
+        statistics = {
+            "acquisitions": self.acquisitions,
+            "waited_acquisitions": self.waited_acquisitions,
+            "timeouts": self.timeouts,
+            "mean_wait": mean_wait,
+            "max_wait": self.max_wait,
+        }
+        return statistics
+
+
+class AsyncFileLock:
+    """Exclusive advisory file lock which is acquired without blocking the event loop or executor threads.
+
+    The lock is a non-blocking fcntl.flock which is retried with increasing delays driven by the event loop.
+    As the lock is bound to an open file description it excludes other processes and other lock instances on
+    the same file in the same process alike.
+    """
+
+    lock_file: Path
+    statistics: Optional[LockWaitStatistics]
+
+    def __init__(self, lock_file: Path, statistics: Optional[LockWaitStatistics] = None):
+        """Constructor for a new lock instance.
+
+        :param statistics: If set lock wait durations of this instance are recorded to it.
+        """
+        self.lock_file = lock_file
+        self.statistics = statistics
+        self._fd = None
+
+    @property
+    def is_locked(self) -> bool:
+        """Check if this instance currently holds the lock."""
+        return self._fd is not None
+
+    def try_acquire(self) -> bool:
+        """Try to acquire the lock once without waiting.
+
+        :returns: True if the lock was acquired, false if it is held by someone else.
+        """
+        if self._fd is not None:
+            raise RuntimeError(f"Lock {self.lock_file} is already held by this instance.")
+
+        fd = os.open(self.lock_file, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        except BaseException:
+            os.close(fd)
+            raise
+
+        self._fd = fd
+        return True
+
+    async def acquire(self, timeout: Optional[float] = None) -> float:
+        """Acquire the lock, waiting for it to be released if necessary.
+
+        Cancelling the waiting task stops waiting without holding the lock.
+
+        :param timeout: Seconds after which to stop waiting. If none waits forever.
+        :returns: Seconds waited until the lock was acquired. Zero if it was acquired immediately.
+        :raises LockTimeout: If the lock couldn't be acquired within the timeout.
         """
-        if acquire:
-            self.acquire()
-        yield
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        waited = 0.0
+        delay = defaults.LOCK_RETRY_DELAY_MIN
+        while not self.try_acquire():
+            if timeout is not None and waited >= timeout:
+                if self.statistics is not None:
+                    self.statistics.record(waited, acquired=False)
+                raise LockTimeout(f"Couldn't acquire lock {self.lock_file} within {timeout}s.")
+
+            if timeout is not None:
+                delay = min(delay, timeout - waited)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, defaults.LOCK_RETRY_DELAY_MAX)
+            waited = loop.time() - start
+
+        if self.statistics is not None:
+            self.statistics.record(waited, acquired=True)
+        return waited
+
+    def release(self):
+        """Release the lock if this instance holds it."""
+        if self._fd is None:
+            return
+
+        fd = self._fd
+        self._fd = None
+        try:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+    async def __aenter__(self) -> "AsyncFileLock":
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *_):
         self.release()
 
 
+class SingleFlight:
+    """Coalesce concurrent calls with the same key into a single execution.
+
+    The first caller for a key starts the execution. All callers which arrive while it runs await the same
+    result. Cancelling a caller doesn't cancel the execution for the other callers.
+    """
+
+    calls: int
+    executions: int
+    waiters: int
+
+    def __init__(self):
+        self._flights = {}
+        self.calls = 0
+        self.executions = 0
+        self.waiters = 0
+
+    async def run(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        """Run the coroutine function or join its already running execution for the key."""
+        self.calls += 1
+
+        flight = self._flights.get(key)
+        if flight is None:
+            self.executions += 1
+            flight = asyncio.ensure_future(func())
+            self._flights[key] = flight
+            flight.add_done_callback(lambda _: self._flights.pop(key, None))
+            return await asyncio.shield(flight)
+
+        self.waiters += 1
+        try:
+            return await asyncio.shield(flight)
+        finally:
+            self.waiters -= 1
+
+    def statistics(self) -> dict:
+        """Get counters describing how many calls were coalesced."""
+        coalesced = self.calls - self.executions
+        coalescing_ratio = coalesced / self.calls if self.calls else 0.0
+        statistics = {
+            "calls": self.calls,
+            "executions": self.executions,
+            "coalesced": coalesced,
+            "coalescing_ratio": coalescing_ratio,
+            "waiters": self.waiters,
+            "in_flight": len(self._flights),
+        }
+        return statistics
+
+
+class LimitedCache:
+    """Cache which drops the least recently used values once it holds a maximal number of them."""
+
+    max_size: int
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._values = OrderedDict()
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """Get the value cached for the key.
+
+        :param compute: Called without arguments to compute the value if it isn't cached yet.
+        """
+        try:
+            self._values.move_to_end(key)
+            return self._values[key]
+        except KeyError:
+            pass
+
+        value = compute()
+        self._values[key] = value
+        if len(self._values) > self.max_size:
+            self._values.popitem(last=False)
+        return value
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+
+class WriteBehindQueue:
+    """Collect writes and flush them together in batches.
+
+    Writes with the same key are merged so that only the latest item of each key is flushed. Callers are resumed
+    only after the batch with their item was flushed, so a write which returned is as durable as a single write.
+    If a batch fails, its items are flushed one by one and only the callers of items which still fail get the
+    exception.
+    """
+
+    max_delay: float
+    max_batch_size: int
+
+    def __init__(self, flush: Callable[[list], Awaitable[Any]], max_delay: float, max_batch_size: int):
+        """Constructor for a new write behind queue.
+
+        :param flush: Called with the items of a batch to write them all at once, e.g. in a single transaction.
+        :param max_delay: Seconds to wait for more items after the first item of a batch was queued.
+        :param max_batch_size: Number of items after which a batch is flushed without further waiting.
+        """
+        self.flush = flush
+        self.max_delay = max_delay
+        self.max_batch_size = max_batch_size
+        self._pending = {}
+        # Created together with the flusher so that it belongs to the running event loop.
+        self._batch_full = None
+        self._flusher = None
+
+        self.writes = 0
+        self.merged_writes = 0
+        self.batches = 0
+        self.failed_batches = 0
+        self.failed_items = 0
+        self.flushed_items = 0
+        self.max_batch = 0
+        self.total_flush_duration = 0.0
+        self.max_flush_duration = 0.0
+        self.max_depth = 0
+
+    async def put(self, key: Hashable, item: Any):
+        """Queue an item and wait until it was flushed.
+
+        :raises Exception: Any exception raised when flushing the batch with the item.
+        """
+        self.writes += 1
+        future = asyncio.get_running_loop().create_future()
+        pending = self._pending.get(key)
+        if pending is not None:
+            self.merged_writes += 1
+            pending[1].append(future)
+            self._pending[key] = (item, pending[1])
+        else:
+            self._pending[key] = (item, [future])
+
+        self.max_depth = max(self.max_depth, len(self._pending))
+        if self._flusher is None:
+            self._batch_full = asyncio.Event()
+            self._flusher = asyncio.ensure_future(self._run_flusher())
+        if len(self._pending) >= self.max_batch_size:
+            self._batch_full.set()
+
+        # Cancelling a caller must not cancel the write for the callers merged with it.
+        await asyncio.shield(future)
+
+    async def _run_flusher(self):
+        """Flush batches until no items are left."""
+        try:
+            while self._pending:
+                try:
+                    await asyncio.wait_for(self._batch_full.wait(), self.max_delay)
+                except asyncio.TimeoutError:
+                    pass
+                self._batch_full.clear()
+
+                batch_keys = list(islice(self._pending, self.max_batch_size))
+                batch = {key: self._pending.pop(key) for key in batch_keys}
+                if len(self._pending) >= self.max_batch_size:
+                    self._batch_full.set()
+                await self._flush_batch(batch)
+        finally:
+            self._flusher = None
+
+    async def _flush_batch(self, batch: dict):
+        """Flush a batch and resume all callers waiting for it."""
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        try:
+            await self.flush([item for item, _ in batch.values()])
+        except Exception as exc:
+            self.failed_batches += 1
+            if len(batch) == 1:
+                self._resume(batch.values(), exc)
+            else:
+                # Find the items which make the batch fail, so that only their callers fail.
+                for item, futures in batch.values():
+                    try:
+                        await self.flush([item])
+                    except Exception as item_exc:
+                        self._resume([(item, futures)], item_exc)
+                    else:
+                        self._resume([(item, futures)])
+        else:
+            self._resume(batch.values())
+        finally:
+            flush_duration = loop.time() - start
+            self.batches += 1
+            self.flushed_items += len(batch)
+            self.max_batch = max(self.max_batch, len(batch))
+            self.total_flush_duration += flush_duration
+            self.max_flush_duration = max(self.max_flush_duration, flush_duration)
+
+    def _resume(self, pending: Iterable[tuple], exc: Optional[Exception] = None):
+        """Resume the callers of flushed items, raising an exception in them if their item failed."""
+        for _, futures in pending:
+            if exc is not None:
+                self.failed_items += 1
+            for future in futures:
+                if exc is None:
+                    future.set_result(None)
+                else:
+                    future.set_exception(exc)
+
+    async def close(self):
+        """Flush all queued items without waiting for further ones."""
+        if self._flusher is not None:
+            self._batch_full.set()
+            await asyncio.shield(self._flusher)
+
+    def statistics(self) -> dict:
+        """Get the batch sizes, flush durations in seconds and queue depth."""
+        mean_batch = self.flushed_items / self.batches if self.batches else 0.0
+        mean_flush_duration = self.total_flush_duration / self.batches if self.batches else 0.0
+        statistics = {
+            "writes": self.writes,
+            "merged_writes": self.merged_writes,
+            "batches": self.batches,
+            "failed_batches": self.failed_batches,
+            "failed_items": self.failed_items,
+            "mean_batch": mean_batch,
+            "max_batch": self.max_batch,
+            "mean_flush_duration": mean_flush_duration,
+            "max_flush_duration": self.max_flush_duration,
+            "depth": len(self._pending),
+            "max_depth": self.max_depth,
+        }
+        return statistics
+
+
 def async_wrap(func: Callable):
     """Wrap a synchronous running function to make it run asynchronous."""
 
@@ -44,12 +408,39 @@ def async_wrap(func: Callable):
     return run
 
 
+def sync_directory(dir_path: Path):
+    """Flush renames and removals of entries of a directory to disk."""
+    dir_fd = os.open(dir_path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+def write_file_atomically(file_path: Path, content: bytes):
+    """Write a file so that readers see either its complete old or its complete new content.
+
+    The content is written and synced to a temporary file first which then replaces the file.
+    """
+    temporary_path = file_path.with_name(f"{file_path.name}.{os.getpid()}.tmp")
+    try:
+        with open(temporary_path, "wb") as file:
+            file.write(content)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary_path, file_path)
+    except BaseException:
+        temporary_path.unlink(missing_ok=True)
+        raise
+    sync_directory(file_path.parent)
+
+
 def http_exc_validate_json_schema(body: Union[Box, dict, list], schema: dict, http_code: int):
     """Validate a json body against a schema and throw exception if body doesn't match.
     :raises HTTPException: with the parsed error code if the body doesn't match the schema.
     """
     try:
-        jsonschema.validate(body, schema)
+        validation.validate(body, schema)
     except jsonschema.ValidationError as exc:
         logger.warning(f"Body doesn't match correct schema: {exc}.")
         raise HTTPException(http_code) from exc
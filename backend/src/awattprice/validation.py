@@ -0,0 +1,158 @@
+"""Validate json against schemas which are compiled only once.
+
+Validating with `jsonschema.validate` checks the schema and creates a new validator on each call. Here each schema
+is checked and compiled once when it is first used, all schemas in `awattprice.defaults` already on import.
+
+The hottest payloads additionally have a fast check which accepts usual valid instances with a few type checks.
+Instances which the fast check doesn't accept are validated fully, so errors stay the same as with
+`jsonschema.validate`.
+"""
+import re
+
+from typing import Any
+from typing import Callable
+from typing import Optional
+
+import jsonschema
+
+from jsonschema.exceptions import best_match
+
+from awattprice import defaults
+
+# Checks if an instance is valid without running the validator. False doesn't mean that the instance is invalid.
+FastCheck = Callable[[Any], bool]
+
+
+class CompiledSchema:
+    """Schema together with its validator."""
+
+    schema: dict
+    validator: Any
+    fast_check: Optional[FastCheck]
+
+    def __init__(self, schema: dict, fast_check: Optional[FastCheck] = None):
+        """Check and compile a schema.
+
+        :param fast_check: Must only accept instances which are valid against the schema.
+        :raises jsonschema.SchemaError: If the schema itself isn't valid.
+        """
+        validator_class = jsonschema.validators.validator_for(schema)
+        validator_class.check_schema(schema)
+
+        self.schema = schema
+        self.validator = validator_class(schema)
+        self.fast_check = fast_check
+
+    def validate(self, instance: Any):
+        """Validate an instance against the schema.
+
+        :raises jsonschema.ValidationError: The same error `jsonschema.validate` raises if the instance isn't valid.
+        """
+        if self.fast_check is not None and self.fast_check(instance):
+            return
+
+        error = best_match(self.validator.iter_errors(instance))
+        if error is not None:
+            raise error
+
+
+def _is_number(value: Any) -> bool:
+    """Check if a value is a json number. Bools are ints in python, but not numbers in json."""
+    return type(value) in (int, float)
+
+
+def check_notification_configuration(configuration: Any) -> bool:
+    """Fast check for `NOTIFICATION_CONFIGURATION_SCHEMA`."""
+    if not isinstance(configuration, dict) or configuration.keys() != {"token", "general", "notifications"}:
+        return False
+
+    token = configuration["token"]
+    if type(token) is not str or len(token) < 1:
+        return False
+
+    general = configuration["general"]
+    if not isinstance(general, dict) or general.keys() != {"region", "tax"}:
+        return False
+    if type(general["region"]) is not str or general["region"] not in defaults.region_enum_names:
+        return False
+    if type(general["tax"]) is not bool:
+        return False
+
+    notifications = configuration["notifications"]
+    if not isinstance(notifications, dict) or notifications.keys() != {"price_below"}:
+        return False
+    price_below = notifications["price_below"]
+    if not isinstance(price_below, dict) or price_below.keys() != {"active", "below_value"}:
+        return False
+    below_value = price_below["below_value"]
+    if type(price_below["active"]) is not bool or not _is_number(below_value):
+        return False
+    return defaults.NOTIFICATION_BELOW_VALUE_MIN <= below_value <= defaults.NOTIFICATION_BELOW_VALUE_MAX
+
+
+AWATTAR_API_URL_PATTERN = re.compile(defaults.AWATTAR_API_PRICE_DATA_SCHEMA["properties"]["url"]["pattern"])
+
+
+def check_awattar_price_data(price_data: Any) -> bool:
+    """Fast check for `AWATTAR_API_PRICE_DATA_SCHEMA`."""
+    if not isinstance(price_data, dict) or "data" not in price_data or "url" not in price_data:
+        return False
+    if "object" in price_data and price_data["object"] != "list":
+        return False
+    url = price_data["url"]
+    if type(url) is not str or AWATTAR_API_URL_PATTERN.search(url) is None:
+        return False
+
+    data = price_data["data"]
+    if not isinstance(data, list):
+        return False
+    for price_point in data:
+        if not isinstance(price_point, dict):
+            return False
+        if type(price_point.get("start_timestamp")) is not int or type(price_point.get("end_timestamp")) is not int:
+            return False
+        if not _is_number(price_point.get("marketprice")) or price_point.get("unit") != "Eur/MWh":
+            return False
+
+    return True
+
+
+FAST_CHECKS = {
+    "AWATTAR_API_PRICE_DATA_SCHEMA": check_awattar_price_data,
+    "NOTIFICATION_CONFIGURATION_SCHEMA": check_notification_configuration,
+}
+
+
+def compile_default_schemas() -> dict[int, CompiledSchema]:
+    """Compile all schemas defined in the defaults.
+
+    :returns: Compiled schemas by the id of their schema dict.
+    """
+    compiled_schemas = {}
+    for name, value in vars(defaults).items():
+        if name.endswith("_SCHEMA"):
+            compiled_schemas[id(value)] = CompiledSchema(value, FAST_CHECKS.get(name))
+
+    return compiled_schemas
+
+
+compiled_schemas = compile_default_schemas()
+
+
+def get_compiled_schema(schema: dict) -> CompiledSchema:
+    """Get the compiled version of a schema. Schemas which weren't compiled yet are compiled and remembered."""
+    # Compiled schemas keep their schema alive, so its id isn't reused by another schema.
+    compiled_schema = compiled_schemas.get(id(schema))
+    if compiled_schema is None:
+        compiled_schema = CompiledSchema(schema)
+        compiled_schemas[id(schema)] = compiled_schema
+
+    return compiled_schema
+
+
+def validate(instance: Any, schema: dict):
+    """Validate an instance against a schema like `jsonschema.validate` does, but with the compiled schema.
+
+    :raises jsonschema.ValidationError: If the instance isn't valid.
+    """
+    get_compiled_schema(schema).validate(instance)
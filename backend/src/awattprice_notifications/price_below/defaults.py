@@ -6,6 +6,7 @@ import awattprice
 
 from arrow import Arrow
 from awattprice.defaults import Region
+from awattprice.price_series import PriceSeries
 from box import Box
 from loguru import logger
 
@@ -14,6 +15,13 @@ REGIONS_TO_SEND = [Region.DE, Region.AT]
 
 LAST_UPDATED_ENDTIME_FILE_NAME = "last-updated-{}-endtime.pickle"
 
+# File in the data dir holding the token index of the last run. Stored next to the database it was built from.
+TOKEN_INDEX_FILE_NAME = "price-below-token-index.npz"
+# Increase when the stored token index changes incompatibly. Stored indexes of other versions are rebuilt.
+TOKEN_INDEX_FORMAT_VERSION = 2
+# Number of tokens loaded per statement to stay below the sqlite limit of bound parameters.
+TOKEN_LOAD_CHUNK_SIZE = 500
+
 NOTIFICATION = Box(
     {
         "push_type": "alert",
@@ -29,21 +37,12 @@ NOTIFICATION = Box(
 )
 
 
-def get_notifiable_prices(price_data: Box) -> Optional[list[Box]]:
+def get_notifiable_prices(price_data: PriceSeries) -> Optional[PriceSeries]:
     """Get the prices about which users should be notified."""
-    selected_prices = []
-
     now_berlin = arrow.now(awattprice.defaults.EUROPE_BERLIN_TIMEZONE)
     # Note: Time range must not exceed 24 hours.
     berlin_tomorrow_start = now_berlin.floor("day").shift(days=+1)
-    berlin_tomorrow_end = berlin_tomorrow_start.shift(days=+1)
-
-    for price_point in price_data:
-        if (
-            price_point.start_timestamp >= berlin_tomorrow_start
-            and price_point.end_timestamp <= berlin_tomorrow_end
-        ):
-            selected_prices.append(price_point)
+    selected_prices = price_data.berlin_day(berlin_tomorrow_start)
 
     if not len(selected_prices) == 24:
         logger.debug(f"Length of selected prices isn't equal to 24: {len(selected_prices)}.")
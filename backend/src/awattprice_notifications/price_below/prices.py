@@ -11,6 +11,7 @@ import awattprice
 from aiofile import async_open
 from arrow import Arrow
 from awattprice.defaults import Region
+from awattprice.price_series import PriceSeries
 from box import Box
 from liteconfig import Config
 from loguru import logger
@@ -22,42 +23,51 @@ from awattprice_notifications.price_below.defaults import check_region_updated,
 class DetailedPriceData:
     """Describes price data in a detailed manner."""
 
-    data: Box
+    data: PriceSeries
 
     lowest_price: Optional[Box] = None
 
-    def __init__(self, data: Box):
+    def __init__(self, data: PriceSeries):
         self.data = data
 
     def find_lowest_price(self):
         """Find the lowest price."""
-        lowest_price = min(self.data.prices, key=lambda price_point: price_point.marketprice.value)
-        self.lowest_price = lowest_price
+        lowest_price_index = self.data.argmin()
+        self.lowest_price = self.data.point(lowest_price_index)
 
-    def get_prices_below_value(self, below_value: Decimal, taxed: bool) -> list[int]:
+    def get_prices_below_value(self, below_value: Decimal, taxed: bool) -> list[Box]:
         """Get prices which are on or below the given value.
 
         :param taxed: If true prices are taxed before comparing to the below value. This doesn't affect the
             below value.
         """
-        below_value_prices = []
-        for price_point in self.data.prices:
-            marketprice = price_point.marketprice.ct_kwh(taxed=taxed, round_=True)
-            if marketprice <= below_value:
-                below_value_prices.append(price_point)
-
+        below_value_mask = self.data.below_mask(below_value, taxed)
+        below_value_prices = self.data.points(below_value_mask)
         return below_value_prices
 
 
 class NotifiableDetailedPriceData(DetailedPriceData):
     """Holds price data about which users should be notified for."""
 
-    def __init__(self, notifiable_data: Box):
+    def __init__(self, notifiable_data: PriceSeries):
         self.data = notifiable_data
 
 
+async def refresh_region_prices(config: Config, region: Region):
+    """Refresh the stored prices of a region if they are due for an update.
+
+    The web app keeps the stored prices up to date as well. Refreshing here makes this service independent of it.
+    """
+    try:
+        await awattprice.prices.refresh_prices(region, config)
+    except Exception as exc:
+        logger.exception(f"Couldn't refresh {region.name} prices: {exc}.")
+
+
 async def collect_regions_prices(config: Config, regions: list[Region]) -> Box:
     """Get the current prices for multiple regions."""
+    await asyncio.gather(*[refresh_region_prices(config, region) for region in regions])
+
     prices_tasks = [awattprice.prices.get_current_prices(region, config, fall_back=False) for region in regions]
     regions_prices = await asyncio.gather(*prices_tasks)
     regions_prices = dict(zip(regions, regions_prices))
@@ -86,13 +96,12 @@ async def read_last_updated_endtime(config: Config, region: Region) -> Optional[
     return time
 
 
-def get_current_endtime(prices: Box) -> Arrow:
-    latest_price_point = max(prices.prices, key=lambda price_point: price_point.end_timestamp)
-    current_endtime = latest_price_point.end_timestamp
+def get_current_endtime(prices: PriceSeries) -> Arrow:
+    current_endtime = prices.latest_end_time()
     return current_endtime
 
 
-async def get_updated_regions(config: Config, regions_prices: Box[Region, Box]) -> list:
+async def get_updated_regions(config: Config, regions_prices: Box[Region, PriceSeries]) -> list:
     """Get the regions of which their prices updated relative to the last time they updated."""
     regions = regions_prices.keys()
     prices = regions_prices.values()
@@ -119,7 +128,7 @@ async def get_updated_regions(config: Config, regions_prices: Box[Region, Box])
 
 
 async def write_updated_regions_endtimes(
-    config: Config, regions_prices: Box[Region, Box], updated_regions: [Region]
+    config: Config, regions_prices: Box[Region, PriceSeries], updated_regions: [Region]
 ):
     """Write the endtimes for the regions which got updated.
 
@@ -144,13 +153,11 @@ def get_notifiable_regions_prices(regions_prices: Box) -> Box[Region, Notifiable
     """Get the prices for which users should be notified for."""
     notifiable_regions_prices = Box()
     for region, prices_data in regions_prices.items():
-        notifiable_prices_data = prices_data
-        notifiable_prices = get_notifiable_prices(prices_data.prices)
+        notifiable_prices = get_notifiable_prices(prices_data)
         if notifiable_prices is None:
             logger.debug(f"No notifiable prices for region {region}.")
             continue
-        notifiable_prices_data.prices = notifiable_prices
-        notifiable_detailed_prices = NotifiableDetailedPriceData(notifiable_prices_data)
+        notifiable_detailed_prices = NotifiableDetailedPriceData(notifiable_prices)
         notifiable_regions_prices[region] = notifiable_detailed_prices
 
     return notifiable_regions_prices
@@ -15,6 +15,7 @@ import awattprice_notifications
 from awattprice_notifications.price_below import defaults
 from awattprice_notifications.price_below import notifications
 from awattprice_notifications.price_below import prices
+from awattprice_notifications.price_below import token_index
 from awattprice_notifications.price_below import tokens
 
 
@@ -29,6 +30,8 @@ async def main():
     except FileNotFoundError as exc:
         logger.exception(exc)
         sys.exit(1)
+    async with engine.connect() as connection:
+        await connection.run_sync(database.log_pragmas, config.database_pragmas)
 
     regions_prices = await prices.collect_regions_prices(config, defaults.REGIONS_TO_SEND)
     if len(regions_prices) == 0:
@@ -49,7 +52,18 @@ async def main():
 
     updated_notifiable_regions_prices = {region: notifiable_regions_prices[region] for region in updated_regions}
 
-    applying_regions_tokens = await tokens.collect_applying_tokens(engine, updated_notifiable_regions_prices)
+    try:
+        index = await token_index.read_token_index(config)
+        index = await token_index.refresh_token_index(engine, index)
+    except Exception as exc:
+        logger.exception(f"Couldn't refresh the token index, querying the database instead: {exc}.")
+        applying_regions_tokens = await tokens.collect_applying_tokens(engine, updated_notifiable_regions_prices)
+    else:
+        if await token_index.write_token_index(config, index):
+            await token_index.prune_deletion_log(engine, index)
+        applying_regions_tokens = await token_index.collect_applying_tokens(
+            engine, index, updated_notifiable_regions_prices
+        )
 
     await notifications.deliver_notifications(
         engine, config, applying_regions_tokens, updated_notifiable_regions_prices
@@ -0,0 +1,320 @@
+"""Select the tokens which apply to get a price below notification from an in-memory index.
+
+Active price below notifications are kept per region and tax selection as an array of below values sorted in
+ascending order and an array of the ids of their tokens in the same order. All tokens of a region and tax
+selection whose below value is at or above a price are found with a single binary search.
+
+The index is built with one sequential scan of the database. Afterwards only the rows which changed since are
+read, found by the change sequence numbers which triggers set on each change. The index is stored between runs.
+"""
+import io
+
+from collections import defaultdict
+from decimal import Decimal
+from typing import Iterable
+from typing import Optional
+
+import numpy as np
+
+from aiofile import async_open
+from awattprice import utils
+from awattprice.defaults import Region
+from awattprice.orm import ChangeSequence
+from awattprice.orm import PriceBelowNotification
+from awattprice.orm import PriceBelowNotificationDeletion
+from awattprice.orm import Token
+from box import Box
+from liteconfig import Config
+from loguru import logger
+from sqlalchemy import and_
+from sqlalchemy import delete
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import contains_eager
+
+from awattprice_notifications.price_below import defaults
+from awattprice_notifications.price_below.prices import DetailedPriceData
+
+
+class TokenIndex:
+    """Active price below notifications sorted by their below value per region and tax selection."""
+
+    # Change sequence number up to which all changes are contained. Negative if nothing was read yet.
+    change_seq: int
+    below_values: dict[tuple[Region, bool], np.ndarray]
+    token_ids: dict[tuple[Region, bool], np.ndarray]
+
+    def __init__(self, change_seq: int = -1):
+        self.change_seq = change_seq
+        self.below_values = {}
+        self.token_ids = {}
+
+    def __len__(self) -> int:
+        return sum(len(token_ids) for token_ids in self.token_ids.values())
+
+    def insert(self, rows: Iterable[tuple]):
+        """Insert active price below notifications.
+
+        :param rows: Token id, below value, region and tax of each notification. The tokens must not be in the
+            index already.
+        """
+        grouped_rows = defaultdict(list)
+        for token_id, below_value, region, tax in rows:
+            grouped_rows[(region, tax)].append((below_value, token_id))
+
+        for key, key_rows in grouped_rows.items():
+            key_rows.sort()
+            new_below_values = np.array([row[0] for row in key_rows], dtype=np.float64)
+            new_token_ids = np.array([row[1] for row in key_rows], dtype=np.int64)
+
+            below_values = self.below_values.get(key)
+            if below_values is None:
+                self.below_values[key] = new_below_values
+                self.token_ids[key] = new_token_ids
+                continue
+            # Inserting sorted values at their sorted positions keeps the arrays sorted in one pass.
+            positions = np.searchsorted(below_values, new_below_values, side="right")
+            self.below_values[key] = np.insert(below_values, positions, new_below_values)
+            self.token_ids[key] = np.insert(self.token_ids[key], positions, new_token_ids)
+
+    def remove(self, token_ids: np.ndarray):
+        """Remove the notifications of tokens. Tokens which aren't in the index are ignored."""
+        if len(token_ids) == 0:
+            return
+        for key, key_token_ids in self.token_ids.items():
+            kept = ~np.isin(key_token_ids, token_ids)
+            if not kept.all():
+                self.below_values[key] = self.below_values[key][kept]
+                self.token_ids[key] = key_token_ids[kept]
+
+    def apply_changes(self, changed_rows: Iterable[tuple], deleted_token_ids: Iterable[int], change_seq: int):
+        """Apply changes read from the database.
+
+        Applying a change again has no effect, so changes may overlap with the ones applied before.
+
+        :param changed_rows: Token id, active state, below value, region and tax of each changed notification.
+        :param deleted_token_ids: Ids of tokens whose notifications were deleted.
+        :param change_seq: Change sequence number up to which all changes were read.
+        """
+        changed_rows = list(changed_rows)
+        removed_token_ids = [row[0] for row in changed_rows]
+        removed_token_ids.extend(deleted_token_ids)
+        self.remove(np.array(removed_token_ids, dtype=np.int64))
+        self.insert(
+            (token_id, below_value, region, tax)
+            for token_id, active, below_value, region, tax in changed_rows
+            if active and below_value is not None
+        )
+        self.change_seq = change_seq
+
+    def select(self, region: Region, tax: bool, price: Decimal) -> np.ndarray:
+        """Get the ids of the tokens whose below value is at or above a price."""
+        below_values = self.below_values.get((region, tax))
+        if below_values is None:
+            return np.empty(0, dtype=np.int64)
+        # Below values can have decimal places. The database compares them as floats against the price too.
+        start = np.searchsorted(below_values, float(price), side="left")
+        return self.token_ids[(region, tax)][start:]
+
+    def encode(self) -> bytes:
+        """Encode the index to store it."""
+        arrays = {
+            "format_version": np.array(defaults.TOKEN_INDEX_FORMAT_VERSION),
+            "change_seq": np.array(self.change_seq, dtype=np.int64),
+        }
+        for (region, tax), below_values in self.below_values.items():
+            arrays[f"{region.value}-{int(tax)}-below_values"] = below_values
+            arrays[f"{region.value}-{int(tax)}-token_ids"] = self.token_ids[(region, tax)]
+
+        content = io.BytesIO()
+        np.savez(content, **arrays)
+        return content.getvalue()
+
+    @classmethod
+    def decode(cls, content: bytes) -> "TokenIndex":
+        """Decode a stored index.
+
+        :raises ValueError: If the content isn't a stored index of the current format.
+        """
+        with np.load(io.BytesIO(content), allow_pickle=False) as arrays:
+            format_version = int(arrays["format_version"])
+            if format_version != defaults.TOKEN_INDEX_FORMAT_VERSION:
+                raise ValueError(f"Token index has format version {format_version}.")
+
+            token_index = cls(int(arrays["change_seq"]))
+            for name in arrays.files:
+                if not name.endswith("-below_values"):
+                    continue
+                region_value, tax, _ = name.split("-")
+                key = (Region(region_value), bool(int(tax)))
+                token_index.below_values[key] = arrays[name]
+                token_index.token_ids[key] = arrays[f"{region_value}-{tax}-token_ids"]
+
+        return token_index
+
+
+async def refresh_token_index(engine: AsyncEngine, token_index: Optional[TokenIndex]) -> TokenIndex:
+    """Bring the index up to date with the database.
+
+    :param token_index: Index of a previous run. If None, or if it is newer than the database, it is rebuilt.
+    :returns: Index which contains all changes of the database up to the time of the call.
+    """
+    notification_columns = [PriceBelowNotification.token_id, PriceBelowNotification.active]
+    notification_columns += [PriceBelowNotification.below_value, Token.region, Token.tax]
+
+    async with engine.connect() as connection:
+        # Read before the changes. Changes made while reading are read again next time, which has no effect.
+        change_seq = await connection.execute(select(ChangeSequence.seq))
+        change_seq = change_seq.scalar_one()
+
+        if token_index is not None and change_seq < token_index.change_seq:
+            logger.warning("Stored token index is newer than the database. Rebuilding it.")
+            token_index = None
+
+        if token_index is None:
+            scan_stmt = select(*notification_columns).join(Token.price_below)
+            notification_rows = await connection.execute(scan_stmt)
+            token_index = TokenIndex()
+            token_index.apply_changes(notification_rows.all(), [], change_seq)
+            logger.debug(f"Built token index with {len(token_index)} notifications.")
+        elif change_seq > token_index.change_seq:
+            changes_stmt = (
+                select(*notification_columns)
+                .join(Token.price_below)
+                .where(PriceBelowNotification.change_seq > token_index.change_seq)
+            )
+            changed_rows = await connection.execute(changes_stmt)
+            changed_rows = changed_rows.all()
+            deletions_stmt = select(PriceBelowNotificationDeletion.token_id).where(
+                PriceBelowNotificationDeletion.change_seq > token_index.change_seq
+            )
+            deleted_token_ids = await connection.execute(deletions_stmt)
+            deleted_token_ids = deleted_token_ids.scalars().all()
+
+            token_index.apply_changes(changed_rows, deleted_token_ids, change_seq)
+            logger.debug(
+                f"Refreshed token index with {len(changed_rows)} changed and {len(deleted_token_ids)} deleted "
+                "notifications."
+            )
+
+    return token_index
+
+
+async def read_token_index(config: Config) -> Optional[TokenIndex]:
+    """Read the index stored by a previous run.
+
+    :returns None: If no index is stored or if it couldn't be decoded.
+    """
+    file_path = config.paths.data_dir / defaults.TOKEN_INDEX_FILE_NAME
+    try:
+        async with async_open(file_path, "rb") as file:
+            content = await file.read()
+    except FileNotFoundError:
+        logger.debug("No token index was stored yet.")
+        return None
+
+    try:
+        token_index = TokenIndex.decode(content)
+    except Exception as exc:
+        logger.warning(f"Couldn't decode the stored token index: {exc}.")
+        return None
+
+    return token_index
+
+
+async def write_token_index(config: Config, token_index: TokenIndex) -> bool:
+    """Store the index for the next run. Errors are logged and not raised.
+
+    :returns: True if the index was stored, False otherwise.
+    """
+    file_path = config.paths.data_dir / defaults.TOKEN_INDEX_FILE_NAME
+    async_write_file_atomically = utils.async_wrap(utils.write_file_atomically)
+    try:
+        await async_write_file_atomically(file_path, token_index.encode())
+    except Exception as exc:
+        # The next run refreshes the previously stored index, or builds a new one, instead.
+        logger.exception(f"Couldn't write the token index: {exc}.")
+        return False
+
+    return True
+
+
+async def prune_deletion_log(engine: AsyncEngine, token_index: TokenIndex):
+    """Delete the logged deletions which the index already contains. Errors are logged and not raised.
+
+    The index of the service is the only reader of the log. Must only be called after the index was stored, as
+    the next run refreshes the stored index and needs all deletions which it doesn't contain yet.
+    """
+    prune_stmt = delete(PriceBelowNotificationDeletion).where(
+        PriceBelowNotificationDeletion.change_seq <= token_index.change_seq
+    )
+    try:
+        async with engine.begin() as connection:
+            pruned_rows = await connection.execute(prune_stmt)
+    except Exception as exc:
+        # The log only grows until the next run prunes it.
+        logger.exception(f"Couldn't prune the log of deleted price below notifications: {exc}.")
+        return
+
+    logger.debug(f"Pruned {pruned_rows.rowcount} logged deletions of price below notifications.")
+
+
+def get_applying_token_ids(
+    token_index: TokenIndex, regions_data: dict[Region, DetailedPriceData]
+) -> dict[Region, np.ndarray]:
+    """Get the ids of the tokens for the specified regions which apply to get a price below notification.
+
+    Like the database query, tokens which selected tax are checked against the taxed price only if the region
+    has a tax.
+    """
+    regions_token_ids = {}
+    for region, price_data in regions_data.items():
+        lowest_marketprice = price_data.lowest_price.marketprice
+        lowest_marketprice_untaxed = lowest_marketprice.ct_kwh(taxed=False, round_=True)
+        lowest_marketprice_taxed = lowest_marketprice_untaxed
+        if region.tax is not None:
+            lowest_marketprice_taxed = lowest_marketprice.ct_kwh(taxed=True, round_=True)
+
+        regions_token_ids[region] = np.concatenate(
+            [
+                token_index.select(region, False, lowest_marketprice_untaxed),
+                token_index.select(region, True, lowest_marketprice_taxed),
+            ]
+        )
+
+    return regions_token_ids
+
+
+async def collect_applying_tokens(
+    engine: AsyncEngine, token_index: TokenIndex, regions_data: dict[Region, DetailedPriceData]
+) -> Box[Region, list[Token]]:
+    """Collect the tokens for the specified regions which apply to get a price below notification.
+
+    Returns the same tokens as the function of the tokens module which queries the database, but only loads the
+    tokens which apply.
+
+    :returns: Dictionary with region as key and list of tokens as the value. Updated regions which
+        don't have any tokens associated aren't included in the returned dictionary.
+    """
+    regions_token_ids = get_applying_token_ids(token_index, regions_data)
+
+    region_tokens = Box()
+    async with AsyncSession(engine) as session:
+        for region, token_ids in regions_token_ids.items():
+            token_ids = token_ids.tolist()
+            tokens = []
+            for chunk_start in range(0, len(token_ids), defaults.TOKEN_LOAD_CHUNK_SIZE):
+                chunk_token_ids = token_ids[chunk_start : chunk_start + defaults.TOKEN_LOAD_CHUNK_SIZE]
+                tokens_stmt = (
+                    select(Token)
+                    .join(Token.price_below)
+                    .options(contains_eager(Token.price_below))
+                    .where(and_(Token.token_id.in_(chunk_token_ids), PriceBelowNotification.active == True))
+                )
+                chunk_tokens = await session.execute(tokens_stmt)
+                tokens.extend(chunk_tokens.scalars().all())
+            if tokens:
+                region_tokens[region] = tokens
+
+    return region_tokens
@@ -1,19 +1,19 @@
 """Perform operations on tokens and their configurations."""
 from collections import defaultdict
-
-import awattprice
+from decimal import Decimal
+from typing import Optional
 
 from awattprice.defaults import Region
 from awattprice.orm import PriceBelowNotification
 from awattprice.orm import Token
 from box import Box
-from loguru import logger
 from sqlalchemy import and_
 from sqlalchemy import or_
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncEngine
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import contains_eager
+from sqlalchemy.sql import Select
 from sqlalchemy.sql.elements import BooleanClauseList
 
 from awattprice_notifications.price_below.prices import DetailedPriceData
@@ -52,6 +52,46 @@ def get_below_value_checks(regions_data: dict[Region, DetailedPriceData]) -> lis
     return below_value_checks
 
 
+def get_minimal_below_value(regions_data: dict[Region, DetailedPriceData]) -> Decimal:
+    """Get the lowest below value which any user must have set at least to get a price below notification."""
+    lowest_marketprices = []
+    for region, price_data in regions_data.items():
+        lowest_marketprice = price_data.lowest_price.marketprice
+        lowest_marketprices.append(lowest_marketprice.ct_kwh(taxed=False, round_=True))
+        if region.tax is not None:
+            lowest_marketprices.append(lowest_marketprice.ct_kwh(taxed=True, round_=True))
+    return min(lowest_marketprices)
+
+
+def get_applying_tokens_stmt(regions_data: dict[Region, DetailedPriceData]) -> Optional[Select]:
+    """Get the statement selecting the tokens which apply to get a price below notification.
+
+    The price below rows of the tokens are selected too.
+
+    :returns None: If there are no regions to check.
+    """
+    below_value_checks = get_below_value_checks(regions_data)
+    if not below_value_checks:
+        return None
+
+    # Redundant to the checks, but lets the database seek the index on the active and below value columns
+    # instead of scanning all active notifications.
+    minimal_below_value = get_minimal_below_value(regions_data)
+    applying_tokens_stmt = (
+        select(Token)
+        .join(Token.price_below)
+        .options(contains_eager(Token.price_below))
+        .where(
+            and_(
+                PriceBelowNotification.active == True,
+                PriceBelowNotification.below_value >= minimal_below_value,
+                or_(*below_value_checks),
+            )
+        )
+    )
+    return applying_tokens_stmt
+
+
 async def collect_applying_tokens(
     engine: AsyncEngine, regions_data: dict[Region, DetailedPriceData]
 ) -> Box[Region, list[Token]]:
@@ -62,17 +102,10 @@ async def collect_applying_tokens(
     :returns: Dictionary with region as key and list of tokens as the value. Updated regions which
         don't have any tokens associated aren't included in the returned dictionary.
     """
-    below_value_checks = get_below_value_checks(regions_data)
-    if not below_value_checks:
+    applying_notifications_stmt = get_applying_tokens_stmt(regions_data)
+    if applying_notifications_stmt is None:
         return Box()
     async with AsyncSession(engine) as session:
-        applying_notifications_stmt = (
-            select(Token)
-            .join(Token.price_below)
-            .options(contains_eager(Token.price_below))
-            .where(and_(PriceBelowNotification.active == True, or_(*below_value_checks)))
-        )
-
         ungrouped_tokens = await session.execute(applying_notifications_stmt)
         ungrouped_tokens = ungrouped_tokens.scalars().all()
 
@@ -0,0 +1,44 @@
+"""Fixtures and helpers shared by the database tests."""
+from decimal import Decimal
+
+import pytest
+
+from box import Box
+
+from awattprice import database
+from awattprice import notifications
+from awattprice.defaults import Region
+from awattprice.price_series import MarketPrice
+
+
+@pytest.fixture
+def database_file(tmp_path):
+    database_file = tmp_path / "database.sqlite3"
+    database_file.touch()
+    return database_file
+
+
+@pytest.fixture
+def engine(database_file):
+    """Sync engine on a new database which isn't migrated yet."""
+    engine = database.get_engine(database_file)
+    yield engine
+    engine.dispose()
+
+
+def get_regions_data(lowest_prices: dict[Region, Decimal]) -> dict:
+    """Get price data of regions which only holds their lowest price in euro per MWh."""
+    regions_data = {
+        region: Box(lowest_price=Box(marketprice=MarketPrice(price, region)))
+        for region, price in lowest_prices.items()
+    }
+    return regions_data
+
+
+def save_configurations(engine, configurations: list[tuple]):
+    """Save notification configurations given as tuples of token, region, tax, active and below value."""
+    token_upsert, price_below_upsert = notifications.get_configuration_upserts(engine.dialect.name)
+    parameters = [notifications.get_configuration_parameters(*configuration) for configuration in configurations]
+    with engine.begin() as connection:
+        connection.execute(token_upsert, parameters)
+        connection.execute(price_below_upsert, parameters)
@@ -0,0 +1,41 @@
+"""Test that the cheapest window is only searched for energies whose costs can be computed."""
+from decimal import Decimal
+
+import numpy as np
+import pytest
+
+from awattprice import cheapest
+from awattprice import defaults
+from awattprice.defaults import Region
+from awattprice.price_series import PriceSeries
+
+HOUR = 60 * 60
+
+
+def get_price_data(marketprices: list[int]) -> PriceSeries:
+    """Get hourly price data with prices in millionths of euro per MWh."""
+    start_timestamps = np.arange(len(marketprices), dtype=np.int64) * HOUR
+    return PriceSeries(
+        start_timestamps, start_timestamps + HOUR, np.array(marketprices, dtype=np.int64), 6, Region.DE
+    )
+
+
+@pytest.mark.parametrize("energy", [float("inf"), float("-inf"), float("nan"), 1e25, 0, -1])
+def test_reject_energy(energy):
+    assert not cheapest.check_energy(energy)
+
+
+@pytest.mark.parametrize("energy", [0.001, 1, defaults.CHEAPEST_WINDOW_MAX_ENERGY])
+def test_accept_energy(energy):
+    assert cheapest.check_energy(energy)
+
+
+def test_cost_of_maximal_energy():
+    minute_prices = cheapest.get_minute_prices(get_price_data([10**12, 2 * 10**12]))
+    energy = Decimal(defaults.CHEAPEST_WINDOW_MAX_ENERGY)
+
+    window = cheapest.find_cheapest_window(minute_prices, 60, energy, 0, 2 * HOUR)
+
+    assert window["start_timestamp"] == 0
+    # One million euro per MWh for one million kWh.
+    assert window["cost"]["untaxed"] == 1e9
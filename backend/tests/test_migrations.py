@@ -0,0 +1,121 @@
+"""Test the database migrations and that the price below targeting query uses the indexes they create."""
+import sqlite3
+
+from decimal import Decimal
+
+import pytest
+
+from sqlalchemy.orm import Session
+
+from awattprice import migrations
+from awattprice.defaults import Region
+from awattprice_notifications.price_below import tokens
+from conftest import get_regions_data
+from conftest import save_configurations
+
+TARGETING_INDEX = "ix_price_below_notification_active_below_value"
+
+
+def explain_query_plan(engine, stmt) -> list[str]:
+    """Get the details of each step of the query plan of a statement."""
+    compiled_stmt = stmt.compile(dialect=engine.dialect, compile_kwargs={"literal_binds": True})
+    with engine.connect() as connection:
+        plan_rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled_stmt}").all()
+    return [plan_row[-1] for plan_row in plan_rows]
+
+
+def test_migrate_new_database(engine):
+    with engine.connect() as connection:
+        assert migrations.migrate_database(connection) == migrations.LATEST_VERSION
+        assert migrations.get_schema_version(connection) == migrations.LATEST_VERSION
+        index_names = connection.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = 'index'").scalars()
+        assert TARGETING_INDEX in index_names.all()
+
+
+def test_migrate_twice(engine):
+    with engine.connect() as connection:
+        migrations.migrate_database(connection)
+        assert migrations.migrate_database(connection) == migrations.LATEST_VERSION
+
+
+def test_migrate_step_by_step(engine):
+    with engine.connect() as connection:
+        for version in range(1, migrations.LATEST_VERSION + 1):
+            assert migrations.migrate_database(connection, target_version=version) == version
+
+
+def test_migrate_database_created_without_migrations(engine, database_file):
+    # Databases of older versions were created with all tables, but without a schema version.
+    with sqlite3.connect(database_file) as connection:
+        for statement in migrations.MIGRATIONS[0].statements:
+            connection.execute(statement)
+        assert connection.execute("PRAGMA user_version").fetchone() == (0,)
+    save_configurations(engine, [("token", Region.DE, False, True, 5)])
+
+    with engine.connect() as connection:
+        assert migrations.migrate_database(connection) == migrations.LATEST_VERSION
+        assert connection.exec_driver_sql("SELECT token FROM token").scalars().all() == ["token"]
+
+
+def test_migrate_while_reading(engine, database_file):
+    with engine.connect() as connection:
+        migrations.migrate_database(connection, target_version=1)
+    save_configurations(engine, [("token", Region.DE, False, True, 5)])
+
+    reader = sqlite3.connect(database_file, isolation_level=None)
+    try:
+        reader.execute("BEGIN")
+        assert reader.execute("SELECT COUNT(*) FROM token").fetchone() == (1,)
+
+        with engine.connect() as connection:
+            assert migrations.migrate_database(connection) == migrations.LATEST_VERSION
+
+        # The open read transaction still sees the schema from before the migration.
+        assert reader.execute("PRAGMA user_version").fetchone() == (1,)
+        reader.execute("COMMIT")
+        assert reader.execute("PRAGMA user_version").fetchone() == (migrations.LATEST_VERSION,)
+    finally:
+        reader.close()
+
+
+@pytest.mark.parametrize(
+    "lowest_prices",
+    [
+        {Region.DE: Decimal("100")},
+        {Region.AT: Decimal("-20")},
+        {Region.DE: Decimal("100"), Region.AT: Decimal("80")},
+    ],
+)
+def test_targeting_query_uses_index(engine, lowest_prices):
+    with engine.connect() as connection:
+        migrations.migrate_database(connection)
+
+    stmt = tokens.get_applying_tokens_stmt(get_regions_data(lowest_prices))
+    query_plan = explain_query_plan(engine, stmt)
+
+    index_search = f"USING COVERING INDEX {TARGETING_INDEX} (active=? AND below_value>?)"
+    assert any(index_search in step for step in query_plan)
+    assert not any(step.startswith("SCAN") for step in query_plan)
+
+
+def test_targeting_query_selects_applying_tokens(engine):
+    with engine.connect() as connection:
+        migrations.migrate_database(connection)
+    save_configurations(
+        engine,
+        [
+            ("de-untaxed-applying", Region.DE, False, True, 10),
+            ("de-untaxed-too-low", Region.DE, False, True, 9),
+            ("de-taxed-applying", Region.DE, True, True, 12),
+            ("de-taxed-too-low", Region.DE, True, True, 11),
+            ("de-inactive", Region.DE, False, False, 30),
+            ("at-applying", Region.AT, False, True, 10),
+        ],
+    )
+
+    # 100 euro per MWh are 10 ct per kWh untaxed and 11.9 ct per kWh taxed in Germany.
+    stmt = tokens.get_applying_tokens_stmt(get_regions_data({Region.DE: Decimal("100")}))
+    with Session(engine) as session:
+        applying_tokens = session.execute(stmt).scalars().all()
+
+    assert sorted(token.token for token in applying_tokens) == ["de-taxed-applying", "de-untaxed-applying"]
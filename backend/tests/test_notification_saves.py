@@ -0,0 +1,58 @@
+"""Test that invalid notification configurations fail only their own saves."""
+import asyncio
+
+import pytest
+
+from box import Box
+
+from awattprice import notifications
+from awattprice.utils import WriteBehindQueue
+
+
+def test_failing_item_fails_only_its_write():
+    flushed_items = []
+
+    async def flush(items):
+        if any(item is None for item in items):
+            raise ValueError("Can't flush None.")
+        flushed_items.extend(items)
+
+    async def run():
+        queue = WriteBehindQueue(flush, max_delay=0.01, max_batch_size=10)
+        writes = [queue.put("a", 1), queue.put("b", None), queue.put("c", 3)]
+        return await asyncio.gather(*writes, return_exceptions=True)
+
+    results = asyncio.run(run())
+
+    assert results[0] is None and results[2] is None
+    assert isinstance(results[1], ValueError)
+    assert flushed_items == [1, 3]
+
+
+def test_merged_writes_share_the_result():
+    async def flush(items):
+        raise ValueError("Can't flush.")
+
+    async def run():
+        queue = WriteBehindQueue(flush, max_delay=0.01, max_batch_size=10)
+        results = await asyncio.gather(queue.put("a", 1), queue.put("a", 2), return_exceptions=True)
+        return results, queue.statistics()
+
+    results, statistics = asyncio.run(run())
+
+    assert all(isinstance(result, ValueError) for result in results)
+    assert statistics["failed_items"] == 1
+    assert statistics["merged_writes"] == 1
+
+
+@pytest.mark.parametrize("below_value", [10**30, -(10**30), 1e300])
+def test_reject_below_value_out_of_range(below_value):
+    configuration = Box(
+        {
+            "token": "token",
+            "general": {"region": "DE", "tax": False},
+            "notifications": {"price_below": {"active": True, "below_value": below_value}},
+        }
+    )
+    assert notifications.parse_notification_configuration_body(configuration) is None
+    assert notifications.parse_notification_configurations_body([configuration.to_dict()]) == [None]
@@ -0,0 +1,50 @@
+"""Test that published price data is shared read-only and stays valid for readers after it was replaced."""
+import _posixshmem
+
+import pytest
+
+from box import Box
+
+from awattprice import shared_price_data
+from awattprice.defaults import Region
+
+
+@pytest.fixture
+def config(tmp_path):
+    config = Box(paths=Box(price_data_dir=tmp_path))
+    yield config
+    shared_price_data.invalidate(Region.DE, config)
+    _posixshmem.shm_unlink(f"/{shared_price_data.get_segment_name(Region.DE, config)}")
+
+
+def test_read_published_content(config):
+    sequence = shared_price_data.publish(Region.DE, config, b"first content")
+
+    published_sequence, content = shared_price_data.read(Region.DE, config)
+
+    assert published_sequence == sequence == shared_price_data.read_sequence(Region.DE, config)
+    assert content == b"first content"
+    assert content.readonly
+
+
+def test_read_content_stays_valid_after_replacing_it(config):
+    first_sequence = shared_price_data.publish(Region.DE, config, b"first content")
+    _, first_content = shared_price_data.read(Region.DE, config)
+
+    second_sequence = shared_price_data.publish(Region.DE, config, b"second")
+
+    assert second_sequence > first_sequence
+    assert shared_price_data.read(Region.DE, config) == (second_sequence, b"second")
+    assert first_content == b"first content"
+    segment_name = shared_price_data.get_segment_name(Region.DE, config)
+    with pytest.raises(FileNotFoundError):
+        _posixshmem.shm_unlink(f"/{shared_price_data.get_content_segment_name(segment_name, first_sequence)}")
+
+
+def test_read_invalidated_content(config):
+    shared_price_data.publish(Region.DE, config, b"first content")
+
+    shared_price_data.invalidate(Region.DE, config)
+
+    assert shared_price_data.read(Region.DE, config) is None
+    assert shared_price_data.read_sequence(Region.DE, config) is None
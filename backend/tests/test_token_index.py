@@ -0,0 +1,222 @@
+"""Test that the token index selects the same tokens as the targeting query and stays up to date with changes."""
+import asyncio
+import random
+
+from decimal import Decimal
+
+import pytest
+
+from sqlalchemy.orm import Session
+
+from awattprice import database
+from awattprice import migrations
+from awattprice.defaults import Region
+from awattprice_notifications.price_below import tokens
+from awattprice_notifications.price_below.token_index import TokenIndex
+from awattprice_notifications.price_below.token_index import collect_applying_tokens
+from awattprice_notifications.price_below.token_index import get_applying_token_ids
+from awattprice_notifications.price_below.token_index import prune_deletion_log
+from awattprice_notifications.price_below.token_index import refresh_token_index
+from conftest import get_regions_data
+from conftest import save_configurations
+
+LOWEST_PRICES = {Region.DE: Decimal("100"), Region.AT: Decimal("80")}
+
+
+@pytest.fixture(autouse=True)
+def migrate(engine):
+    with engine.connect() as connection:
+        migrations.migrate_database(connection)
+
+
+def refresh(database_file, token_index=None) -> TokenIndex:
+    """Refresh an index with an async engine on the database."""
+
+    async def run():
+        async_engine = database.get_engine(database_file, async_=True)
+        try:
+            return await refresh_token_index(async_engine, token_index)
+        finally:
+            await async_engine.dispose()
+
+    return asyncio.run(run())
+
+
+def select_tokens(engine, token_index: TokenIndex) -> dict[Region, list[str]]:
+    """Select the applying tokens with the index, get them sorted per region."""
+    regions_token_ids = get_applying_token_ids(token_index, get_regions_data(LOWEST_PRICES))
+    with engine.connect() as connection:
+        token_names = dict(connection.exec_driver_sql("SELECT token_id, token FROM token").all())
+    return {
+        region: sorted(token_names[token_id] for token_id in token_ids.tolist())
+        for region, token_ids in regions_token_ids.items()
+        if len(token_ids) > 0
+    }
+
+
+def query_tokens(engine) -> dict[Region, list[str]]:
+    """Select the applying tokens with the targeting query, get them sorted per region."""
+    stmt = tokens.get_applying_tokens_stmt(get_regions_data(LOWEST_PRICES))
+    with Session(engine) as session:
+        applying_tokens = session.execute(stmt).scalars().all()
+    region_tokens = {}
+    for token in applying_tokens:
+        region_tokens.setdefault(token.region, []).append(token.token)
+    return {region: sorted(region_token_names) for region, region_token_names in region_tokens.items()}
+
+
+def get_random_configurations(count: int) -> list[tuple]:
+    """Get configurations of numbered tokens with random values."""
+    configurations = []
+    for number in range(count):
+        region = random.choice([Region.DE, Region.AT])
+        below_value = random.choice([None, *range(-5, 20), 9.5, 10.25, 11.9, 12.5])
+        tax = random.random() < 0.5
+        active = random.random() < 0.8
+        configurations.append((f"token-{number}", region, tax, active, below_value))
+    return configurations
+
+
+def test_select_applying_tokens(engine, database_file):
+    # 100 euro per MWh are 10 ct per kWh untaxed and 11.9 ct per kWh taxed in Germany.
+    save_configurations(
+        engine,
+        [
+            ("de-untaxed-applying", Region.DE, False, True, 10),
+            ("de-untaxed-too-low", Region.DE, False, True, 9),
+            ("de-taxed-applying", Region.DE, True, True, 12),
+            ("de-taxed-too-low", Region.DE, True, True, 11),
+            ("de-inactive", Region.DE, False, False, 30),
+            ("de-without-value", Region.DE, False, True, None),
+        ],
+    )
+
+    token_index = refresh(database_file)
+
+    assert select_tokens(engine, token_index) == {Region.DE: ["de-taxed-applying", "de-untaxed-applying"]}
+
+
+def test_select_fractional_below_values(engine, database_file):
+    save_configurations(
+        engine,
+        [
+            ("de-above", Region.DE, False, True, 10.5),
+            ("de-equal", Region.DE, False, True, 9.5),
+            ("de-below", Region.DE, False, True, 9.49),
+        ],
+    )
+
+    token_index = refresh(database_file)
+
+    # 95 euro per MWh are 9.5 ct per kWh untaxed.
+    regions_token_ids = get_applying_token_ids(token_index, get_regions_data({Region.DE: Decimal("95")}))
+    assert sorted(regions_token_ids[Region.DE].tolist()) == [1, 2]
+    assert select_tokens(engine, token_index) == query_tokens(engine)
+
+
+def test_select_same_tokens_as_query(engine, database_file):
+    random.seed(0)
+    save_configurations(engine, get_random_configurations(2000))
+
+    token_index = refresh(database_file)
+
+    assert select_tokens(engine, token_index) == query_tokens(engine)
+
+
+def test_refresh_with_changes(engine, database_file):
+    random.seed(1)
+    configurations = get_random_configurations(500)
+    save_configurations(engine, configurations)
+    token_index = refresh(database_file)
+
+    # Change region, tax, state and below value of some tokens, add new ones and delete others.
+    changed_configurations = get_random_configurations(600)[::3]
+    save_configurations(engine, changed_configurations)
+    with engine.begin() as connection:
+        connection.exec_driver_sql("DELETE FROM price_below_notification WHERE token_id % 7 = 0")
+        connection.exec_driver_sql("DELETE FROM token WHERE token_id % 11 = 0")
+    token_index = refresh(database_file, token_index)
+
+    assert select_tokens(engine, token_index) == query_tokens(engine)
+    assert select_tokens(engine, token_index) == select_tokens(engine, refresh(database_file))
+
+
+def test_refresh_without_changes(engine, database_file):
+    save_configurations(engine, [("token", Region.DE, False, True, 10)])
+    token_index = refresh(database_file)
+    change_seq = token_index.change_seq
+
+    # Saving the same configuration again doesn't change it.
+    save_configurations(engine, [("token", Region.DE, False, True, 10)])
+
+    assert refresh(database_file, token_index).change_seq == change_seq
+
+
+def test_rebuild_index_newer_than_database(engine, database_file):
+    save_configurations(engine, [("token", Region.DE, False, True, 10)])
+    token_index = refresh(database_file)
+    token_index.change_seq += 100
+    token_index.remove([1])
+
+    token_index = refresh(database_file, token_index)
+
+    assert select_tokens(engine, token_index) == {Region.DE: ["token"]}
+
+
+def test_prune_deletion_log(engine, database_file):
+    save_configurations(engine, [(f"token-{number}", Region.DE, False, True, 10) for number in range(4)])
+    with engine.begin() as connection:
+        connection.exec_driver_sql("DELETE FROM token WHERE token = 'token-0'")
+    token_index = refresh(database_file)
+
+    async def prune():
+        async_engine = database.get_engine(database_file, async_=True)
+        try:
+            await prune_deletion_log(async_engine, token_index)
+        finally:
+            await async_engine.dispose()
+
+    asyncio.run(prune())
+    with engine.begin() as connection:
+        connection.exec_driver_sql("DELETE FROM token WHERE token = 'token-1'")
+    token_index = refresh(database_file, token_index)
+
+    with engine.connect() as connection:
+        logged_deletions = connection.exec_driver_sql("SELECT change_seq FROM price_below_notification_deletion")
+        logged_deletions = logged_deletions.scalars().all()
+    # Only the deletion after the pruned index was built is still logged, and the index still contains both.
+    assert len(logged_deletions) == 1
+    assert select_tokens(engine, token_index) == {Region.DE: ["token-2", "token-3"]}
+
+
+def test_encode_decode(engine, database_file):
+    random.seed(2)
+    save_configurations(engine, get_random_configurations(300))
+    token_index = refresh(database_file)
+
+    decoded_token_index = TokenIndex.decode(token_index.encode())
+
+    assert decoded_token_index.change_seq == token_index.change_seq
+    assert select_tokens(engine, decoded_token_index) == select_tokens(engine, token_index)
+
+
+def test_collect_applying_tokens(engine, database_file):
+    save_configurations(
+        engine,
+        [("de-applying", Region.DE, True, True, 12), ("at-applying", Region.AT, False, True, 10)],
+    )
+    token_index = refresh(database_file)
+
+    async def run():
+        async_engine = database.get_engine(database_file, async_=True)
+        try:
+            return await collect_applying_tokens(async_engine, token_index, get_regions_data(LOWEST_PRICES))
+        finally:
+            await async_engine.dispose()
+
+    region_tokens = asyncio.run(run())
+
+    assert [token.token for token in region_tokens[Region.DE]] == ["de-applying"]
+    assert region_tokens[Region.DE][0].price_below.below_value == 12
+    # 80 euro per MWh are 8 ct per kWh untaxed in Austria.
+    assert [token.token for token in region_tokens[Region.AT]] == ["at-applying"]